@@ -1,11 +1,18 @@
 import abc
-import copy
+import hashlib
+import json
 import math
-from typing import List
+import secrets
+import sys
+import threading
+from collections import OrderedDict, deque
 
+import numpy as np
 from PySide6.QtWidgets import QLabel, QInputDialog, QColorDialog
 from PySide6.QtGui import QPainter, QPen, QColor, QFont, QFontMetrics, QMouseEvent, QImage, QPixmap, QPainterPath
-from PySide6.QtCore import QRect, QPoint, Qt
+from PySide6.QtCore import QRect, QPoint, Qt, QTimer
+
+from image_pyramid import ImagePyramid
 
 
 DEFAULT_COLOR = QColor(255, 0, 0, 255).name(QColor.NameFormat.HexArgb)
@@ -13,9 +20,18 @@ DEFAULT_TEXT_COLOR = QColor(255, 255, 0, 255).name(QColor.NameFormat.HexArgb)
 DEFAULT_FONT_NAME = "Microsoft YaHei"
 DEFAULT_FONT_SIZE = 0.04
 DEFAULT_THICKNESS = 0.005
+HIGHLIGHT_COLOR = QColor(255, 255, 255, 255).name(QColor.NameFormat.HexArgb)
 
+# level of detail of the live view; export always paints full detail
+LOD_MIN_TEXT_SIZE = 6  # pixels, smaller labels are not drawn
+LOD_MIN_SHAPE_SIZE = 3  # pixels, smaller rectangles and circles are drawn as points
+LOD_MAX_LABELS = 1000  # with more visible annotations no labels are drawn
+CULL_MARGIN = 0.25  # of the view size, for labels reaching out of their shape
+SMOOTH_RENDER_DELAY = 150  # ms without zooming or panning before the view is rendered smoothly
+DEFAULT_HISTORY_BYTES = 64 * 1024 * 1024  # undo history of all frames together
 
-def to_color(color):
+
+def parse_color(color):
     if isinstance(color, str):
         return QColor.fromString(color)
     elif isinstance(color, list):
@@ -26,61 +42,320 @@ def to_color(color):
         return QColor(color)
 
 
-class AnnotationList(object):
+class PaintCache(object):
+    """Fonts, font metrics, text bounds and parsed colors reused across paints.
+
+    Qt font objects must not be shared between threads, so every thread painting
+    annotations (the view and export jobs) gets its own cache through paint_cache().
+    """
+
+    MAX_ENTRIES = 4096
+
     def __init__(self) -> None:
-        self.annotations = []
+        self.fonts = {}
+        self.metrics = {}
+        self.text_rects = {}
+        self.colors = {}
 
-    def __len__(self):
-        return len(self.annotations)
+    @staticmethod
+    def put(cache, key, value):
+        if len(cache) >= PaintCache.MAX_ENTRIES:
+            cache.clear()
+        cache[key] = value
+        return value
+
+    def font(self, font_name, pixel_size) -> QFont:
+        key = (font_name, pixel_size)
+        font = self.fonts.get(key)
+        if font is None:
+            font = QFont(font_name)
+            font.setPixelSize(pixel_size)
+            font = self.put(self.fonts, key, font)
+        return font
+
+    def font_metrics(self, font_name, pixel_size) -> QFontMetrics:
+        key = (font_name, pixel_size)
+        metrics = self.metrics.get(key)
+        if metrics is None:
+            metrics = self.put(self.metrics, key, QFontMetrics(self.font(font_name, pixel_size)))
+        return metrics
+
+    def text_rect(self, font_name, pixel_size, text) -> QRect:
+        key = (font_name, pixel_size, text)
+        rect = self.text_rects.get(key)
+        if rect is None:
+            rect = self.put(self.text_rects, key, self.font_metrics(font_name, pixel_size).boundingRect(text))
+        return rect
+
+    def color(self, color) -> QColor:
+        key = tuple(color) if isinstance(color, list) else color
+        try:
+            cached = self.colors.get(key)
+        except TypeError:
+            return parse_color(color)
+        if cached is None:
+            cached = self.put(self.colors, key, parse_color(color))
+        # callers may modify the color, e.g. its alpha
+        return QColor(cached)
+
+
+paint_caches = threading.local()
+
+
+def paint_cache() -> PaintCache:
+    cache = getattr(paint_caches, "cache", None)
+    if cache is None:
+        cache = paint_caches.cache = PaintCache()
+    return cache
+
+
+def to_color(color):
+    return paint_cache().color(color)
+
+
+class Annotation(dict):
+    """An annotation as an immutable dict.
+
+    It serializes and reads like the JSON it came from, but is never changed in place, so
+    the list, the undo history and the painter can share it without copying. Use replace()
+    and without() to derive changed annotations.
+    """
+
+    __slots__ = ()
+
+    def readonly(self, *args, **kwargs):
+        raise TypeError("Annotation is immutable, use replace()")
+
+    __setitem__ = __delitem__ = __ior__ = clear = pop = popitem = setdefault = update = readonly
+
+    def replace(self, **changes) -> "Annotation":
+        annotation = dict(self)
+        annotation.update(changes)
+        return Annotation(annotation)
+
+    def without(self, *keys) -> "Annotation":
+        return Annotation({key: value for key, value in self.items() if key not in keys})
 
-    def __getitem__(self, index):
-        if index is None or index < 0 or index >= len(self.annotations):
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return Annotation, (dict(self),)
+
+    @staticmethod
+    def of(annotation) -> "Annotation":
+        return annotation if isinstance(annotation, Annotation) else Annotation(annotation)
+
+
+class SpatialGrid(object):
+    """Uniform grid over normalized image coordinates for finding annotations near a position.
+
+    Points are indexed by their position and rectangles and text by their bounds. Circles,
+    whose hit area depends on the view aspect ratio, and boxes spanning many cells are kept
+    in a list returned by every query.
+    """
+
+    SIZE = 64  # cells per axis
+    MAX_CELLS = 64  # larger boxes go to the list returned by every query
+
+    def __init__(self) -> None:
+        self.cells = {}
+        self.unbounded = []
+
+    @staticmethod
+    def cell_range(low, high):
+        size = SpatialGrid.SIZE
+        return range(min(max(int(low * size), 0), size - 1), min(max(int(high * size), 0), size - 1) + 1)
+
+    def cells_of(self, annotation):
+        if annotation["type"] == "point":
+            x1 = x2 = annotation["x2"]
+            y1 = y2 = annotation["y2"]
+        elif annotation["type"] in ["rectangle", "text"]:
+            x1, x2 = sorted([annotation["x"], annotation["x2"]])
+            y1, y2 = sorted([annotation["y"], annotation["y2"]])
+        else:
             return None
-        return self.annotations[index]
+        columns = self.cell_range(x1, x2)
+        rows = self.cell_range(y1, y2)
+        if len(columns) * len(rows) > self.MAX_CELLS:
+            return None
+        return [(column, row) for column in columns for row in rows]
 
-    def __setitem__(self, index, annotation):
-        if index is None or index < 0 or index >= len(self.annotations):
+    def insert(self, annotation):
+        cells = self.cells_of(annotation)
+        if cells is None:
+            self.unbounded.append(annotation)
             return
-        self.annotations[index] = annotation
+        for cell in cells:
+            self.cells.setdefault(cell, []).append(annotation)
 
-    def add(self, annotation, index=None):
-        if index is None:
-            self.annotations.append(annotation)
-        else:
-            self.annotations.insert(index, annotation)
+    def remove(self, annotation):
+        cells = self.cells_of(annotation)
+        if cells is None:
+            remove_identical(self.unbounded, annotation)
+            return
+        for cell in cells:
+            remove_identical(self.cells[cell], annotation)
+            if len(self.cells[cell]) == 0:
+                del self.cells[cell]
+
+    def query(self, x, y, radius_x, radius_y):
+        """Annotations that may contain (x, y), or lie within the radius of it."""
+        found = {id(annotation): annotation for annotation in self.unbounded}
+        for column in self.cell_range(x - radius_x, x + radius_x):
+            for row in self.cell_range(y - radius_y, y + radius_y):
+                for annotation in self.cells.get((column, row), []):
+                    found[id(annotation)] = annotation
+        return found.values()
+
+
+def remove_identical(items, item):
+    for i, other in enumerate(items):
+        if other is item:
+            del items[i]
+            return
 
-    def batch_add(self, annotations, index=None):
-        if index is None:
-            self.annotations.extend(annotations)
-        else:
-            self.annotations = (
-                self.annotations[:index] + annotations + self.annotations[index:]
-            )
 
-    def remove(self, index):
-        if index is None:
-            deleted = self.annotations.pop()
-        else:
-            deleted = self.annotations.pop(index)
-        return deleted
+def new_annotation_id():
+    return secrets.token_hex(8)
+
+
+def with_ids(annotations):
+    """The annotations with an "id" added where missing, and whether any was added."""
+    added = False
+    result = []
+    for annotation in annotations:
+        if annotation.get("id") is None:
+            annotation = dict(annotation, id=new_annotation_id())
+            added = True
+        result.append(annotation)
+    return result, added
+
+
+class AnnotationList(object):
+    """The annotations of a frame, addressed by their stable "id".
+
+    Annotations are kept in slots in drawing order; a deleted annotation leaves an empty
+    slot, so undoing the deletion puts it back at the same position, and lookups, updates
+    and deletes by id take constant time. Annotations added without an id, or with one
+    already in the list, get a new id. Every change is reported to on_change as an
+    AnnotationStore journal operation.
+    """
+
+    def __init__(self) -> None:
+        self.on_change = None
+        self.slots = []
+        self.slot_of = {}
+        # incremented on every change, so views can tell whether their renders are stale
+        self.version = 0
+        self.grid = SpatialGrid()
+        self.ordered = []
+        self.ordered_version = 0
+
+    @property
+    def annotations(self):
+        """The annotations in drawing order."""
+        if self.ordered_version != self.version:
+            self.ordered = [annotation for annotation in self.slots if annotation is not None]
+            self.ordered_version = self.version
+        return self.ordered
+
+    def candidates(self, x, y, radius_x, radius_y):
+        """Ids, in drawing order, of the annotations that may be hit at normalized (x, y)."""
+        found = [(self.slot_of[annotation["id"]], annotation["id"]) for annotation in self.grid.query(x, y, radius_x, radius_y)]
+        return [annotation_id for _, annotation_id in sorted(found)]
 
-    def batch_remove(self, count, index=None):
-        if index is None:
-            deleted = self.annotations[-count:]
-            self.annotations = self.annotations[:-count]
+    def __len__(self):
+        return len(self.slot_of)
+
+    def __contains__(self, annotation_id):
+        return annotation_id in self.slot_of
+
+    def __getitem__(self, annotation_id):
+        slot = self.slot_of.get(annotation_id)
+        return None if slot is None else self.slots[slot]
+
+    def __setitem__(self, annotation_id, annotation):
+        slot = self.slot_of.get(annotation_id)
+        if slot is None:
+            return
+        old = self.slots[slot]
+        self.grid.remove(old)
+        self.slots[slot] = annotation = Annotation.of(annotation).replace(id=annotation_id)
+        self.grid.insert(annotation)
+        self.version += 1
+        if self.on_change is not None:
+            self.on_change({
+                "op": "modify",
+                "id": annotation_id,
+                "set": {key: value for key, value in annotation.items() if key not in old or old[key] != value},
+                "unset": [key for key in old if key not in annotation],
+            })
+
+    def add(self, annotation, slot=None):
+        """Add an annotation at the end, or back into its empty slot; returns its id."""
+        self.version += 1
+        annotation = Annotation.of(annotation)
+        if annotation.get("id") is None or annotation["id"] in self.slot_of:
+            annotation = annotation.replace(id=new_annotation_id())
+        if slot is None or slot >= len(self.slots) or self.slots[slot] is not None:
+            slot = len(self.slots)
+            self.slots.append(annotation)
         else:
-            deleted = self.annotations[index : index + count]
-            self.annotations = (
-                self.annotations[:index] + self.annotations[index + count :]
-            )
-        return deleted
+            self.slots[slot] = annotation
+        self.slot_of[annotation["id"]] = slot
+        self.grid.insert(annotation)
+        if self.on_change is not None:
+            after = None
+            for previous in range(slot - 1, -1, -1):
+                if self.slots[previous] is not None:
+                    after = self.slots[previous]["id"]
+                    break
+            self.on_change({"op": "add", "annotation": annotation, "after": after})
+        return annotation["id"]
+
+    def batch_add(self, annotations):
+        return [self.add(annotation) for annotation in annotations]
+
+    def remove(self, annotation_id):
+        """Delete an annotation; returns its slot and the annotation, for add to restore it."""
+        self.version += 1
+        slot = self.slot_of.pop(annotation_id)
+        deleted = self.slots[slot]
+        self.slots[slot] = None
+        self.grid.remove(deleted)
+        if self.on_change is not None:
+            self.on_change({"op": "delete", "id": annotation_id})
+        return slot, deleted
+
+    def batch_remove(self, annotation_ids):
+        return [self.remove(annotation_id) for annotation_id in annotation_ids]
+
+    def restore(self, removed):
+        """Put back annotations removed with their slots, as returned by remove, batch_remove or remove_all."""
+        for slot, annotation in removed:
+            self.add(annotation, slot)
 
     def remove_all(self):
-        deleted = copy.deepcopy(self.annotations)
-        self.annotations.clear()
+        self.version += 1
+        deleted = [(slot, annotation) for slot, annotation in enumerate(self.slots) if annotation is not None]
+        self.slots = []
+        self.slot_of = {}
+        self.grid = SpatialGrid()
+        if self.on_change is not None:
+            self.on_change({"op": "clear"})
         return deleted
 
 
+def annotation_size(annotation):
+    """Rough number of bytes an annotation holds, for the undo history budget."""
+    return sys.getsizeof(annotation) + sum(sys.getsizeof(value) for value in annotation.values())
+
+
 class Command(metaclass=abc.ABCMeta):
     @abc.abstractmethod
     def execute(self):
@@ -90,98 +365,245 @@ class Command(metaclass=abc.ABCMeta):
     def undo(self):
         pass
 
+    def size(self):
+        """Rough number of bytes the command keeps for undo and redo once executed."""
+        return sys.getsizeof(self)
+
 
 class AddAnnotationCommand(Command):
-    def __init__(self, annotation_list: AnnotationList, annotation, index=None):
+    def __init__(self, annotation_list: AnnotationList, annotation):
         self.annotation_list = annotation_list
         self.annotation = annotation
-        self.index = index
+        self.slot = None
 
     def execute(self):
-        self.annotation_list.add(self.annotation, self.index)
+        annotation_id = self.annotation_list.add(self.annotation, self.slot)
+        # redo adds the annotation again with the same id and position
+        self.annotation = self.annotation_list[annotation_id]
+        self.slot = self.annotation_list.slot_of[annotation_id]
 
     def undo(self):
-        self.annotation_list.remove(self.index)
+        self.annotation_list.remove(self.annotation["id"])
+
+    def size(self):
+        return super().size() + annotation_size(self.annotation)
+
+
+MISSING = object()
 
 
 class ModifyAnnotationCommand(Command):
-    def __init__(self, annotation_list: AnnotationList, annotation, index):
+    """Replace the annotation with annotation_id, keeping only the fields that changed for undo and redo."""
+
+    def __init__(self, annotation_list: AnnotationList, annotation, annotation_id):
         self.annotation_list = annotation_list
         self.annotation = annotation
-        self.index = index
-        self.old_annotation = None
+        self.annotation_id = annotation_id
+        self.changes = None  # key -> (old value, new value), MISSING for absent keys
 
     def execute(self):
-        self.old_annotation = self.annotation_list[self.index]
-        self.annotation_list[self.index] = self.annotation
+        if self.changes is None:
+            old = self.annotation_list[self.annotation_id]
+            self.changes = {}
+            for key in list(old) + [key for key in self.annotation if key not in old]:
+                values = (old.get(key, MISSING), self.annotation.get(key, MISSING))
+                if values[0] != values[1] and key != "id":
+                    self.changes[key] = values
+            self.annotation = None
+        self.apply(1)
 
     def undo(self):
-        self.annotation_list[self.index] = self.old_annotation
+        self.apply(0)
+
+    def apply(self, side):
+        annotation = dict(self.annotation_list[self.annotation_id])
+        for key, values in self.changes.items():
+            if values[side] is MISSING:
+                annotation.pop(key, None)
+            else:
+                annotation[key] = values[side]
+        self.annotation_list[self.annotation_id] = annotation
+
+    def size(self):
+        return super().size() + sys.getsizeof(self.changes) + sum(
+            sys.getsizeof(old) + sys.getsizeof(new) for old, new in self.changes.values()
+        )
 
 
 class DeleteAnnotationCommand(Command):
-    def __init__(self, annotation_list: AnnotationList, index=None):
+    def __init__(self, annotation_list: AnnotationList, annotation_id):
         self.annotation_list = annotation_list
-        self.index = index
-        self.annotation = None
+        self.annotation_id = annotation_id
+        self.removed = None
 
     def execute(self):
-        self.annotation = self.annotation_list.remove(self.index)
+        self.removed = self.annotation_list.remove(self.annotation_id)
 
     def undo(self):
-        self.annotation_list.add(self.annotation, self.index)
+        self.annotation_list.restore([self.removed])
+
+    def size(self):
+        return super().size() + annotation_size(self.removed[1])
 
 
 class DeleteAllAnnotationCommand(Command):
     def __init__(self, annotation_list: AnnotationList):
         self.annotation_list = annotation_list
-        self.annotations = None
+        self.removed = None
 
     def execute(self):
-        self.annotations = self.annotation_list.remove_all()
+        self.removed = self.annotation_list.remove_all()
 
     def undo(self):
-        self.annotation_list.batch_add(self.annotations)
+        self.annotation_list.restore(self.removed)
+
+    def size(self):
+        return super().size() + sum(annotation_size(annotation) for _, annotation in self.removed)
 
 
 class BatchAddAnnotationCommand(Command):
-    def __init__(self, annotation_list: AnnotationList, annotations=None, index=None):
+    def __init__(self, annotation_list: AnnotationList, annotations=None):
         self.annotation_list = annotation_list
         self.annotations = annotations
-        self.index = index
+        self.annotation_ids = None
+        self.removed = None
 
     def execute(self):
-        self.annotation_list.batch_add(self.annotations, self.index)
+        if self.removed is None:
+            self.annotation_ids = self.annotation_list.batch_add(self.annotations)
+            self.annotations = None
+        else:
+            # redo puts the annotations back with the same ids and positions
+            self.annotation_list.restore(self.removed)
 
     def undo(self):
-        self.annotation_list.batch_remove(self.index, len(self.annotations))
+        self.removed = self.annotation_list.batch_remove(self.annotation_ids)
+
+    def size(self):
+        return super().size() + sum(annotation_size(self.annotation_list[annotation_id]) for annotation_id in self.annotation_ids)
 
 
 class BatchDeleteAnnotationCommand(Command):
-    def __init__(self, annotation_list: AnnotationList, count: int, index: int = None):
+    def __init__(self, annotation_list: AnnotationList, annotation_ids):
         self.annotation_list = annotation_list
-        self.index = index
-        self.count = count
-        self.annotations = None
+        self.annotation_ids = annotation_ids
+        self.removed = None
 
     def execute(self):
-        self.annotations = self.annotation_list.batch_remove(self.count, self.index)
+        self.removed = self.annotation_list.batch_remove(self.annotation_ids)
 
     def undo(self):
-        self.annotation_list.batch_add(self.annotations, self.index)
+        self.annotation_list.restore(self.removed)
+
+    def size(self):
+        return super().size() + sum(annotation_size(annotation) for _, annotation in self.removed)
+
+
+class FrameHistory(object):
+    def __init__(self) -> None:
+        # (command, size) pairs; sizes are taken when a command is first executed
+        self.done = deque()
+        self.undone = []
+        self.digest = None  # of the annotations when the frame was left
+
+
+class UndoHistory(object):
+    """Undo and redo stacks of every frame, kept across navigation within max_bytes.
+
+    A frame's history is resumed when it is shown again with the annotations it was left
+    with; if they changed meanwhile, e.g. through a background job, it is dropped. Once all
+    commands together hold more than max_bytes, the least recently shown frames lose their
+    oldest commands first. The newest command is always kept.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_HISTORY_BYTES) -> None:
+        self.max_bytes = max_bytes
+        self.frames = OrderedDict()
+        self.key = None
+        self.frame = FrameHistory()
+        self.size = 0
+
+    @staticmethod
+    def digest(annotations):
+        return hashlib.sha1(json.dumps(annotations).encode()).digest()
+
+    def switch(self, key, old_annotations, annotations):
+        """Leave the frame showing old_annotations for the frame key, showing annotations; key None has no history kept."""
+        if self.key is not None and (len(self.frame.done) > 0 or len(self.frame.undone) > 0):
+            self.frame.digest = self.digest(old_annotations)
+        else:
+            self.drop(self.key)
+        self.key = key
+        self.frame = self.frames.get(key) if key is not None else None
+        if self.frame is not None and self.frame.digest != self.digest(annotations):
+            self.drop(key)
+            self.frame = None
+        if self.frame is None:
+            self.frame = FrameHistory()
+            if key is not None:
+                self.frames[key] = self.frame
+        else:
+            self.frames.move_to_end(key)
+
+    def drop(self, key):
+        frame = self.frames.pop(key, None) if key is not None else self.frame
+        if frame is not None:
+            self.size -= sum(size for _, size in frame.done) + sum(size for _, size in frame.undone)
+            frame.done.clear()
+            frame.undone.clear()
+
+    def push(self, command: Command):
+        """Record an executed command."""
+        self.size -= sum(size for _, size in self.frame.undone)
+        self.frame.undone.clear()
+        size = command.size()
+        self.frame.done.append((command, size))
+        self.size += size
+        self.trim()
+
+    def undo(self):
+        if len(self.frame.done) == 0:
+            return None
+        entry = self.frame.done.pop()
+        self.frame.undone.append(entry)
+        return entry[0]
+
+    def redo(self):
+        if len(self.frame.undone) == 0:
+            return None
+        entry = self.frame.undone.pop()
+        self.frame.done.append(entry)
+        return entry[0]
+
+    def trim(self):
+        frames = list(self.frames.items())
+        if self.key is None:
+            frames.append((None, self.frame))
+        for key, frame in frames:
+            # the frame being edited keeps its newest command
+            keep = 1 if frame is self.frame else 0
+            while self.size > self.max_bytes and len(frame.undone) > 0 and len(frame.done) + len(frame.undone) > keep:
+                self.size -= frame.undone.pop(0)[1]
+            while self.size > self.max_bytes and len(frame.done) > 0 and len(frame.done) + len(frame.undone) > keep:
+                self.size -= frame.done.popleft()[1]
+            if len(frame.done) == 0 and len(frame.undone) == 0 and frame is not self.frame:
+                del self.frames[key]
+            if self.size <= self.max_bytes:
+                return
 
 
 class AnnoLabel(QLabel):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.current_pos = None
-        self.selected_annotation_index = None
+        self.selected_annotation_id = None
         self.annotation_type = "rectangle"
         self.annotation = None
         self.annotation_list = AnnotationList()
+        self.annotation_list.on_change = self.annotation_changed
+        self.on_annotation_changed = None
         self.label = ""
-        self.history: List[Command] = []
-        self.undo_history: List[Command] = []
+        self.history = UndoHistory()
         self.on_annotation_updated = None
         self.font_name = DEFAULT_FONT_NAME
         self.font_size = DEFAULT_FONT_SIZE  # 占图片高度的比例
@@ -190,35 +612,45 @@ class AnnoLabel(QLabel):
         self.thickness = DEFAULT_THICKNESS
         self.text_color = QColor(255, 255, 0, 255).name(QColor.NameFormat.HexArgb)
         self.label_fill_color = QColor(255, 255, 0, 0).name(QColor.NameFormat.HexArgb)
-        self.mouse_font = QFont(DEFAULT_FONT_NAME)
         self.image = None
         self.image_region = [0, 0, 1, 1]  # [x, y, w, h]
         self.image_region_changed = False
+        self.image_pyramid = None
+        self.image_transformation = Qt.TransformationMode.SmoothTransformation
+        self.smooth_render_timer = QTimer(self)
+        self.smooth_render_timer.setSingleShot(True)
+        self.smooth_render_timer.setInterval(SMOOTH_RENDER_DELAY)
+        self.smooth_render_timer.timeout.connect(self.render_smooth)
         self.start_move_pos = None
+        self.annotation_layer = None
+        self.annotation_layer_key = None
 
-    def set_image(self, image: QImage):
+    def set_image(self, image):
+        """Show a QImage, or a TiledImage for images too large to decode at once."""
         if self.image != image:
             self.image = image
+            self.image_pyramid = ImagePyramid(image) if isinstance(image, QImage) else image
             self.image_region = [0, 0, 1, 1]  # [x, y, w, h]
             self.image_region_changed = True
+            self.image_transformation = Qt.TransformationMode.SmoothTransformation
+            self.smooth_render_timer.stop()
             self.start_move_pos = None
 
+    def move_image_region(self):
+        """Render the changed image region fast while zooming or panning, and smoothly once idle."""
+        self.image_region_changed = True
+        self.image_transformation = Qt.TransformationMode.FastTransformation
+        self.smooth_render_timer.start()
+
+    def render_smooth(self):
+        self.image_region_changed = True
+        self.image_transformation = Qt.TransformationMode.SmoothTransformation
+        self.update()
+
     def update_image(self):
         if self.image is None or self.image.width() == 0 or self.image.height() == 0:
             return
-        regioned_image = self.image.copy(
-            int(round(self.image.width() * self.image_region[0])),
-            int(round(self.image.height() * self.image_region[1])),
-            int(round(self.image.width() * self.image_region[2])),
-            int(round(self.image.height() * self.image_region[3])),
-        )
-        pixmap = QPixmap.fromImage(
-            regioned_image.scaled(
-                self.size(),
-                Qt.AspectRatioMode.IgnoreAspectRatio,
-                Qt.TransformationMode.SmoothTransformation,
-            )
-        )
+        pixmap = QPixmap.fromImage(self.image_pyramid.render(self.image_region, self.size(), self.image_transformation))
         self.setPixmap(pixmap)
 
     def paintEvent(self, event):
@@ -249,9 +681,10 @@ class AnnoLabel(QLabel):
             pen.setColor(QColor(255, 255, 255, 255))
             pen.setWidth(2)
             painter.setPen(pen)
-            self.mouse_font.setPixelSize(int(round(painter.window().height() * DEFAULT_FONT_SIZE)))
-            painter.setFont(self.mouse_font)
-            metrics = QFontMetrics(self.mouse_font)
+            pixel_size = int(round(painter.window().height() * DEFAULT_FONT_SIZE))
+            cache = paint_cache()
+            painter.setFont(cache.font(DEFAULT_FONT_NAME, pixel_size))
+            metrics = cache.font_metrics(DEFAULT_FONT_NAME, pixel_size)
             rect = metrics.boundingRect(text)
             x = self.current_pos.x() + 5
             y = self.current_pos.y() + rect.height() - metrics.descent() + 5
@@ -260,18 +693,12 @@ class AnnoLabel(QLabel):
             if y > self.height():
                 y = self.current_pos.y() - rect.height() - metrics.descent() - 5
             painter.drawText(int(round(x)), int(round(y)), text)
-        if self.selected_annotation_index is not None:
-            annotation = copy.deepcopy(
-                self.annotation_list[self.selected_annotation_index]
-            )
+        if self.selected_annotation_id in self.annotation_list:
+            annotation = self.annotation_list[self.selected_annotation_id]
             thickness = annotation.get("thickness", self.thickness)
-            for key in [
+            annotation = annotation.without(
                 "text", "color", "fill_color", "thickness", "text_color", "text_fill_color", "font_name", "font_size"
-            ]:
-                if key in annotation:
-                    del annotation[key]
-            annotation["color"] = QColor(255, 255, 255, 255).name(QColor.NameFormat.HexArgb)
-            annotation["thickness"] = thickness * 2
+            ).replace(color=HIGHLIGHT_COLOR, thickness=thickness * 2)
             self.paint_annotation(
                 painter,
                 annotation,
@@ -284,26 +711,7 @@ class AnnoLabel(QLabel):
                 default_font_size=self.font_size,
             )
         if len(self.annotation_list) > 0:
-            pen = QPen()
-            pen.setWidth(int(round(self.thickness * painter.window().height())))
-            pen.setColor(to_color(self.color))
-            painter.setPen(pen)
-            if self.annotation is not None:
-                status = "drawing other"
-            else:
-                status = None
-            for i in range(len(self.annotation_list)):
-                self.paint_annotation(
-                    painter,
-                    self.annotation_list[i],
-                    region=self.image_region,
-                    status=status,
-                    default_color=self.color,
-                    default_text_color=self.text_color,
-                    default_thickness=self.thickness,
-                    default_font=self.font_name,
-                    default_font_size=self.font_size,
-                )
+            painter.drawPixmap(0, 0, self.get_annotation_layer())
         if self.annotation is not None:
             pen = QPen()
             pen.setWidth(int(round(self.thickness * painter.window().height())))
@@ -323,6 +731,67 @@ class AnnoLabel(QLabel):
         painter.end()
         return ret
 
+    def get_annotation_layer(self) -> QPixmap:
+        """The committed annotations rendered for the current view.
+
+        The layer is re-rendered only when the annotation list, the visible region, the widget
+        size or the default style changes, so mouse moves only repaint the cursor overlay.
+        It has the device pixels of the screen, so it stays sharp on high-DPI screens.
+        """
+        status = "drawing other" if self.annotation is not None else None
+        ratio = self.devicePixelRatioF()
+        key = (
+            self.annotation_list.version,
+            tuple(self.image_region),
+            self.width(),
+            self.height(),
+            ratio,
+            status,
+            self.color,
+            self.text_color,
+            self.thickness,
+            self.font_name,
+            self.font_size,
+        )
+        if key == self.annotation_layer_key:
+            return self.annotation_layer
+        # painted in device pixels; with the ratio set first the painter would scale twice
+        layer = QPixmap(self.size() * ratio)
+        layer.fill(Qt.GlobalColor.transparent)
+        painter = QPainter(layer)
+        if self.image_region == [0, 0, 1, 1]:
+            visible = self.annotation_list.annotations
+        else:
+            # annotations outside the zoomed view, and its margin, cannot show
+            visible = [
+                self.annotation_list[annotation_id]
+                for annotation_id in self.annotation_list.candidates(
+                    self.image_region[0] + self.image_region[2] / 2,
+                    self.image_region[1] + self.image_region[3] / 2,
+                    self.image_region[2] * (0.5 + CULL_MARGIN),
+                    self.image_region[3] * (0.5 + CULL_MARGIN),
+                )
+            ]
+        draw_text = len(visible) <= LOD_MAX_LABELS
+        self.paint_annotations(
+            painter,
+            visible,
+            region=self.image_region,
+            status=status,
+            default_color=self.color,
+            default_text_color=self.text_color,
+            default_thickness=self.thickness,
+            default_font=self.font_name,
+            default_font_size=self.font_size,
+            lod=True,
+            draw_text=draw_text,
+        )
+        painter.end()
+        layer.setDevicePixelRatio(ratio)
+        self.annotation_layer = layer
+        self.annotation_layer_key = key
+        return layer
+
     def wheelEvent(self, event):
         if self.annotation is None and self.start_move_pos is None:
             if self.current_pos is not None:
@@ -349,7 +818,7 @@ class AnnoLabel(QLabel):
             self.image_region[1] = max(0, min(y, 1 - h))
             self.image_region[2] = w
             self.image_region[3] = h
-            self.image_region_changed = True
+            self.move_image_region()
             self.update()
         return super().wheelEvent(event)
 
@@ -388,7 +857,7 @@ class AnnoLabel(QLabel):
                 h = (self.annotation["y2"] - self.annotation["y"]) * self.image.height()
                 if w**2 + h**2 < 4**2:  # 小于4像素的annotation忽略
                     self.annotation = None
-                    if self.selected_annotation_index is not None:
+                    if self.selected_annotation_id in self.annotation_list:
                         # 按住Ctrl修改选中的annotation的text
                         if event.modifiers() == Qt.KeyboardModifier.ControlModifier:
                             text, ok = QInputDialog.getText(
@@ -396,40 +865,35 @@ class AnnoLabel(QLabel):
                                 "Input",
                                 "Please input text",
                                 text=self.annotation_list[
-                                    self.selected_annotation_index
+                                    self.selected_annotation_id
                                 ].get("text", ""),
                             )
                             if ok:
-                                new_annotation = copy.deepcopy(
-                                    self.annotation_list[self.selected_annotation_index]
-                                )
-                                new_annotation["text"] = text
+                                new_annotation = self.annotation_list[self.selected_annotation_id].replace(text=text)
                                 self.execute_command(
                                     ModifyAnnotationCommand(
                                         self.annotation_list,
                                         new_annotation,
-                                        self.selected_annotation_index,
+                                        self.selected_annotation_id,
                                     )
                                 )
                         # 按住Alt修改选中的annotation的颜色
                         elif event.modifiers() == Qt.KeyboardModifier.AltModifier:
                             color = self.annotation_list[
-                                self.selected_annotation_index
+                                self.selected_annotation_id
                             ].get("color", self.color)
                             color = QColorDialog.getColor(
                                 initial=to_color(color),
                                 parent=self,
                             )
                             if color.isValid():
-                                new_annotation = copy.deepcopy(
-                                    self.annotation_list[self.selected_annotation_index]
-                                )
-                                new_annotation["color"] = color.name(QColor.NameFormat.HexArgb)
+                                new_annotation = self.annotation_list[self.selected_annotation_id].replace(
+                                    color=color.name(QColor.NameFormat.HexArgb))
                                 self.execute_command(
                                     ModifyAnnotationCommand(
                                         self.annotation_list,
                                         new_annotation,
-                                        self.selected_annotation_index,
+                                        self.selected_annotation_id,
                                     )
                                 )
             if self.annotation is not None:
@@ -479,9 +943,9 @@ class AnnoLabel(QLabel):
             else:
                 x = event.pos().x()
                 y = event.pos().y()
-                if self.selected_annotation_index is not None:
-                    self.delete_annotation(self.selected_annotation_index)
-                    self.selected_annotation_index = self.find_nearest_annotation(x, y)
+                if self.selected_annotation_id in self.annotation_list:
+                    self.delete_annotation(self.selected_annotation_id)
+                    self.selected_annotation_id = self.find_nearest_annotation(x, y)
         if event.button() == Qt.MouseButton.MiddleButton:
             self.start_move_pos = None
         return super().mouseReleaseEvent(event)
@@ -500,7 +964,7 @@ class AnnoLabel(QLabel):
             x = event.pos().x()
             y = event.pos().y()
             nearest = self.find_nearest_annotation(x, y)
-            self.selected_annotation_index = nearest
+            self.selected_annotation_id = nearest
             if self.start_move_pos is not None:
                 move_x = (event.pos().x() - self.start_move_pos.x()) / self.width()
                 move_y = (event.pos().y() - self.start_move_pos.y()) / self.height()
@@ -515,7 +979,7 @@ class AnnoLabel(QLabel):
                 self.image_region[0] = max(0, min(new_region_x, 1 - self.image_region[2]))
                 self.image_region[1] = max(0, min(new_region_y, 1 - self.image_region[3]))
 
-                self.image_region_changed = True
+                self.move_image_region()
                 self.start_move_pos = event.pos()
         self.current_pos = event.pos()
         self.update()
@@ -525,12 +989,26 @@ class AnnoLabel(QLabel):
         if self.on_annotation_updated is not None:
             self.on_annotation_updated(self.annotation_list.annotations)
 
-    def init_annotations(self, annotations):
+    def annotation_changed(self, operation):
+        if self.on_annotation_changed is not None:
+            self.on_annotation_changed(operation)
+
+    def init_annotations(self, annotations, key=None):
+        """Show the annotations of a frame; the undo history is kept per key, such as the annotation file.
+
+        Loading reports no changes, except a replace operation when annotations were given ids.
+        """
+        annotations, added = with_ids(annotations)
+        self.history.switch(key, self.annotation_list.annotations, annotations)
+        self.annotation_list.on_change = None
         self.annotation_list.remove_all()
         self.annotation_list.batch_add(annotations)
-        self.selected_annotation_index = None
-        self.history = []
-        self.undo_history = []
+        self.annotation_list.on_change = self.annotation_changed
+        if added or [annotation["id"] for annotation in self.annotation_list.annotations] != [
+            annotation["id"] for annotation in annotations
+        ]:
+            self.annotation_changed({"op": "replace", "annotations": self.annotation_list.annotations})
+        self.selected_annotation_id = None
         self.annotation = None
         self.notify()
         self.update()
@@ -540,26 +1018,23 @@ class AnnoLabel(QLabel):
 
     def execute_command(self, command: Command):
         command.execute()
-        self.history.append(command)
-        self.undo_history.clear()
+        self.history.push(command)
         self.notify()
         self.update()
 
     def undo(self):
-        if len(self.history) == 0:
+        command = self.history.undo()
+        if command is None:
             return
-        command = self.history.pop()
         command.undo()
-        self.undo_history.append(command)
         self.notify()
         self.update()
 
     def redo(self):
-        if len(self.undo_history) == 0:
+        command = self.history.redo()
+        if command is None:
             return
-        command = self.undo_history.pop()
         command.execute()
-        self.history.append(command)
         self.notify()
         self.update()
 
@@ -571,8 +1046,8 @@ class AnnoLabel(QLabel):
         command = BatchAddAnnotationCommand(self.annotation_list, annotations)
         self.execute_command(command)
 
-    def delete_annotation(self, index):
-        command = DeleteAnnotationCommand(self.annotation_list, index)
+    def delete_annotation(self, annotation_id):
+        command = DeleteAnnotationCommand(self.annotation_list, annotation_id)
         self.execute_command(command)
 
     def delete_all_annotation(self):
@@ -580,10 +1055,18 @@ class AnnoLabel(QLabel):
         self.execute_command(command)
 
     def find_nearest_annotation(self, x, y):
+        """Id of the annotation under the view position (x, y), or None."""
         nearest = None
         nearest_d = float("inf")
-        for i in range(len(self.annotation_list)):
-            annotation = self.annotation_list[i]
+        # only annotations indexed near the cursor can be hit; points are hit within 5 pixels
+        candidates = self.annotation_list.candidates(
+            (x / self.width()) * self.image_region[2] + self.image_region[0],
+            (y / self.height()) * self.image_region[3] + self.image_region[1],
+            5 / self.width() * self.image_region[2],
+            5 / self.height() * self.image_region[3],
+        )
+        for annotation_id in candidates:
+            annotation = self.annotation_list[annotation_id]
             if annotation["type"] == "point":
                 anno_x = (annotation["x2"] - self.image_region[0]) / self.image_region[2] * self.width()
                 anno_y = (annotation["y2"] - self.image_region[1]) / self.image_region[3] * self.height()
@@ -591,7 +1074,7 @@ class AnnoLabel(QLabel):
                 if d < 5:
                     if nearest_d > d:
                         nearest_d = d
-                        nearest = i
+                        nearest = annotation_id
             elif annotation["type"] == "circle":
                 anno_x = ((annotation["x"] - self.image_region[0]) / self.image_region[2] * self.width())
                 anno_y = ((annotation["y"] - self.image_region[1]) / self.image_region[3] * self.height())
@@ -602,7 +1085,7 @@ class AnnoLabel(QLabel):
                 if d < r:
                     if nearest_d > d:
                         nearest_d = d
-                        nearest = i
+                        nearest = annotation_id
             elif annotation["type"] in ["rectangle", "text"]:
                 anno_x = (annotation["x"] - self.image_region[0]) / self.image_region[2] * self.width()
                 anno_y = (annotation["y"] - self.image_region[1]) / self.image_region[3] * self.height()
@@ -620,9 +1103,9 @@ class AnnoLabel(QLabel):
                         anno_area_ratio = (intersection_w * intersection_h) / ((anno_x2 - anno_x) * (anno_y2 - anno_y))
                         nearest_anno_area_ratio = (intersection_w * intersection_h) / ((nearest_anno_x2 - nearest_anno_x) * (nearest_anno_y2 - nearest_anno_y))
                         if nearest_anno_area_ratio < anno_area_ratio:
-                            nearest = i
+                            nearest = annotation_id
                     else:
-                        nearest = i
+                        nearest = annotation_id
         return nearest
 
     @staticmethod
@@ -636,7 +1119,10 @@ class AnnoLabel(QLabel):
         default_font=DEFAULT_FONT_NAME,
         default_font_size=DEFAULT_FONT_SIZE,
         default_thickness=DEFAULT_THICKNESS,
+        lod=False,
+        draw_text=True,
     ):
+        """Paint one annotation; with lod, details too small to see are simplified or left out."""
         if annotation is None:
             return
         color = to_color(annotation.get("color", default_color))
@@ -653,6 +1139,9 @@ class AnnoLabel(QLabel):
         y = (annotation["y"] - region[1]) / region[3] * painter.window().height()
         x2 = (annotation["x2"] - region[0]) / region[2] * painter.window().width()
         y2 = (annotation["y2"] - region[1]) / region[3] * painter.window().height()
+        if lod and annotation["type"] != "point" and abs(x2 - x) < LOD_MIN_SHAPE_SIZE and abs(y2 - y) < LOD_MIN_SHAPE_SIZE:
+            painter.drawPoint(int(round((x + x2) / 2)), int(round((y + y2) / 2)))
+            return
         if annotation["type"] == "point":
             path = QPainterPath()
             path.addEllipse(
@@ -667,44 +1156,155 @@ class AnnoLabel(QLabel):
             painter.drawRect(QRect(int(round(x)), int(round(y)), int(round(x2 - x)), int(round(y2 - y))))
         elif annotation["type"] == "text" and status == "drawing":
             painter.drawRect(QRect(int(round(x)), int(round(y)), int(round(x2 - x)), int(round(y2 - y))))
-        if "text" in annotation and annotation["text"] != "":
-            text = annotation.get("text", "")
-            font_name = annotation.get("font_name", default_font)
-            font_size = annotation.get("font_size", default_font_size)
-            font = QFont(font_name)
-            if annotation["type"] == "text":
-                font.setPixelSize(int(round((y2 - y) * 0.8)))
-            else:
-                font.setPixelSize(int(round(painter.window().height() * font_size)))
-            painter.setFont(font)
-            metrics = QFontMetrics(font)
-            rect = metrics.boundingRect(text)
-            if annotation['type'] == 'text':
-                foreground_color = painter.pen().color().name(QColor.NameFormat.HexArgb)
+        if draw_text and "text" in annotation and annotation["text"] != "":
+            AnnoLabel.paint_text(
+                painter, annotation, x, y, x2, y2, default_text_color, default_font, default_font_size, lod
+            )
+
+    @staticmethod
+    def paint_text(
+        painter: QPainter,
+        annotation,
+        x,
+        y,
+        x2,
+        y2,
+        default_text_color=DEFAULT_TEXT_COLOR,
+        default_font=DEFAULT_FONT_NAME,
+        default_font_size=DEFAULT_FONT_SIZE,
+        lod=False,
+    ):
+        """Paint the label of an annotation at its view coordinates; text annotations use the pen color."""
+        text = annotation.get("text", "")
+        font_name = annotation.get("font_name", default_font)
+        font_size = annotation.get("font_size", default_font_size)
+        if annotation["type"] == "text":
+            pixel_size = int(round((y2 - y) * 0.8))
+        else:
+            pixel_size = int(round(painter.window().height() * font_size))
+        if lod and pixel_size < LOD_MIN_TEXT_SIZE:
+            return
+        cache = paint_cache()
+        painter.setFont(cache.font(font_name, pixel_size))
+        metrics = cache.font_metrics(font_name, pixel_size)
+        rect = cache.text_rect(font_name, pixel_size, text)
+        if annotation['type'] == 'text':
+            foreground_color = painter.pen().color().name(QColor.NameFormat.HexArgb)
+        else:
+            if "text_color" in annotation:
+                foreground_color = annotation["text_color"]
             else:
-                if "text_color" in annotation:
-                    foreground_color = annotation["text_color"]
-                else:
-                    foreground_color = default_text_color
-            pen = painter.pen()
-            pen.setColor(to_color(foreground_color))
+                foreground_color = default_text_color
+        pen = painter.pen()
+        pen.setColor(to_color(foreground_color))
+        painter.setPen(pen)
+        if annotation["type"] == "point":
+            x = x - rect.width() // 2
+            y = y - metrics.descent() - rect.height() // 3
+        elif annotation["type"] == "circle":
+            radius = math.sqrt((x2 - x) ** 2 + (y2 - y) ** 2)
+            x = x - rect.width() // 2
+            y = y - radius - metrics.descent()
+        elif annotation["type"] == "rectangle":
+            y = y - metrics.descent()
+        elif annotation["type"] == "text":
+            x = x
+            y = y2 - metrics.descent()
+        if "text_fill_color" in annotation:
+            background_color = annotation["text_fill_color"]
+            painter.fillRect(
+                rect.translated(int(round(x)), int(round(y))), to_color(background_color)
+            )
+        if len(text) > 0:
+            painter.drawText(int(round(x)), int(round(y)), text)
+
+    @staticmethod
+    def paint_annotations(
+        painter: QPainter,
+        annotations,
+        region=[0, 0, 1, 1],
+        status=None,
+        default_color=DEFAULT_COLOR,
+        default_text_color=DEFAULT_TEXT_COLOR,
+        default_font=DEFAULT_FONT_NAME,
+        default_font_size=DEFAULT_FONT_SIZE,
+        default_thickness=DEFAULT_THICKNESS,
+        lod=False,
+        draw_text=True,
+    ):
+        """Paint many committed annotations at once.
+
+        Draws the shapes of paint_annotation for each of them, but the coordinates of all
+        annotations are transformed together and each run of consecutive annotations of the
+        same type, color and thickness is drawn with one pen and one drawRects or drawPoints
+        call, so overlapping shapes stack in list order. Labels are drawn after all shapes, so
+        they are never hidden by a later shape, unlike in paint_annotation.
+        """
+        if len(annotations) == 0:
+            return
+        width = painter.window().width()
+        height = painter.window().height()
+        coords = np.array([(a["x"], a["y"], a["x2"], a["y2"]) for a in annotations], dtype=np.float64)
+        coords[:, 0::2] = (coords[:, 0::2] - region[0]) / region[2] * width
+        coords[:, 1::2] = (coords[:, 1::2] - region[1]) / region[3] * height
+        groups = []  # (key, indices) of runs, grouping all annotations of a key would reorder overlaps
+        for i, annotation in enumerate(annotations):
+            color = annotation.get("color", default_color)
+            key = (
+                annotation["type"],
+                tuple(color) if isinstance(color, list) else color,
+                annotation.get("thickness", default_thickness),
+            )
+            if len(groups) == 0 or groups[-1][0] != key:
+                groups.append((key, []))
+            groups[-1][1].append(i)
+        # numpy rounds half to even like round(), so shapes land on the same pixels as in paint_annotation
+        rounded = np.round(coords).astype(np.int64)
+        sizes = np.round(coords[:, 2:] - coords[:, :2]).astype(np.int64)
+        centers = np.round((coords[:, :2] + coords[:, 2:]) / 2).astype(np.int64)
+        for (kind, color, thickness), indices in groups:
+            indices = np.array(indices)
+            color = to_color(color)
+            if status == "drawing other":
+                color.setAlpha(100)
+            pen = QPen(color)
+            pen.setWidth(int(round(thickness * height)))
             painter.setPen(pen)
-            if annotation["type"] == "point":
-                x = x - rect.width() // 2
-                y = y - metrics.descent() - rect.height() // 3
-            elif annotation["type"] == "circle":
-                radius = math.sqrt((x2 - x) ** 2 + (y2 - y) ** 2)
-                x = x - rect.width() // 2
-                y = y - radius - metrics.descent()
-            elif annotation["type"] == "rectangle":
-                y = y - metrics.descent()
-            elif annotation["type"] == "text":
-                x = x
-                y = y2 - metrics.descent()
-            if "text_fill_color" in annotation:
-                background_color = annotation["text_fill_color"]
-                painter.fillRect(
-                    rect.translated(int(round(x)), int(round(y))), to_color(background_color)
+            if lod and kind != "point":
+                tiny = (np.abs(coords[indices, 2] - coords[indices, 0]) < LOD_MIN_SHAPE_SIZE) & (
+                    np.abs(coords[indices, 3] - coords[indices, 1]) < LOD_MIN_SHAPE_SIZE
+                )
+                if tiny.any():
+                    painter.drawPoints([QPoint(x, y) for x, y in centers[indices[tiny]].tolist()])
+                indices = indices[~tiny]
+            if kind == "point":
+                radius = int(round(thickness * height / 2))
+                if radius > 0:
+                    # a point is a filled disc around (x2, y2), which a round pen as wide as the disc draws
+                    pen.setWidth(2 * radius)
+                    pen.setCapStyle(Qt.PenCapStyle.RoundCap)
+                    painter.setPen(pen)
+                    painter.drawPoints([QPoint(x, y) for x, y in rounded[indices, 2:].tolist()])
+            elif kind == "circle":
+                for (x, y), (w, h) in zip(rounded[indices, :2].tolist(), sizes[indices].tolist()):
+                    painter.drawEllipse(x, y, w, h)
+            elif kind == "rectangle" or (kind == "text" and status == "drawing"):
+                painter.drawRects(
+                    [QRect(x, y, w, h) for (x, y), (w, h) in zip(rounded[indices, :2].tolist(), sizes[indices].tolist())]
                 )
-            if len(text) > 0:
-                painter.drawText(int(round(x)), int(round(y)), text)
+        if not draw_text:
+            return
+        for i, annotation in enumerate(annotations):
+            if annotation.get("text", "") == "":
+                continue
+            x, y, x2, y2 = coords[i].tolist()
+            if lod and annotation["type"] != "point" and abs(x2 - x) < LOD_MIN_SHAPE_SIZE and abs(y2 - y) < LOD_MIN_SHAPE_SIZE:
+                continue
+            if annotation["type"] == "text":
+                color = to_color(annotation.get("color", default_color))
+                if status == "drawing other":
+                    color.setAlpha(100)
+                painter.setPen(QPen(color))
+            AnnoLabel.paint_text(
+                painter, annotation, x, y, x2, y2, default_text_color, default_font, default_font_size, lod
+            )
@@ -1 +1,3 @@
 from . import detect_detr_resnet101  # noqa: F401
+from . import detect_detr_resnet101_onnx  # noqa: F401
+from . import ensemble  # noqa: F401
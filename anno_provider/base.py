@@ -0,0 +1,181 @@
+"""Provider protocol shared by the annotation tool, batch jobs and the provider server.
+
+A provider package declares its parameters as ``PARAMETERS`` (a list of Parameter) and
+exposes ``create_provider(**params)`` returning a Provider. Both must be importable without
+loading the model, so hosts can render the parameters before paying for construction.
+
+Packages that only define the old ``get_provider(parent)`` entry point keep working through
+LegacyProviderAdapter.
+"""
+import importlib
+import threading
+from typing import Iterable, Iterator, List, Tuple
+
+from PIL import Image
+
+
+class Parameter(object):
+    """Declarative description of a provider parameter.
+
+    kind is one of "str", "int", "float", "bool", "list" (a list of strings, written as
+    ";"-separated text) or "choice" (one of choices). execution parameters, such as the batch
+    size, only change how results are computed and not the results, so they are left out of
+    result cache keys and resume signatures. model parameters are needed to construct the
+    provider; all others can be changed on a constructed provider with set_params.
+    """
+
+    KINDS = ["str", "int", "float", "bool", "list", "choice"]
+
+    def __init__(self, name, kind, default, label=None, description="", choices=None, minimum=None, maximum=None,
+                 execution=False, model=False) -> None:
+        if kind not in self.KINDS:
+            raise ValueError(f"unknown parameter kind {kind}")
+        self.name = name
+        self.kind = kind
+        self.default = default
+        self.label = label if label is not None else name
+        self.description = description
+        self.choices = choices
+        self.minimum = minimum
+        self.maximum = maximum
+        self.execution = execution
+        self.model = model
+
+    def parse(self, text: str):
+        """Convert the text form of a value, as typed on a command line or in a text field."""
+        if self.kind == "int":
+            value = int(text)
+        elif self.kind == "float":
+            value = float(text)
+        elif self.kind == "bool":
+            value = text.strip().lower() in ["1", "true", "yes", "on"]
+        elif self.kind == "list":
+            value = [item.strip() for item in text.split(";") if len(item.strip()) > 0]
+        else:
+            value = text
+        return self.validate(value)
+
+    def format(self, value) -> str:
+        if self.kind == "list":
+            return ";".join(value)
+        return str(value)
+
+    def validate(self, value):
+        if self.kind == "choice" and value not in self.choices:
+            raise ValueError(f"{self.name} must be one of {', '.join(map(str, self.choices))}")
+        if self.minimum is not None and value < self.minimum:
+            raise ValueError(f"{self.name} must be at least {self.minimum}")
+        if self.maximum is not None and value > self.maximum:
+            raise ValueError(f"{self.name} must be at most {self.maximum}")
+        return value
+
+
+class Provider(object):
+    """Base class of annotation providers.
+
+    Subclasses declare parameters and override run_batch (or run, for providers that
+    cannot batch). Images are RGB PIL images; results are lists of annotation dicts
+    with coordinates normalized to the image size.
+    """
+
+    parameters: List[Parameter] = []
+    batch_size = 1
+    # whether results only depend on the frame and get_result_params(), so they may be cached
+    cacheable = True
+
+    def __init__(self, **params) -> None:
+        super().__init__()
+        self.name = type(self).__name__
+        # held for every batch, so jobs sharing a provider take turns between batches
+        self.lock = threading.Lock()
+        self.params = {}
+        for parameter in self.parameters:
+            value = params.pop(parameter.name, parameter.default)
+            self.params[parameter.name] = parameter.validate(value)
+        if len(params) > 0:
+            raise TypeError(f"unknown parameters for {self.name}: {', '.join(params)}")
+
+    def get_params(self) -> dict:
+        return dict(self.params)
+
+    def set_params(self, **params):
+        """Change parameters of a constructed provider; model parameters cannot change."""
+        parameters = {parameter.name: parameter for parameter in self.parameters}
+        for name, value in params.items():
+            if name not in parameters:
+                raise TypeError(f"unknown parameter for {self.name}: {name}")
+            value = parameters[name].validate(value)
+            if parameters[name].model and value != self.params[name]:
+                raise ValueError(f"{name} of {self.name} cannot change after it is created")
+            self.params[name] = value
+
+    def get_result_params(self) -> dict:
+        """The parameters the results depend on, for cache keys and resume signatures."""
+        execution = {parameter.name for parameter in self.parameters if parameter.execution}
+        return {name: value for name, value in self.params.items() if name not in execution}
+
+    def run(self, image: Image.Image, annotation_type: str, color: Tuple[int, int, int]):
+        return self.run_batch([image], annotation_type, color)[0]
+
+    def run_batch(self, images: List[Image.Image], annotation_type: str, color: Tuple[int, int, int]):
+        if type(self).run is Provider.run:
+            raise NotImplementedError(f"{self.name} implements neither run nor run_batch")
+        return [self.run(image, annotation_type, color) for image in images]
+
+    def run_locked_batch(self, images: List[Image.Image], annotation_type: str, color: Tuple[int, int, int]):
+        with self.lock:
+            return self.run_batch(images, annotation_type, color)
+
+    def run_stream(self, frame_iter: Iterable[Tuple[object, Image.Image]], annotation_type: str, color: Tuple[int, int, int]) -> Iterator[Tuple[object, list]]:
+        """Run over (key, image) pairs, yielding (key, annotations) in input order.
+
+        Frames are grouped into batches of batch_size and fed to run_batch.
+        """
+        keys = []
+        images = []
+        for key, image in frame_iter:
+            keys.append(key)
+            images.append(image)
+            if len(images) >= self.batch_size:
+                yield from zip(keys, self.run_locked_batch(images, annotation_type, color))
+                keys = []
+                images = []
+        if len(images) > 0:
+            yield from zip(keys, self.run_locked_batch(images, annotation_type, color))
+
+
+class LegacyProviderAdapter(Provider):
+    """Wrap a provider created through the old get_provider(parent) entry point."""
+
+    # the settings of legacy providers are asked for in their constructor and unknown here
+    cacheable = False
+
+    def __init__(self, provider) -> None:
+        super().__init__()
+        self.provider = provider
+
+    def run(self, image: Image.Image, annotation_type: str, color: Tuple[int, int, int]):
+        return self.provider.run(image, annotation_type, color)
+
+
+def import_provider_module(provider_name):
+    return importlib.import_module(f"anno_provider.{provider_name}")
+
+
+def get_parameters(provider_name):
+    """Parameters declared by a provider package, or None for legacy providers."""
+    return getattr(import_provider_module(provider_name), "PARAMETERS", None)
+
+
+def create_provider(provider_name, parent=None, **params) -> Provider:
+    """Create a provider by package name.
+
+    parent is only used by legacy providers, which show dialogs while being created.
+    """
+    module = import_provider_module(provider_name)
+    if hasattr(module, "create_provider"):
+        provider = module.create_provider(**params)
+    else:
+        provider = LegacyProviderAdapter(module.get_provider(parent))
+    provider.name = provider_name
+    return provider
@@ -1,5 +1,7 @@
-from .detect_detr_resnet101 import DetectDetrResnet101
+from .common import PARAMETERS  # noqa: F401
 
 
-def get_provider(parent):
-    return DetectDetrResnet101(parent)
+def create_provider(**params):
+    # imported lazily so the parameters can be read, and sibling backends can reuse .common, without loading torch
+    from .detect_detr_resnet101 import DetectDetrResnet101
+    return DetectDetrResnet101(**params)
@@ -0,0 +1,51 @@
+from typing import Tuple
+
+from anno_provider.base import Parameter
+
+MODEL_NAME = "facebook/detr-resnet-101"
+
+PARAMETERS = [
+    Parameter("keep_labels", "list", [], label="Labels to keep", description="Label ids to keep, separated by ;, for example: 0;1;2. Empty keeps all labels."),
+    Parameter("text_template", "str", "", label="Text template", description="Use score and label for substitution, for example: {score:.2f} {label}"),
+    Parameter("threshold", "float", 0.9, label="Score threshold", minimum=0.0, maximum=1.0),
+    Parameter("batch_size", "int", 1, label="Batch size", description="Frames per model call when running over many frames.", minimum=1, maximum=64, execution=True),
+    Parameter("shortest_edge", "int", 800, label="Shortest edge", description="Frames and tiles are resized so their shorter side has this many pixels. Lower is faster, higher finds smaller objects.", minimum=64, maximum=4096),
+    Parameter("longest_edge", "int", 1333, label="Longest edge", description="Upper limit for the longer side after resizing.", minimum=64, maximum=8192),
+    Parameter("tile_size", "int", 0, label="Tile size", description="Also detect on square tiles of this many pixels, for small objects in high-resolution frames. 0 disables tiling.", minimum=0, maximum=8192),
+    Parameter("tile_overlap", "float", 0.2, label="Tile overlap", description="Fraction of a tile shared with its neighbours, so objects on tile borders are seen whole.", minimum=0.0, maximum=0.9),
+]
+
+
+def processor_size(params):
+    return {"shortest_edge": params["shortest_edge"], "longest_edge": params["longest_edge"]}
+
+
+def build_annotations(scores, labels, boxes, image_size, keep_labels, text_template, annotation_type: str, color: Tuple[int, int, int]):
+    """Convert detections in pixel coordinates to annotation dicts.
+
+    scores, labels and boxes are plain python sequences (float, int, [x1, y1, x2, y2]).
+    """
+    width, height = image_size
+    annotations = []
+    for score, label, box in zip(scores, labels, boxes):
+        if len(keep_labels) > 0 and str(label) not in keep_labels:
+            print(f"Skip label {label}.")
+            continue
+        box = [round(i, 2) for i in box]
+        box = [box[0] / width, box[1] / height, box[2] / width, box[3] / height]
+        annotation = {
+            "type": annotation_type,
+            "x": box[0],
+            "y": box[1],
+            "x2": box[2],
+            "y2": box[3],
+            "score": round(score, 4),
+            "label": label,
+        }
+        if len(text_template) > 0:
+            annotation["text"] = text_template.format(score=score, label=label)
+        if color is not None:
+            annotation["color"] = color
+        annotations.append(annotation)
+    print(f"return {len(annotations)} annotations.")
+    return annotations
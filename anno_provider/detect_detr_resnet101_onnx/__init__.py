@@ -0,0 +1,6 @@
+from anno_provider.detect_detr_resnet101.common import PARAMETERS  # noqa: F401
+
+
+def create_provider(**params):
+    from .detect_detr_resnet101_onnx import DetectDetrResnet101Onnx
+    return DetectDetrResnet101Onnx(**params)
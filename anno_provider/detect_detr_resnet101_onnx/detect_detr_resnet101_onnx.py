@@ -0,0 +1,154 @@
+from pathlib import Path
+from typing import List, Tuple
+
+import numpy as np
+import onnxruntime as ort
+from PIL import Image
+
+from anno_provider.base import Provider
+from anno_provider.detect_detr_resnet101.common import MODEL_NAME, PARAMETERS, build_annotations
+from roi import run_tiled
+
+MODEL_PATH = Path.home() / ".cache" / "video_annotation" / "onnx" / "detr-resnet-101.onnx"
+# normalization of the DETR image processor
+IMAGE_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+IMAGE_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+
+def export_onnx_model(model_path: Path = MODEL_PATH) -> Path:
+    """Export the DETR model to ONNX once and reuse the file afterwards.
+
+    torch and the transformers model are only imported here, so they are not
+    needed at all once the exported file exists.
+    """
+    if model_path.exists():
+        return model_path
+    import torch
+    from transformers import DetrForObjectDetection
+
+    class DetrOnnxWrapper(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, pixel_values, pixel_mask):
+            outputs = self.model(pixel_values=pixel_values, pixel_mask=pixel_mask)
+            return outputs.logits, outputs.pred_boxes
+
+    print(f"export {MODEL_NAME} to {model_path}.")
+    model_path.parent.mkdir(exist_ok=True, parents=True)
+    model = DetrOnnxWrapper(DetrForObjectDetection.from_pretrained(MODEL_NAME)).eval()
+    pixel_values = torch.randn(1, 3, 800, 1066)
+    pixel_mask = torch.ones(1, 800, 1066, dtype=torch.int64)
+    tmp_path = model_path.with_suffix(".onnx.tmp")
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (pixel_values, pixel_mask),
+            str(tmp_path),
+            input_names=["pixel_values", "pixel_mask"],
+            output_names=["logits", "pred_boxes"],
+            dynamic_axes={
+                "pixel_values": {0: "batch", 2: "height", 3: "width"},
+                "pixel_mask": {0: "batch", 1: "height", 2: "width"},
+                "logits": {0: "batch"},
+                "pred_boxes": {0: "batch"},
+            },
+            opset_version=17,
+        )
+    tmp_path.replace(model_path)
+    return model_path
+
+
+def resize_size(width, height, shortest_edge, longest_edge):
+    """Size of an image resized as by DetrImageProcessor: the shorter side to shortest_edge, the longer at most longest_edge."""
+    raw_size = None
+    short, long = float(min(width, height)), float(max(width, height))
+    if long / short * shortest_edge > longest_edge:
+        raw_size = longest_edge * short / long
+        shortest_edge = int(round(raw_size))
+    if min(width, height) == shortest_edge:
+        return width, height
+    scale = raw_size if raw_size is not None else shortest_edge
+    if width < height:
+        return shortest_edge, int(scale * height / width)
+    return int(scale * width / height), shortest_edge
+
+
+def preprocess(images: List[Image.Image], shortest_edge, longest_edge):
+    """NumPy port of DetrImageProcessor preprocessing: resize, normalize and pad to a batch.
+
+    Returns pixel_values (batch, 3, height, width) and pixel_mask (batch, height, width),
+    which is 1 on image pixels and 0 on the padding right and below.
+    """
+    arrays = []
+    for image in images:
+        size = resize_size(image.width, image.height, shortest_edge, longest_edge)
+        array = np.asarray(image.convert("RGB").resize(size, Image.Resampling.BILINEAR), dtype=np.float32) / 255
+        arrays.append((array - IMAGE_MEAN) / IMAGE_STD)
+    height = max(array.shape[0] for array in arrays)
+    width = max(array.shape[1] for array in arrays)
+    pixel_values = np.zeros((len(arrays), 3, height, width), dtype=np.float32)
+    pixel_mask = np.zeros((len(arrays), height, width), dtype=np.int64)
+    for i, array in enumerate(arrays):
+        pixel_values[i, :, :array.shape[0], :array.shape[1]] = array.transpose(2, 0, 1)
+        pixel_mask[i, :array.shape[0], :array.shape[1]] = 1
+    return pixel_values, pixel_mask
+
+
+def post_process_object_detection(logits, pred_boxes, image_size, threshold):
+    """NumPy port of DetrImageProcessor.post_process_object_detection for one image."""
+    logits = logits - logits.max(axis=-1, keepdims=True)
+    prob = np.exp(logits)
+    prob /= prob.sum(axis=-1, keepdims=True)
+    scores = prob[:, :-1].max(axis=-1)
+    labels = prob[:, :-1].argmax(axis=-1)
+    center_x, center_y, w, h = pred_boxes[:, 0], pred_boxes[:, 1], pred_boxes[:, 2], pred_boxes[:, 3]
+    boxes = np.stack([center_x - 0.5 * w, center_y - 0.5 * h, center_x + 0.5 * w, center_y + 0.5 * h], axis=-1)
+    width, height = image_size
+    boxes = boxes * np.array([width, height, width, height], dtype=boxes.dtype)
+    keep = scores > threshold
+    return scores[keep], labels[keep], boxes[keep]
+
+
+class DetectDetrResnet101Onnx(Provider):
+    parameters = PARAMETERS
+
+    def __init__(self, **params) -> None:
+        super().__init__(**params)
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(str(export_onnx_model()), options, providers=["CPUExecutionProvider"])
+
+    @property
+    def batch_size(self):
+        return self.params["batch_size"]
+
+    def run_batch(self, images: List[Image.Image], annotation_type: str, color: Tuple[int, int, int]):
+        if self.params["tile_size"] > 0:
+            return run_tiled(lambda crops: self.detect(crops, annotation_type, color), images,
+                             self.params["tile_size"], self.params["tile_overlap"], self.batch_size)
+        return self.detect(images, annotation_type, color)
+
+    def detect(self, images: List[Image.Image], annotation_type: str, color: Tuple[int, int, int]):
+        print(f"start detect on {len(images)} images.")
+        pixel_values, pixel_mask = preprocess(images, self.params["shortest_edge"], self.params["longest_edge"])
+        logits, pred_boxes = self.session.run(
+            ["logits", "pred_boxes"],
+            {"pixel_values": pixel_values, "pixel_mask": pixel_mask},
+        )
+        batch_annotations = []
+        for i, image in enumerate(images):
+            scores, labels, boxes = post_process_object_detection(logits[i], pred_boxes[i], image.size, self.params["threshold"])
+            print(len(boxes), "objects detected.")
+            batch_annotations.append(build_annotations(
+                scores.tolist(),
+                labels.tolist(),
+                boxes.tolist(),
+                image.size,
+                self.params["keep_labels"],
+                self.params["text_template"],
+                annotation_type,
+                color,
+            ))
+        return batch_annotations
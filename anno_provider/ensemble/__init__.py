@@ -0,0 +1,14 @@
+from anno_provider.base import Parameter
+from merge_annotations import MERGE_RULES
+
+PARAMETERS = [
+    Parameter("providers", "list", [], label="Providers", description="Provider packages to run on every frame, separated by ;, for example: detect_detr_resnet101;detect_detr_resnet101_onnx", model=True),
+    Parameter("member_params", "str", "", label="Provider parameters", description="Parameters of the providers as provider.name=value, separated by spaces, quoted if they contain spaces, for example: detect_detr_resnet101.threshold=0.8 detect_detr_resnet101.keep_labels=1;3", model=True),
+    Parameter("merge", "choice", "concat", label="Merge rule", description="concat keeps all results, nms suppresses overlapping boxes of the same label, max_score keeps the highest scored of overlapping boxes.", choices=MERGE_RULES),
+    Parameter("iou_threshold", "float", 0.5, label="IoU threshold", description="Overlap above which nms and max_score treat two boxes as the same object.", minimum=0.0, maximum=1.0),
+]
+
+
+def create_provider(**params):
+    from .ensemble import EnsembleProvider
+    return EnsembleProvider(**params)
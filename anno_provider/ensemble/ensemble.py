@@ -0,0 +1,69 @@
+import shlex
+from typing import List, Tuple
+
+from PIL import Image
+
+from anno_provider.base import Provider, create_provider, get_parameters
+from merge_annotations import merge_annotations
+
+from . import PARAMETERS
+
+
+def parse_member_params(provider_names, text):
+    """Split space separated provider.name=value items, quoted as in a shell, into keyword arguments per provider.
+
+    Spaces rather than ";" separate the items, since ";" separates the items of list values.
+    """
+    member_params = {name: {} for name in provider_names}
+    for item in shlex.split(text):
+        key, sep, value = item.partition("=")
+        provider_name, dot, name = key.partition(".")
+        if sep == "" or dot == "" or provider_name not in member_params:
+            raise ValueError(f"invalid provider parameter {item}, expected provider.name=value for one of {', '.join(provider_names)}")
+        parameters = {parameter.name: parameter for parameter in get_parameters(provider_name)}
+        if name not in parameters:
+            raise ValueError(f"unknown parameter {name} for {provider_name}, expected one of {', '.join(parameters)}")
+        member_params[provider_name][name] = parameters[name].parse(value)
+    return member_params
+
+
+class EnsembleProvider(Provider):
+    """Run several providers on the same decoded frames and merge their results.
+
+    Frames reach run_batch already converted once, so decoding and conversion are shared by
+    all member providers.
+    """
+
+    parameters = PARAMETERS
+
+    def __init__(self, **params) -> None:
+        super().__init__(**params)
+        provider_names = self.params["providers"]
+        if len(provider_names) == 0:
+            raise ValueError("an ensemble needs at least one provider")
+        for provider_name in provider_names:
+            if get_parameters(provider_name) is None:
+                # legacy providers ask for their settings in dialogs and cannot be recreated in workers
+                raise ValueError(f"provider {provider_name} does not declare parameters and cannot be part of an ensemble")
+        member_params = parse_member_params(provider_names, self.params["member_params"])
+        self.providers = [create_provider(provider_name, **member_params[provider_name]) for provider_name in provider_names]
+        self.batch_size = max(provider.batch_size for provider in self.providers)
+        self.cacheable = all(provider.cacheable for provider in self.providers)
+
+    def get_result_params(self) -> dict:
+        params = self.get_params()
+        # without the execution parameters of the members
+        params["member_params"] = {provider.name: provider.get_result_params() for provider in self.providers}
+        return params
+
+    def run_batch(self, images: List[Image.Image], annotation_type: str, color: Tuple[int, int, int]):
+        outputs = []
+        for provider in self.providers:
+            results = []
+            for start in range(0, len(images), provider.batch_size):
+                results.extend(provider.run_batch(images[start:start + provider.batch_size], annotation_type, color))
+            outputs.append(results)
+        return [
+            merge_annotations([results[i] for results in outputs], self.params["merge"], self.params["iou_threshold"])
+            for i in range(len(images))
+        ]
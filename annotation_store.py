@@ -0,0 +1,210 @@
+import json
+import os
+import threading
+
+from anno_label import with_ids
+
+JOURNAL_NAME = ".annotations.journal"
+FSYNC_INTERVAL = 32  # operations
+COMPACT_INTERVAL = 10  # seconds
+
+
+def read_annotations(anno_file):
+    if not anno_file.exists():
+        return []
+    return json.loads(anno_file.read_text(encoding='utf-8'))
+
+
+def file_stamp(anno_file):
+    """(modification time, size) of anno_file, None if it does not exist."""
+    try:
+        stat = anno_file.stat()
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def write_annotations(anno_file, annotations):
+    """Replace anno_file atomically, so a crash leaves either the old or the new annotations."""
+    tmp_file = anno_file.with_name(anno_file.name + ".tmp")
+    with tmp_file.open("w", encoding="utf-8") as f:
+        f.write(json.dumps(annotations, indent=4, ensure_ascii=False))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, anno_file)
+
+
+def apply_operation(state, operation):
+    """Apply a journal operation to the annotations of a frame, an id -> annotation dict in drawing order.
+
+    add, modify and delete are idempotent per id, so replaying them over snapshots that already
+    contain some of them gives the same result. clear and replace are not: replayed over a
+    snapshot written after them they drop its newer annotations.
+    """
+    op = operation["op"]
+    if op == "add":
+        # added after the annotation with id "after", first for None, last without "after"
+        annotation = operation["annotation"]
+        after = operation.get("after")
+        if annotation["id"] in state or len(state) == 0 or "after" not in operation:
+            state[annotation["id"]] = annotation
+        elif after is not None and (after not in state or after == next(reversed(state))):
+            state[annotation["id"]] = annotation
+        else:
+            items = list(state.items())
+            position = 0 if after is None else [key for key, _ in items].index(after) + 1
+            items.insert(position, (annotation["id"], annotation))
+            state.clear()
+            state.update(items)
+    elif op == "modify":
+        annotation = state.get(operation["id"])
+        if annotation is None:
+            return
+        annotation = dict(annotation)
+        annotation.update(operation.get("set", {}))
+        for key in operation.get("unset", []):
+            annotation.pop(key, None)
+        state[operation["id"]] = annotation
+    elif op == "delete":
+        state.pop(operation["id"], None)
+    elif op == "clear":
+        state.clear()
+    elif op == "replace":
+        state.clear()
+        state.update((annotation["id"], annotation) for annotation in operation["annotations"])
+    else:
+        raise ValueError(f"unknown journal operation {op}")
+
+
+class AnnotationStore(object):
+    """The per-frame annotation files of annotation_dir, edited through an append-only journal.
+
+    Every edit appends one operation (add, modify or delete, by frame and annotation id) to
+    the journal instead of rewriting the frame file; the journal is fsynced every
+    FSYNC_INTERVAL operations. clear and replace compact the store at once instead, so they
+    are never replayed. A background thread compacts it every
+    COMPACT_INTERVAL seconds by writing the edited frames back to their files and starting
+    an empty journal. A journal left by a crash is replayed when the store is opened.
+    The frame files keep their format, so jobs and the command line read them directly
+    once the store is compacted. A frame file written by someone else after the store read it
+    is read again and the add, modify and delete operations of that frame replayed on top, so
+    the writes of jobs that ran in between are kept.
+    """
+
+    def __init__(self, annotation_dir, compact_interval=COMPACT_INTERVAL) -> None:
+        self.annotation_dir = annotation_dir
+        self.path = annotation_dir / JOURNAL_NAME
+        self.lock = threading.RLock()
+        self.frames = {}  # frame index -> id -> annotation, for frames edited since the last compaction
+        self.stamps = {}  # frame index -> file_stamp of the frame file the state was read from
+        self.operations = {}  # frame index -> operations applied since the last compaction
+        self.file = None
+        self.pending = 0
+        self.recover()
+        self.stopped = threading.Event()
+        self.compactor = threading.Thread(target=self.run_compactor, args=(compact_interval,), daemon=True)
+        self.compactor.start()
+
+    def anno_file(self, index):
+        return self.annotation_dir / f"{index:08d}.json"
+
+    def recover(self):
+        if not self.path.exists():
+            return
+        with self.path.open("r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    operation = json.loads(line)
+                except ValueError:
+                    # torn last line
+                    break
+                self.record(operation["frame"], operation)
+        self.compact()
+
+    def state(self, index):
+        """The annotations of a frame as an id -> annotation dict, re-read if its file changed since."""
+        anno_file = self.anno_file(index)
+        stamp = file_stamp(anno_file)
+        state = self.frames.get(index)
+        if state is None or self.stamps[index] != stamp:
+            annotations, _ = with_ids(read_annotations(anno_file))
+            state = self.frames[index] = {annotation["id"]: annotation for annotation in annotations}
+            self.stamps[index] = stamp
+            # only idempotent operations are kept for replay, so replaying those already in the file does no harm
+            for operation in self.operations.get(index, []):
+                apply_operation(state, operation)
+        return state
+
+    def record(self, index, operation):
+        apply_operation(self.state(index), operation)
+        self.operations.setdefault(index, []).append(operation)
+
+    def load(self, index):
+        """The current annotations of a frame."""
+        with self.lock:
+            if index in self.frames:
+                return [dict(annotation) for annotation in self.state(index).values()]
+        return read_annotations(self.anno_file(index))
+
+    def apply(self, index, operation):
+        line = json.dumps({"frame": index, **operation}, ensure_ascii=False)
+        with self.lock:
+            # applied from the journal line, so later changes to the caller's dicts do not leak in
+            self.record(index, json.loads(line))
+            if operation["op"] in ("clear", "replace"):
+                # replayed over a file a job writes later they would drop its writes
+                self.compact()
+                return
+            if self.file is None:
+                self.file = self.path.open("a", encoding="utf-8")
+            self.file.write(line + "\n")
+            self.pending += 1
+            if self.pending >= FSYNC_INTERVAL:
+                self.sync()
+            else:
+                self.file.flush()
+
+    def save(self, index, annotations):
+        """Replace the annotations of a frame; annotations without an id get one."""
+        annotations, _ = with_ids(annotations)
+        self.apply(index, {"op": "replace", "annotations": annotations})
+        return annotations
+
+    def extend(self, index, annotations):
+        """Add annotations to the end of a frame."""
+        annotations, _ = with_ids(annotations)
+        for annotation in annotations:
+            self.apply(index, {"op": "add", "annotation": annotation})
+
+    def sync(self):
+        with self.lock:
+            if self.file is not None and self.pending > 0:
+                self.file.flush()
+                os.fsync(self.file.fileno())
+                self.pending = 0
+
+    def compact(self):
+        """Write the edited frames to their files and empty the journal."""
+        with self.lock:
+            for index in list(self.frames):
+                write_annotations(self.anno_file(index), list(self.state(index).values()))
+            self.frames = {}
+            self.stamps = {}
+            self.operations = {}
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+                self.pending = 0
+            if self.path.exists():
+                self.path.unlink()
+
+    def run_compactor(self, interval):
+        while not self.stopped.wait(interval):
+            with self.lock:
+                if self.file is not None:
+                    self.compact()
+
+    def close(self):
+        self.stopped.set()
+        self.compactor.join()
+        self.compact()
@@ -0,0 +1,18 @@
+from pathlib import Path
+
+from image_pyramid import TiledImage
+from job_manager import PRIORITY_HIGH, Job
+
+
+class BuildTiles(Job):
+    """Cut a huge image into the tiles of its TiledImage; the view shows a preview until it is done."""
+
+    def __init__(self, tiled_image: TiledImage) -> None:
+        # jobs for the same image would write the same tiles
+        super().__init__(f"Build tiles of {Path(tiled_image.filename).name}", priority=PRIORITY_HIGH,
+                         exclusive=str(tiled_image.tile_dir))
+        self.tiled_image = tiled_image
+
+    def run(self):
+        if not self.tiled_image.is_built():
+            self.tiled_image.build_tiles(progress=self.report)
@@ -0,0 +1,276 @@
+"""Headless command-line runner for export, provider inference and tracking.
+
+Progress and results are reported as JSON lines on stdout, for example::
+
+    {"event": "progress", "command": "run-provider", "done": 10, "total": 100}
+
+Usage examples::
+
+    python cli.py export video.mp4 --frames 1:1000
+    python cli.py run-provider video.mp4 --provider detect_detr_resnet101 --param threshold=0.8 --workers 4
+    python cli.py run-provider video.mp4 --provider detect_detr_resnet101 --provider detect_detr_resnet101_onnx --merge nms
+    python cli.py track video.mp4 --tracker CSRT --frames 100:200
+    python cli.py export-dataset video.mp4 --format coco --step 5 --workers 8
+    python cli.py import-dataset video.mp4 --format mot --source MOT17-02/gt/gt.txt --policy replace
+"""
+import argparse
+import json
+import os
+import shlex
+import sys
+from pathlib import Path
+
+from PySide6.QtGui import QColor, QGuiApplication
+
+from anno_label import DEFAULT_COLOR, DEFAULT_FONT_NAME, DEFAULT_FONT_SIZE, DEFAULT_TEXT_COLOR, DEFAULT_THICKNESS
+from anno_provider.base import create_provider, get_parameters
+from dataset_export import DATASET_FORMATS, dataset_dir_for, export_dataset
+from dataset_import import IMPORT_POLICIES, import_dataset
+from export import export_frames
+from image_provider import annotation_dir_for, open_image_provider, open_image_writer, parse_frame_range
+from merge_annotations import MERGE_RULES
+from provider_cache import ProviderCache
+from roi import parse_region
+from run_provider_all import run_provider_all
+from tracker import TRACKERS, track_frames
+
+ANNOTATION_TYPES = ["rectangle", "text", "circle", "point"]
+
+
+def emit(event, **fields):
+    print(json.dumps({"event": event, **fields}, ensure_ascii=False), flush=True)
+
+
+def progress_reporter(command):
+    def progress(done, total):
+        emit("progress", command=command, done=done, total=total)
+    return progress
+
+
+def parse_color(text):
+    """Parse "r,g,b" or any color name understood by QColor, such as "#ff0000"."""
+    if "," in text:
+        color = QColor(*[int(part) for part in text.split(",")])
+    else:
+        color = QColor.fromString(text)
+    if not color.isValid():
+        raise argparse.ArgumentTypeError(f"invalid color {text}")
+    return color
+
+
+def parse_roi(text):
+    try:
+        return parse_region(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def parse_params(provider_name, items):
+    parameters = get_parameters(provider_name)
+    if parameters is None:
+        raise ValueError(f"provider {provider_name} does not declare parameters and cannot run headless")
+    parameters = {parameter.name: parameter for parameter in parameters}
+    params = {}
+    for item in items:
+        name, sep, value = item.partition("=")
+        if sep == "" or name not in parameters:
+            raise ValueError(f"invalid parameter {item}, expected one of {', '.join(parameters)} as name=value")
+        params[name] = parameters[name].parse(value)
+    return params
+
+
+def open_source(path):
+    file_path = Path(path)
+    if not file_path.exists():
+        raise ValueError(f"{file_path} does not exist")
+    image_provider = open_image_provider(file_path)
+    if image_provider is None:
+        raise ValueError(f"unsupported file format: {file_path}")
+    annotation_dir = annotation_dir_for(file_path)
+    annotation_dir.mkdir(exist_ok=True, parents=True)
+    return file_path, image_provider, annotation_dir
+
+
+def frame_range(args, image_provider):
+    if args.frames is None:
+        return 0, image_provider.get_total()
+    return parse_frame_range(args.frames, image_provider.get_total())
+
+
+def command_export(args):
+    file_path, image_provider, annotation_dir = open_source(args.path)
+    start_index, end_index = frame_range(args, image_provider)
+    image_writer = open_image_writer(file_path)
+    export_frames(
+        image_provider,
+        image_writer,
+        annotation_dir,
+        start_index,
+        end_index,
+        default_color=args.color.name(QColor.NameFormat.HexArgb),
+        default_text_color=args.text_color.name(QColor.NameFormat.HexArgb),
+        default_font=args.font,
+        default_font_size=args.font_size / 100,
+        default_thickness=args.thickness / 100,
+        progress=progress_reporter(args.command),
+    )
+    return {"output": str(image_writer.filename)}
+
+
+def command_export_dataset(args):
+    file_path, image_provider, annotation_dir = open_source(args.path)
+    start_index, end_index = frame_range(args, image_provider)
+    output_dir = Path(args.output) if args.output is not None else dataset_dir_for(file_path, args.format)
+    export_dataset(
+        image_provider,
+        annotation_dir,
+        output_dir,
+        args.format,
+        start_index,
+        end_index,
+        step=args.step,
+        images=not args.no_images,
+        workers=args.workers,
+        classes=args.classes.split(",") if args.classes is not None else None,
+        progress=progress_reporter(args.command),
+    )
+    return {"output": str(output_dir)}
+
+
+def command_import_dataset(args):
+    _, image_provider, annotation_dir = open_source(args.path)
+    result = import_dataset(
+        image_provider,
+        annotation_dir,
+        Path(args.source),
+        args.format,
+        policy=args.policy,
+        annotation_type=args.type,
+        color=args.color.getRgb()[:3] if args.color is not None else None,
+        frame_offset=args.frame_offset,
+        workers=args.workers,
+        progress=progress_reporter(args.command),
+    )
+    return {"annotation_dir": str(annotation_dir), **result}
+
+
+def command_run_provider(args):
+    _, image_provider, annotation_dir = open_source(args.path)
+    start_index, end_index = frame_range(args, image_provider)
+    if len(args.provider) > 1:
+        # several providers run as one ensemble, which parses the provider.name=value parameters itself
+        anno_provider = create_provider(
+            "ensemble",
+            providers=args.provider,
+            member_params=shlex.join(args.param),
+            merge=args.merge,
+            iou_threshold=args.iou_threshold,
+        )
+    else:
+        params = parse_params(args.provider[0], args.param)
+        anno_provider = create_provider(args.provider[0], **params)
+    run_provider_all(
+        image_provider,
+        anno_provider,
+        annotation_dir,
+        args.type,
+        args.color.getRgb()[:3],
+        start_index,
+        end_index,
+        cache=None if args.no_cache else ProviderCache(),
+        workers=args.workers,
+        resume=args.resume,
+        skip_existing=args.skip_existing,
+        region=args.roi,
+        progress=progress_reporter(args.command),
+    )
+    return {"annotation_dir": str(annotation_dir)}
+
+
+def command_track(args):
+    _, image_provider, annotation_dir = open_source(args.path)
+    start_index, end_index = frame_range(args, image_provider)
+    track_frames(image_provider, annotation_dir, args.tracker, start_index, end_index, progress=progress_reporter(args.command))
+    return {"annotation_dir": str(annotation_dir)}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Run annotation jobs without a display.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    def add_source_arguments(subparser):
+        subparser.add_argument("path", help="video, image or image folder")
+        subparser.add_argument("--frames", help="1-based inclusive frame range start:end, default all frames")
+
+    export = subparsers.add_parser("export", help="render annotations into a copy of the video or images")
+    add_source_arguments(export)
+    export.add_argument("--color", type=parse_color, default=parse_color(DEFAULT_COLOR), help="default annotation color")
+    export.add_argument("--text-color", type=parse_color, default=parse_color(DEFAULT_TEXT_COLOR), help="default text color")
+    export.add_argument("--font", default=DEFAULT_FONT_NAME, help="default font name")
+    export.add_argument("--font-size", type=float, default=DEFAULT_FONT_SIZE * 100, help="default font size in %% of the image height")
+    export.add_argument("--thickness", type=float, default=DEFAULT_THICKNESS * 100, help="default thickness in %% of the image height")
+    export.set_defaults(handler=command_export)
+
+    export_dataset = subparsers.add_parser("export-dataset", help="write the annotations as a COCO, YOLO or MOTChallenge dataset")
+    add_source_arguments(export_dataset)
+    export_dataset.add_argument("--format", choices=DATASET_FORMATS, required=True)
+    export_dataset.add_argument("--output", help="output folder, default <name>_<format> next to the source")
+    export_dataset.add_argument("--step", type=int, default=1, help="only export every n-th frame")
+    export_dataset.add_argument("--classes", help="comma separated class names to number first, others follow in order of appearance")
+    export_dataset.add_argument("--no-images", action="store_true", help="only write the annotations, not the frames")
+    export_dataset.add_argument("--workers", type=int, default=4, help="number of threads encoding frames")
+    export_dataset.set_defaults(handler=command_export_dataset)
+
+    import_dataset = subparsers.add_parser("import-dataset", help="add the boxes of a COCO, YOLO or MOTChallenge dataset to the annotations")
+    import_dataset.add_argument("path", help="video, image or image folder")
+    import_dataset.add_argument("--format", choices=DATASET_FORMATS, required=True)
+    import_dataset.add_argument("--source", required=True,
+                                help="COCO json file, YOLO dataset or labels folder, MOT sequence folder or text file")
+    import_dataset.add_argument("--policy", choices=IMPORT_POLICIES, default="merge",
+                                help="add to the annotations of a frame or replace them")
+    import_dataset.add_argument("--type", choices=["rectangle", "text", "circle"], default="rectangle", help="annotation type of the boxes")
+    import_dataset.add_argument("--color", type=parse_color, help="annotation color, default the annotator's color")
+    import_dataset.add_argument("--frame-offset", type=int, default=0, help="added to the frame indices of the source")
+    import_dataset.add_argument("--workers", type=int, default=4, help="number of threads writing annotation files")
+    import_dataset.set_defaults(handler=command_import_dataset)
+
+    run_provider = subparsers.add_parser("run-provider", help="run an annotation provider over all frames")
+    add_source_arguments(run_provider)
+    run_provider.add_argument("--provider", action="append", required=True,
+                              help="provider package under anno_provider, repeat to run several providers in one pass")
+    run_provider.add_argument("--param", action="append", default=[],
+                              help="provider parameter as name=value, or provider.name=value with several providers, may be repeated")
+    run_provider.add_argument("--merge", choices=MERGE_RULES, default="concat", help="how to merge the results of several providers")
+    run_provider.add_argument("--iou-threshold", type=float, default=0.5, help="box overlap treated as the same object by --merge")
+    run_provider.add_argument("--type", choices=ANNOTATION_TYPES, default="rectangle", help="annotation type of the results")
+    run_provider.add_argument("--color", type=parse_color, default=parse_color("0,255,0"), help="annotation color")
+    run_provider.add_argument("--workers", type=int, default=1, help="number of worker processes")
+    run_provider.add_argument("--no-cache", action="store_true", help="do not use the provider result cache")
+    run_provider.add_argument("--resume", action="store_true", help="skip frames an interrupted run with the same settings finished")
+    run_provider.add_argument("--roi", type=parse_roi, help="only run on this normalized x,y,w,h region of every frame")
+    run_provider.add_argument("--skip-existing", action="store_true", help="leave frames that already have annotations untouched")
+    run_provider.set_defaults(handler=command_run_provider)
+
+    track = subparsers.add_parser("track", help="fill frames without annotations by tracking from the previous frame")
+    add_source_arguments(track)
+    track.add_argument("--tracker", choices=TRACKERS, required=True)
+    track.set_defaults(handler=command_track)
+    return parser
+
+
+def main(argv=None):
+    # painting text needs a QGuiApplication; the offscreen platform needs no display
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    app = QGuiApplication(sys.argv[:1])  # noqa: F841
+    args = build_parser().parse_args(argv)
+    try:
+        result = args.handler(args)
+    except Exception as e:
+        emit("error", command=args.command, message=f"{type(e).__name__}: {e}")
+        return 1
+    emit("done", command=args.command, **result)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,234 @@
+"""Export annotations as COCO, YOLO or MOTChallenge datasets.
+
+Frames are streamed one at a time: each annotation file is read, converted and appended to
+the output before the next one is read, so memory does not grow with the number of frames
+or boxes. Rectangles, texts and circles are exported by their bounding box; points have no
+box and are left out. The class of a box is its "label", or lacking one its "text".
+"""
+import json
+import shutil
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from merge_annotations import box_of, class_of
+
+DATASET_FORMATS = ["coco", "yolo", "mot"]
+IMAGE_QUALITY = 95
+
+
+def dataset_dir_for(file_path, dataset_format):
+    return file_path.parent / f"{file_path.stem}_{dataset_format}"
+
+
+def read_frame_annotations(annotation_dir, index):
+    anno_file = annotation_dir / f"{index:08d}.json"
+    if not anno_file.exists():
+        return []
+    return json.loads(anno_file.read_text(encoding='utf-8'))
+
+
+class Categories(object):
+    """Class names in order of first appearance, optionally starting from a given list."""
+
+    def __init__(self, names=None) -> None:
+        self.names = []
+        self.index = {}
+        for name in names or []:
+            self.get(name)
+
+    def get(self, name):
+        """The 0-based index of a class name, added if it is new."""
+        name = "object" if name is None else str(name)
+        if name not in self.index:
+            self.index[name] = len(self.names)
+            self.names.append(name)
+        return self.index[name]
+
+
+def frame_boxes(annotations, categories: Categories):
+    """(annotation, 0-based class, (x1, y1, x2, y2)) of the annotations with a box, normalized and clamped."""
+    for annotation in annotations:
+        box = box_of(annotation)
+        if box is None:
+            continue
+        x1, y1, x2, y2 = [min(max(value, 0.0), 1.0) for value in box]
+        if x2 <= x1 or y2 <= y1:
+            continue
+        yield annotation, categories.get(class_of(annotation)), (x1, y1, x2, y2)
+
+
+class CocoWriter(object):
+    """annotations.json with one image per frame and images/ for the frames.
+
+    Images and annotations are written to two files as they come; the annotations are
+    appended to annotations.json when it is closed.
+    """
+
+    def __init__(self, output_dir) -> None:
+        self.output_dir = output_dir
+        self.file = (output_dir / "annotations.json").open("w", encoding="utf-8")
+        self.file.write('{"images": [\n')
+        self.annotations_path = output_dir / ".annotations.json.part"
+        self.annotations_file = self.annotations_path.open("w+", encoding="utf-8")
+        self.image_count = 0
+        self.annotation_count = 0
+
+    def image_path(self, index):
+        return self.output_dir / "images" / f"{index:08d}.jpg"
+
+    def write(self, index, size, boxes):
+        width, height = size
+        image = {"id": index + 1, "file_name": f"images/{index:08d}.jpg", "width": width, "height": height}
+        self.file.write((",\n" if self.image_count > 0 else "") + json.dumps(image, ensure_ascii=False))
+        self.image_count += 1
+        for annotation, category, (x1, y1, x2, y2) in boxes:
+            left, top = x1 * width, y1 * height
+            box_width, box_height = (x2 - x1) * width, (y2 - y1) * height
+            coco_annotation = {
+                "id": self.annotation_count + 1,
+                "image_id": index + 1,
+                "category_id": category + 1,
+                "bbox": [round(left, 2), round(top, 2), round(box_width, 2), round(box_height, 2)],
+                "area": round(box_width * box_height, 2),
+                "iscrowd": 0,
+            }
+            if "score" in annotation:
+                coco_annotation["score"] = annotation["score"]
+            self.annotations_file.write(
+                (",\n" if self.annotation_count > 0 else "") + json.dumps(coco_annotation, ensure_ascii=False))
+            self.annotation_count += 1
+
+    def release(self, categories: Categories):
+        self.file.write('\n], "annotations": [\n')
+        self.annotations_file.seek(0)
+        shutil.copyfileobj(self.annotations_file, self.file)
+        self.annotations_file.close()
+        self.annotations_path.unlink()
+        coco_categories = [{"id": i + 1, "name": name} for i, name in enumerate(categories.names)]
+        self.file.write('\n], "categories": ' + json.dumps(coco_categories, ensure_ascii=False) + '}\n')
+        self.file.close()
+
+
+class YoloWriter(object):
+    """labels/ with one "class cx cy w h" text file per frame, images/ and classes.txt."""
+
+    def __init__(self, output_dir) -> None:
+        self.output_dir = output_dir
+        (output_dir / "labels").mkdir(exist_ok=True, parents=True)
+
+    def image_path(self, index):
+        return self.output_dir / "images" / f"{index:08d}.jpg"
+
+    def write(self, index, size, boxes):
+        lines = [
+            f"{category} {(x1 + x2) / 2:.6f} {(y1 + y2) / 2:.6f} {x2 - x1:.6f} {y2 - y1:.6f}\n"
+            for _, category, (x1, y1, x2, y2) in boxes
+        ]
+        # frames without boxes get an empty file, marking them as background
+        (self.output_dir / "labels" / f"{index:08d}.txt").write_text("".join(lines), encoding="utf-8")
+
+    def release(self, categories: Categories):
+        (self.output_dir / "classes.txt").write_text(
+            "".join(f"{name}\n" for name in categories.names), encoding="utf-8")
+
+
+class MotWriter(object):
+    """gt/gt.txt in the MOTChallenge layout, img1/ for the frames, seqinfo.ini and classes.txt.
+
+    Frame numbers are the 1-based frame numbers of the source. Annotations with the same id,
+    such as tracked copies, share a track id; annotations without one get their own.
+    """
+
+    def __init__(self, output_dir) -> None:
+        self.output_dir = output_dir
+        (output_dir / "gt").mkdir(exist_ok=True, parents=True)
+        self.file = (output_dir / "gt" / "gt.txt").open("w", encoding="utf-8")
+        self.track_ids = {}
+        self.track_count = 0
+        self.last_frame = 0
+        self.size = (0, 0)
+
+    def image_path(self, index):
+        return self.output_dir / "img1" / f"{index + 1:06d}.jpg"
+
+    def track_id(self, annotation):
+        key = annotation.get("id")
+        if key in self.track_ids:
+            return self.track_ids[key]
+        self.track_count += 1
+        if key is not None:
+            self.track_ids[key] = self.track_count
+        return self.track_count
+
+    def write(self, index, size, boxes):
+        width, height = size
+        self.size = size
+        self.last_frame = index + 1
+        for annotation, category, (x1, y1, x2, y2) in boxes:
+            self.file.write(
+                f"{index + 1},{self.track_id(annotation)},{x1 * width:.2f},{y1 * height:.2f},"
+                f"{(x2 - x1) * width:.2f},{(y2 - y1) * height:.2f},{annotation.get('score', 1)},{category + 1},1\n")
+
+    def release(self, categories: Categories):
+        self.file.close()
+        (self.output_dir / "seqinfo.ini").write_text(
+            "[Sequence]\n"
+            f"name={self.output_dir.name}\n"
+            "imDir=img1\n"
+            f"seqLength={self.last_frame}\n"
+            f"imWidth={self.size[0]}\n"
+            f"imHeight={self.size[1]}\n"
+            "imExt=.jpg\n",
+            encoding="utf-8",
+        )
+        (self.output_dir / "classes.txt").write_text(
+            "".join(f"{name}\n" for name in categories.names), encoding="utf-8")
+
+
+DATASET_WRITERS = {"coco": CocoWriter, "yolo": YoloWriter, "mot": MotWriter}
+
+
+def save_image(image, path):
+    path.parent.mkdir(exist_ok=True, parents=True)
+    if not image.save(str(path), "JPG", IMAGE_QUALITY):
+        raise IOError(f"cannot write {path}")
+
+
+def export_dataset(image_provider, annotation_dir, output_dir, dataset_format, start_index, end_index, step=1,
+                   images=True, workers=4, classes=None, progress=None):
+    """Write the annotations of every step-th frame of [start_index, end_index) as a dataset_format dataset.
+
+    With images the frames are also written as JPEG files; frames are decoded in order and
+    encoded by a pool of workers threads, with at most twice as many frames waiting.
+    classes fixes the first class ids, other classes are numbered in order of first appearance.
+    progress is called as progress(done, total) after each frame.
+    """
+    if dataset_format not in DATASET_WRITERS:
+        raise ValueError(f"unknown dataset format {dataset_format}, expected one of {', '.join(DATASET_FORMATS)}")
+    output_dir.mkdir(exist_ok=True, parents=True)
+    writer = DATASET_WRITERS[dataset_format](output_dir)
+    categories = Categories(classes)
+    indices = range(start_index, end_index, step)
+    executor = ThreadPoolExecutor(max_workers=max(workers, 1)) if images else None
+    saving = deque()
+    try:
+        for done, i in enumerate(indices, start=1):
+            image_provider.set_index(i)
+            writer.write(i, image_provider.get_size(), frame_boxes(read_frame_annotations(annotation_dir, i), categories))
+            if executor is not None:
+                image = image_provider.get_image()
+                if image is None:
+                    raise ValueError(f"cannot read frame {i + 1}")
+                # copied, so the encoder does not share the decoder's buffer
+                saving.append(executor.submit(save_image, image.copy(), writer.image_path(i)))
+                while len(saving) > 2 * workers or (len(saving) > 0 and saving[0].done()):
+                    saving.popleft().result()
+            if progress is not None:
+                progress(done, len(indices))
+        while len(saving) > 0:
+            saving.popleft().result()
+    finally:
+        # also close the output when progress cancels the export
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+        writer.release(categories)
@@ -0,0 +1,331 @@
+"""Import COCO, YOLO or MOTChallenge annotations into the per-frame annotation files.
+
+Sources are read incrementally: COCO JSON is parsed item by item, YOLO label files one at a
+time and MOT text files line by line, keeping only the compact boxes. Box coordinates are
+normalized with the frame size reported by the image provider. Frames are written in batches
+by a pool of threads.
+
+Frames are matched by file name: for image folders the image with the same stem, otherwise
+the number the stem ends with as the 0-based frame index, the layout dataset_export writes.
+MOT frame numbers are 1-based. frame_offset is added to frame indices from names or numbers.
+"""
+import hashlib
+import json
+import re
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from anno_label import new_annotation_id
+from dataset_export import DATASET_FORMATS
+from image_provider import ImageFolderProvider
+
+IMPORT_POLICIES = ["merge", "replace"]
+READ_CHUNK_SIZE = 1024 * 1024  # characters
+WRITE_BATCH_SIZE = 256  # frames
+
+
+class JsonStream(object):
+    """Incremental reader of a JSON document, decoding one value at a time."""
+
+    def __init__(self, file) -> None:
+        self.file = file
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def fill(self):
+        chunk = self.file.read(READ_CHUNK_SIZE)
+        if chunk == "":
+            self.eof = True
+            return
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+
+    def peek(self):
+        """The next character that is not whitespace, "" at the end."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos].isspace():
+                self.pos += 1
+            if self.pos < len(self.buffer) or self.eof:
+                return self.buffer[self.pos:self.pos + 1]
+            self.fill()
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"invalid JSON, expected {char!r}")
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # a number at the end of the buffer may continue in the next chunk
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.fill()
+
+
+def iter_json_items(path):
+    """Yield (key, item) for every item of the top-level arrays of a JSON object, (key, value) for other values."""
+    with Path(path).open("r", encoding="utf-8") as f:
+        stream = JsonStream(f)
+        stream.expect("{")
+        while stream.peek() != "}":
+            key = stream.value()
+            stream.expect(":")
+            if stream.peek() == "[":
+                stream.expect("[")
+                while stream.peek() != "]":
+                    yield key, stream.value()
+                    if stream.peek() == ",":
+                        stream.expect(",")
+                stream.expect("]")
+            else:
+                yield key, stream.value()
+            if stream.peek() == ",":
+                stream.expect(",")
+
+
+def read_class_names(path):
+    """Class names one per line, or None if there is no such file."""
+    if path is None or not path.exists():
+        return None
+    return [line.strip() for line in path.read_text(encoding="utf-8").splitlines() if line.strip() != ""]
+
+
+def frame_resolver(image_provider, frame_offset=0):
+    """A function mapping a file name to a 0-based frame index, or None if it names no frame."""
+    stems = {}
+    if isinstance(image_provider, ImageFolderProvider):
+        stems = {path.stem: i for i, path in enumerate(image_provider.images)}
+
+    def resolve(name):
+        if image_provider.get_total() == 1:
+            return 0
+        stem = Path(name).stem
+        if stem in stems:
+            return stems[stem]
+        match = re.search(r"(\d+)$", stem)
+        return int(match.group(1)) + frame_offset if match is not None else None
+    return resolve
+
+
+class SourceIds(object):
+    """Annotation ids for the box or track keys of a source file.
+
+    Ids are derived from the source, so the boxes of one track share an id across frames and
+    importing the same source again gives the same ids. Boxes without a key get a new id.
+    """
+
+    def __init__(self, source) -> None:
+        self.prefix = f"{Path(source).absolute()}:"
+
+    def get(self, key):
+        if key is None:
+            return new_annotation_id()
+        return hashlib.sha1(f"{self.prefix}{key}".encode()).hexdigest()[:16]
+
+
+# boxes are kept as (annotation id, class name, x1, y1, x2, y2, score, normalized) until written,
+# with pixel coordinates unless normalized
+
+
+def read_coco(path, resolve):
+    """Boxes of a COCO annotations.json, by frame index."""
+    frame_of = {}
+    names = {}
+    boxes = {}
+    ids = SourceIds(path)
+    for key, item in iter_json_items(path):
+        if key == "images":
+            frame_of[item["id"]] = resolve(item["file_name"])
+        elif key == "categories":
+            names[item["id"]] = item["name"]
+        elif key == "annotations":
+            left, top, width, height = item["bbox"]
+            track_id = item.get("track_id", item.get("attributes", {}).get("track_id"))
+            key = f"track {track_id}" if track_id is not None else item.get("id")
+            boxes.setdefault(item["image_id"], []).append(
+                (ids.get(key), item["category_id"], left, top, left + width, top + height, item.get("score"), False))
+    # images and categories may follow the annotations
+    frames = {}
+    for image_id, image_boxes in boxes.items():
+        frame = frame_of.get(image_id)
+        frames.setdefault(frame, []).extend(
+            (box[0], names.get(box[1], str(box[1]))) + box[2:] for box in image_boxes)
+    return frames
+
+
+def yolo_label_dir(path):
+    path = Path(path)
+    return path / "labels" if (path / "labels").is_dir() else path
+
+
+def iter_yolo(path, resolve):
+    """(frame index, boxes) for every label file of a YOLO dataset, one file at a time."""
+    label_dir = yolo_label_dir(path)
+    names = read_class_names(label_dir.parent / "classes.txt") or read_class_names(label_dir / "classes.txt") or []
+    for label_file in sorted(label_dir.glob("*.txt")):
+        if label_file.name == "classes.txt":
+            continue
+        frame_boxes = []
+        ids = SourceIds(label_file)
+        for line_number, line in enumerate(label_file.read_text(encoding="utf-8").splitlines()):
+            parts = line.split()
+            if len(parts) < 5:
+                continue
+            category = int(parts[0])
+            cx, cy, width, height = [float(part) for part in parts[1:5]]
+            score = float(parts[5]) if len(parts) > 5 else None
+            name = names[category] if category < len(names) else str(category)
+            frame_boxes.append((ids.get(line_number), name, cx - width / 2, cy - height / 2,
+                                cx + width / 2, cy + height / 2, score, True))
+        yield resolve(label_file.name), frame_boxes
+
+
+def mot_file(path):
+    path = Path(path)
+    if path.is_dir():
+        return path / "gt" / "gt.txt" if (path / "gt" / "gt.txt").exists() else path / "det" / "det.txt"
+    return path
+
+
+def read_mot(path, frame_offset=0):
+    """Boxes of a MOTChallenge gt.txt or det.txt, by frame index.
+
+    The confidence becomes the score when it is strictly between 0 and 1, as in detection files.
+    """
+    path = mot_file(path)
+    sequence_dir = path.parent.parent
+    names = read_class_names(sequence_dir / "classes.txt") or []
+    frames = {}
+    ids = SourceIds(path)
+    track_ids = {}  # track id -> annotation id, tracks are few but long
+    with path.open("r", encoding="utf-8") as f:
+        for line in f:
+            parts = line.strip().split(",")
+            if len(parts) < 6:
+                continue
+            frame = int(float(parts[0])) - 1 + frame_offset
+            track_id = int(float(parts[1]))
+            left, top, width, height = [float(part) for part in parts[2:6]]
+            confidence = float(parts[6]) if len(parts) > 6 else 1
+            category = int(float(parts[7])) if len(parts) > 7 else None
+            if category is None:
+                name = "object"
+            else:
+                name = names[category - 1] if 0 < category <= len(names) else str(category)
+            if track_id < 0:
+                annotation_id = ids.get(None)
+            else:
+                if track_id not in track_ids:
+                    track_ids[track_id] = ids.get(track_id)
+                annotation_id = track_ids[track_id]
+            frames.setdefault(frame, []).append((
+                annotation_id, name, left, top, left + width, top + height, confidence if 0 < confidence < 1 else None, False))
+    return frames
+
+
+def to_annotation(box, size, annotation_type, color):
+    annotation_id, name, x1, y1, x2, y2, score, normalized = box
+    if not normalized:
+        width, height = size
+        x1, x2 = x1 / width, x2 / width
+        y1, y2 = y1 / height, y2 / height
+    annotation = {
+        "id": annotation_id,
+        "type": annotation_type,
+        "x": x1,
+        "y": y1,
+        "x2": x2,
+        "y2": y2,
+        "label": name,
+        "text": name,
+    }
+    if score is not None:
+        annotation["score"] = score
+    if color is not None:
+        annotation["color"] = color
+    return annotation
+
+
+def write_frame(anno_file, annotations, policy):
+    if policy == "merge" and anno_file.exists():
+        # re-imported tracks replace the boxes they imported before
+        imported = {annotation["id"]: annotation for annotation in annotations}
+        existing = json.loads(anno_file.read_text(encoding='utf-8'))
+        annotations = [imported.pop(annotation["id"], annotation) if "id" in annotation else annotation
+                       for annotation in existing] + list(imported.values())
+    # compact, the indented encoder is several times slower; the annotator indents frames it saves
+    anno_file.write_text(json.dumps(annotations, ensure_ascii=False), encoding='utf-8')
+
+
+def write_batch(batch, policy):
+    for anno_file, annotations in batch:
+        write_frame(anno_file, annotations, policy)
+    return len(batch)
+
+
+def import_dataset(image_provider, annotation_dir, source, dataset_format, policy="merge", annotation_type="rectangle",
+                   color=None, frame_offset=0, workers=4, progress=None):
+    """Import the boxes of a dataset_format dataset at source into annotation_dir.
+
+    With merge the boxes are added to the annotations a frame already has, with replace they
+    take their place; frames without imported boxes are left untouched either way.
+    progress is called as progress(done, total) after each written batch, where total is only
+    known up front for COCO and MOT. Returns the numbers of frames written, annotations
+    imported and boxes skipped because they name no frame of image_provider.
+    """
+    if dataset_format not in DATASET_FORMATS:
+        raise ValueError(f"unknown dataset format {dataset_format}, expected one of {', '.join(DATASET_FORMATS)}")
+    if policy not in IMPORT_POLICIES:
+        raise ValueError(f"unknown import policy {policy}, expected one of {', '.join(IMPORT_POLICIES)}")
+    resolve = frame_resolver(image_provider, frame_offset)
+    if dataset_format == "yolo":
+        total = sum(1 for label_file in yolo_label_dir(source).glob("*.txt") if label_file.name != "classes.txt")
+        frame_boxes = iter_yolo(source, resolve)
+    else:
+        frames = read_coco(source, resolve) if dataset_format == "coco" else read_mot(source, frame_offset)
+        total = len(frames)
+        frame_boxes = ((frame, frames[frame]) for frame in sorted(frames, key=lambda frame: (frame is None, frame)))
+    frame_count = annotation_count = skipped = done = 0
+    executor = ThreadPoolExecutor(max_workers=max(workers, 1))
+    pending = deque()
+    batch = []
+    try:
+        for frame, boxes in frame_boxes:
+            if frame is None or frame < 0 or frame >= image_provider.get_total():
+                skipped += len(boxes)
+            if frame is None or frame < 0 or frame >= image_provider.get_total() or len(boxes) == 0:
+                done += 1
+                continue
+            image_provider.set_index(frame)
+            size = image_provider.get_size()
+            batch.append((annotation_dir / f"{frame:08d}.json",
+                          [to_annotation(box, size, annotation_type, color) for box in boxes]))
+            frame_count += 1
+            annotation_count += len(boxes)
+            if len(batch) >= WRITE_BATCH_SIZE:
+                pending.append(executor.submit(write_batch, batch, policy))
+                batch = []
+            # keep a bounded number of batches waiting
+            while len(pending) > 2 * workers or (len(pending) > 0 and pending[0].done()):
+                done += pending.popleft().result()
+                if progress is not None:
+                    progress(done, total)
+        if len(batch) > 0:
+            pending.append(executor.submit(write_batch, batch, policy))
+        for future in pending:
+            done += future.result()
+        if progress is not None:
+            progress(total, total)
+    finally:
+        executor.shutdown(cancel_futures=True)
+    return {"frames": frame_count, "annotations": annotation_count, "skipped": skipped}
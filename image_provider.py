@@ -0,0 +1,236 @@
+import io
+from pathlib import Path
+
+import cv2
+import numpy as np
+from PIL import Image
+from PySide6.QtCore import QBuffer, QIODevice, QSize, Qt
+from PySide6.QtGui import QImage, QImageIOHandler, QImageReader
+
+from image_pyramid import TiledImage, read_image
+
+image_suffix = ['png', 'jpg', 'jpeg', 'bmp', 'tiff', 'tif', 'webp', 'ico', 'jpe', 'jp2', 'j2k', 'jpf', 'jpx', 'jpm', 'mj2', 'svg', 'svgz', 'eps', 'psd', 'ai', 'cdr', 'dxf', 'wmf', 'emf', 'tga', 'icns']
+video_suffix = ['mp4', 'avi', 'mkv', 'flv', 'gif', 'mov', 'wmv', 'rmvb', 'rm', 'asf', 'ts', 'mpeg', 'mpg', 'vob', 'webm', 'm4v', '3gp', '3g2', 'f4v', 'f4p', 'f4a', 'f4b', 'swf', 'm2ts', 'mts', 'm2v', 'm4v', 'm2p', 'm2t', 'm1v', 'm1a', 'm1v', 'm1']
+TILED_MIN_PIXELS = 64 * 1024 * 1024  # larger still images are shown tile by tile
+PREVIEW_SIZE = 2048  # pixels along the longer side of the preview shown while tiles are built
+
+
+class ImageProvider(object):
+    """A single still image.
+
+    Images of more than TILED_MIN_PIXELS are shown through a TiledImage and not kept
+    decoded; get_image still decodes the whole image for providers and export. Until the
+    tiles are built, get_view_image is a preview.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.image = None
+        self.tiled_image = None
+        self.preview = None
+        size = QImageReader(filename).size()
+        self.size = (size.width(), size.height())
+        if size.width() * size.height() > TILED_MIN_PIXELS:
+            self.tiled_image = TiledImage(filename)
+
+    def set_index(self, index):
+        pass
+
+    def get_image(self):
+        if self.tiled_image is not None:
+            return read_image(self.filename)
+        if self.image is None:
+            self.image = QImage(self.filename)
+        return self.image
+
+    def get_view_image(self):
+        """The image to show, a TiledImage for huge images once its tiles are built."""
+        if self.tiled_image is not None:
+            if self.tiled_image.is_built():
+                return self.tiled_image
+            if self.preview is None:
+                self.preview = self.read_preview()
+            return self.preview
+        return self.get_image()
+
+    def read_preview(self):
+        """A downscaled decode where the reader supports it (JPEG), else a blank image of the same aspect ratio."""
+        width, height = self.size
+        scale = min(PREVIEW_SIZE / max(width, height), 1)
+        size = QSize(max(round(width * scale), 1), max(round(height * scale), 1))
+        reader = QImageReader(self.filename)
+        if reader.supportsOption(QImageIOHandler.ImageOption.ScaledSize):
+            reader.setScaledSize(size)
+            image = reader.read()
+            if not image.isNull():
+                return image
+        image = QImage(size, QImage.Format.Format_RGB32)
+        image.fill(Qt.GlobalColor.darkGray)
+        return image
+
+    def get_size(self):
+        """The (width, height) of the current frame, without decoding it."""
+        return self.size
+
+    def get_index(self):
+        return 0
+
+    def get_total(self):
+        return 1
+
+
+class ImageWriter(object):
+    def __init__(self, filename):
+        self.filename = filename
+
+    def write(self, image: QImage):
+        image.save(self.filename)
+
+    def release(self):
+        pass
+
+
+class VideoProvider(object):
+    def __init__(self, filename):
+        self.filename = filename
+        self.video = cv2.VideoCapture(filename)
+        self.frame_count = int(round(self.video.get(cv2.CAP_PROP_FRAME_COUNT)))
+        self.frame_index = 0
+
+    def set_index(self, index):
+        self.frame_index = index
+        if self.frame_index < 0:
+            self.frame_index = 0
+        if self.frame_index >= self.frame_count:
+            self.frame_index = self.frame_count - 1
+
+    def get_image(self):
+        self.video.set(cv2.CAP_PROP_POS_FRAMES, self.frame_index)
+        ret, frame = self.video.read()
+        if not ret:
+            return None
+        self.video.set(cv2.CAP_PROP_POS_FRAMES, self.frame_index)
+        image = QImage(
+            frame.data, frame.shape[1], frame.shape[0], QImage.Format.Format_BGR888)
+        return image
+
+    def get_view_image(self):
+        return self.get_image()
+
+    def get_size(self):
+        return int(self.video.get(cv2.CAP_PROP_FRAME_WIDTH)), int(self.video.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+    def get_index(self):
+        return self.frame_index
+
+    def get_total(self):
+        return self.frame_count
+
+
+class VideoWriter(object):
+    def __init__(self, filename, src_filename) -> None:
+        self.filename = filename
+        src_video = cv2.VideoCapture(src_filename)
+        self.video = cv2.VideoWriter(filename, cv2.VideoWriter_fourcc(*'mp4v'), src_video.get(cv2.CAP_PROP_FPS), (int(
+            src_video.get(cv2.CAP_PROP_FRAME_WIDTH)), int(round(src_video.get(cv2.CAP_PROP_FRAME_HEIGHT)))))
+        src_video.release()
+
+    def write(self, image: QImage):
+        buffer = QBuffer()
+        buffer.open(QIODevice.OpenModeFlag.ReadWrite)
+        image.save(buffer, "PNG")
+        pil_im = Image.open(io.BytesIO(buffer.data()))
+        self.video.write(cv2.cvtColor(np.asarray(pil_im), cv2.COLOR_RGB2BGR))
+
+    def release(self):
+        self.video.release()
+
+
+class ImageFolderProvider(object):
+    def __init__(self, folder):
+        self.filename = folder
+        self.images = list(folder.glob('*'))
+        self.index = 0
+
+    def set_index(self, index):
+        self.index = index
+        if self.index < 0:
+            self.index = 0
+        if self.index >= len(self.images):
+            self.index = len(self.images) - 1
+
+    def get_image(self):
+        return QImage(str(self.images[self.index]))
+
+    def get_view_image(self):
+        return self.get_image()
+
+    def get_size(self):
+        size = QImageReader(str(self.images[self.index])).size()
+        return size.width(), size.height()
+
+    def get_index(self):
+        return self.index
+
+    def get_total(self):
+        return len(self.images)
+
+
+class ImageFolderWriter(object):
+    def __init__(self, folder):
+        self.filename = folder
+        self.index = 0
+
+    def write(self, image: QImage):
+        dest_path = self.filename / f"{self.index:08d}.png"
+        dest_path.parent.mkdir(exist_ok=True, parents=True)
+        image.save(str(dest_path))
+        self.index += 1
+
+    def release(self):
+        pass
+
+
+def open_image_provider(file_path: Path):
+    """Create the image provider matching file_path, or None for unsupported files."""
+    if file_path.is_dir():
+        return ImageFolderProvider(file_path)
+    elif file_path.suffix.split(".")[-1] in image_suffix:
+        return ImageProvider(str(file_path))
+    elif file_path.suffix.split('.')[-1] in video_suffix:
+        return VideoProvider(str(file_path))
+    return None
+
+
+def open_image_writer(file_path: Path):
+    """Create the writer used to export renders of file_path, or None for unsupported files."""
+    if file_path.is_dir():
+        return ImageFolderWriter(file_path.parent / f"{file_path.stem}_render")
+    elif file_path.suffix.split(".")[-1] in image_suffix:
+        return ImageWriter(str(file_path.parent / f"{file_path.stem}_render{file_path.suffix}"))
+    elif file_path.suffix.split('.')[-1] in video_suffix:
+        return VideoWriter(str(file_path.parent / f"{file_path.stem}_render{file_path.suffix}"), str(file_path))
+    return None
+
+
+def annotation_dir_for(file_path: Path) -> Path:
+    return file_path.parent / f"{file_path.stem}_annotations"
+
+
+def parse_frame_range(text, total):
+    """Parse a 1-based inclusive "start:end" range into a 0-based [start, end) pair."""
+    parts = text.split(':')
+    if len(parts) != 2:
+        raise ValueError(f"invalid frame range {text}")
+    start, end = [int(part) for part in parts]
+    start -= 1
+    if start < 0 or end > total or start >= end:
+        raise ValueError(f"invalid frame range {text}, expected a range within 1:{total}")
+    return start, end
+
+
+def qimage_to_pil(image: QImage) -> Image.Image:
+    buffer = QBuffer()
+    buffer.open(QIODevice.OpenModeFlag.ReadWrite)
+    image.save(buffer, "PNG")
+    return Image.open(io.BytesIO(buffer.data()))
@@ -0,0 +1,343 @@
+import hashlib
+import math
+import os
+import shutil
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+from PySide6.QtCore import QRect, QSize, Qt
+from PySide6.QtGui import QImage, QImageIOHandler, QImageReader, QPainter
+
+MAX_LEVELS = 8
+TILE_SIZE = 512  # pixels
+DEFAULT_TILE_CACHE_DIR = Path.home() / ".cache" / "video_annotation" / "tiles"
+DEFAULT_TILE_MEMORY = 256 * 1024 * 1024  # bytes
+DEFAULT_TILE_CACHE_SIZE = 4 * 1024 * 1024 * 1024  # bytes of tile files of all images
+QIMAGE_FORMATS = {1: QImage.Format.Format_Grayscale8, 3: QImage.Format.Format_RGB888, 4: QImage.Format.Format_RGBA8888}
+
+
+def read_image(filename) -> QImage:
+    """Decode a whole image, also beyond the allocation limit QImageReader applies by default."""
+    limit = QImageReader.allocationLimit()
+    QImageReader.setAllocationLimit(0)
+    try:
+        return QImageReader(str(filename)).read()
+    finally:
+        QImageReader.setAllocationLimit(limit)
+
+
+def array_to_image(array) -> QImage:
+    """A copy of a (height, width, samples) uint8 array as a QImage."""
+    array = np.ascontiguousarray(array)
+    height, width, samples = array.shape
+    return QImage(array.data, width, height, width * samples, QIMAGE_FORMATS[samples]).copy()
+
+
+def trim_tile_cache(cache_dir, max_size, keep=None):
+    """Remove the least recently used complete tile dirs under cache_dir until their total size fits max_size.
+
+    Each complete dir records the bytes of its tiles in its "complete" file, whose time of
+    last modification is its last use. keep is never removed.
+    """
+    entries = []
+    for complete in Path(cache_dir).glob("*/complete"):
+        try:
+            stat = complete.stat()
+            size = int(complete.read_text() or 0)
+        except (OSError, ValueError):
+            continue
+        entries.append((stat.st_mtime_ns, size, complete.parent))
+    total = sum(size for _, size, _ in entries)
+    for _, size, tile_dir in sorted(entries):
+        if total <= max_size:
+            break
+        if tile_dir == keep:
+            continue
+        shutil.rmtree(tile_dir, ignore_errors=True)
+        total -= size
+
+
+def level_for(width, height, region, size: QSize):
+    """The pyramid level to render the [x, y, w, h] region of a width x height image at size from.
+
+    It is the smallest level, each halving the previous, that still has at least as many
+    pixels in the region as size.
+    """
+    ratio = min(width * region[2] / max(size.width(), 1), height * region[3] / max(size.height(), 1))
+    if ratio < 2:
+        return 0
+    return min(int(math.log2(ratio)), MAX_LEVELS)
+
+
+class ImagePyramid(object):
+    """Successively halved copies of a frame, built lazily.
+
+    A view of a region is sampled from the smallest level that still has at least as many
+    pixels in the region as the view, so zoomed-out views of large frames scale a small
+    image instead of the full frame.
+    """
+
+    def __init__(self, image: QImage) -> None:
+        self.levels = [image]
+
+    def level(self, index) -> QImage:
+        while len(self.levels) <= index:
+            image = self.levels[-1]
+            if image.width() < 2 or image.height() < 2:
+                break
+            self.levels.append(
+                image.scaled(
+                    image.width() // 2,
+                    image.height() // 2,
+                    Qt.AspectRatioMode.IgnoreAspectRatio,
+                    Qt.TransformationMode.SmoothTransformation,
+                )
+            )
+        return self.levels[min(index, len(self.levels) - 1)]
+
+    def render(self, region, size: QSize, transformation=Qt.TransformationMode.SmoothTransformation) -> QImage:
+        """The [x, y, w, h] region of the frame scaled to size."""
+        image = self.levels[0]
+        image = self.level(level_for(image.width(), image.height(), region, size))
+        left = int(round(image.width() * region[0]))
+        top = int(round(image.height() * region[1]))
+        width = max(int(round(image.width() * region[2])), 1)
+        height = max(int(round(image.height() * region[3])), 1)
+        return image.copy(left, top, width, height).scaled(size, Qt.AspectRatioMode.IgnoreAspectRatio, transformation)
+
+
+class TiledImage(object):
+    """A huge still image decoded only in the tiles a view needs.
+
+    Level k of the pyramid is the image scaled by 1 / 2 ** k, cut into TILE_SIZE tiles that
+    are written as PNG files under cache_dir by build_tiles and read from there; build them,
+    e.g. in a BuildTiles job, unless is_built. Level 0 is cut one strip of tiles at a time
+    from formats whose reader can decode a clipped region (JPEG) and from TIFFs tifffile can
+    decode; other formats have to be decoded as a whole once. The tile files of all images
+    are kept up to max_cache_size, least recently opened first out. Decoded tiles are kept up
+    to max_bytes, least recently used first out, so memory stays bounded however large the
+    image is. Renders like ImagePyramid.
+    """
+
+    def __init__(self, filename, cache_dir=DEFAULT_TILE_CACHE_DIR, max_bytes=DEFAULT_TILE_MEMORY,
+                 max_cache_size=DEFAULT_TILE_CACHE_SIZE) -> None:
+        self.filename = str(filename)
+        reader = QImageReader(self.filename)
+        self.size = reader.size()
+        self.native = reader.supportsOption(QImageIOHandler.ImageOption.ClipRect)
+        self.max_bytes = max_bytes
+        self.max_cache_size = max_cache_size
+        self.tiles = OrderedDict()
+        self.tile_bytes = 0
+        self.written = 0  # bytes of tile files written by build_tiles
+        self.cache_dir = Path(cache_dir)
+        stat = os.stat(self.filename)
+        key = f"{Path(self.filename).absolute()}:{stat.st_mtime_ns}:{stat.st_size}"
+        self.tile_dir = self.cache_dir / hashlib.sha256(key.encode()).hexdigest()
+        if self.is_built():
+            # marks the tiles as recently used
+            os.utime(self.tile_dir / "complete")
+
+    def is_built(self):
+        return (self.tile_dir / "complete").exists()
+
+    def width(self):
+        return self.size.width()
+
+    def height(self):
+        return self.size.height()
+
+    def level_size(self, level) -> QSize:
+        scale = 2 ** level
+        return QSize(max(math.ceil(self.width() / scale), 1), max(math.ceil(self.height() / scale), 1))
+
+    def tile_count(self, level):
+        size = self.level_size(level)
+        return math.ceil(size.width() / TILE_SIZE), math.ceil(size.height() / TILE_SIZE)
+
+    def tile_rect(self, level, tile_x, tile_y) -> QRect:
+        """The pixels of a tile in its level, smaller than TILE_SIZE at the right and bottom border."""
+        size = self.level_size(level)
+        left, top = tile_x * TILE_SIZE, tile_y * TILE_SIZE
+        return QRect(left, top, min(TILE_SIZE, size.width() - left), min(TILE_SIZE, size.height() - top))
+
+    def tile_path(self, level, tile_x, tile_y) -> Path:
+        return self.tile_dir / str(level) / f"{tile_y}_{tile_x}.png"
+
+    def build_tiles(self, progress=None):
+        """Write the tiles of all levels; level 0 comes from the file, each further level from the one below.
+
+        progress is called as progress(done, total) after each row of tiles.
+        """
+        # tiles of a cancelled build are not counted in the cache size
+        shutil.rmtree(self.tile_dir, ignore_errors=True)
+        self.written = 0
+        total = sum(self.tile_count(level)[1] for level in range(MAX_LEVELS + 1))
+        done = 0
+        columns, _ = self.tile_count(0)
+        for tile_y, strip in self.level0_strips():
+            for tile_x in range(columns):
+                rect = self.tile_rect(0, tile_x, tile_y)
+                self.write_tile(0, tile_x, tile_y, strip.copy(rect.translated(0, -rect.top())))
+            done += 1
+            if progress is not None:
+                progress(done, total)
+        for level in range(1, MAX_LEVELS + 1):
+            columns, rows = self.tile_count(level)
+            for tile_y in range(rows):
+                for tile_x in range(columns):
+                    self.write_tile(level, tile_x, tile_y, self.merge_tiles(level, tile_x, tile_y))
+                done += 1
+                if progress is not None:
+                    progress(done, total)
+        (self.tile_dir / "complete").write_text(str(self.written))
+        trim_tile_cache(self.cache_dir, self.max_cache_size, keep=self.tile_dir)
+
+    def level0_strips(self):
+        """(tile_y, strip) for every row of full-resolution tiles, strip being the rows of the tiles."""
+        strips = self.tiff_strips()
+        if strips is not None:
+            yield from strips
+            return
+        image = None if self.native else read_image(self.filename)
+        if image is not None and image.isNull():
+            raise ValueError(f"cannot read {self.filename}")
+        _, rows = self.tile_count(0)
+        for tile_y in range(rows):
+            if image is None:
+                yield tile_y, self.read_strip(tile_y)
+            else:
+                rect = self.tile_rect(0, 0, tile_y)
+                yield tile_y, image.copy(0, rect.top(), self.width(), rect.height())
+
+    def tiff_strips(self):
+        """level0_strips assembled from the tiles or strips of a TIFF, or None if tifffile cannot read it.
+
+        Supports 8 and 16 bit grayscale, RGB and RGBA images stored contiguously, with a
+        compression tifffile can decode without further packages.
+        """
+        try:
+            import tifffile
+        except ImportError:
+            return None
+        try:
+            with tifffile.TiffFile(self.filename) as tiff:
+                page = tiff.pages[0]
+                supported = (
+                    page.dtype in (np.uint8, np.uint16)
+                    and page.photometric in (tifffile.PHOTOMETRIC.MINISBLACK, tifffile.PHOTOMETRIC.RGB)
+                    and page.planarconfig == tifffile.PLANARCONFIG.CONTIG
+                    and page.samplesperpixel in QIMAGE_FORMATS
+                    and (page.imagewidth, page.imagelength) == (self.width(), self.height())
+                )
+                # without imagecodecs, e.g. LZW and JPEG compressed TIFFs
+                tifffile.TIFF.DECOMPRESSORS[page.compression]
+                if page.predictor != 1:
+                    tifffile.TIFF.UNPREDICTORS[page.predictor]
+        except (tifffile.TiffFileError, KeyError, OSError):
+            return None
+        if not supported:
+            return None
+        return self.read_tiff_strips()
+
+    def read_tiff_strips(self):
+        import tifffile
+        width, height = self.width(), self.height()
+        strips = {}  # tile_y -> [rows of the tiles, pixels filled]
+        with tifffile.TiffFile(self.filename) as tiff:
+            page = tiff.pages[0]
+            for segment, (_, _, top, left, _), _ in page.segments():
+                # segments at the right and bottom border are padded to the full segment size
+                segment = segment[0, :height - top, :width - left]
+                if segment.dtype == np.uint16:
+                    segment = (segment >> 8).astype(np.uint8)
+                bottom = top + segment.shape[0]
+                for tile_y in range(top // TILE_SIZE, (bottom - 1) // TILE_SIZE + 1):
+                    rect = self.tile_rect(0, 0, tile_y)
+                    if tile_y not in strips:
+                        strips[tile_y] = [np.zeros((rect.height(), width, segment.shape[2]), np.uint8), 0]
+                    strip = strips[tile_y]
+                    y1, y2 = max(top, rect.top()), min(bottom, rect.top() + rect.height())
+                    strip[0][y1 - rect.top():y2 - rect.top(), left:left + segment.shape[1]] = segment[y1 - top:y2 - top]
+                    strip[1] += (y2 - y1) * segment.shape[1]
+                    if strip[1] == rect.height() * width:
+                        del strips[tile_y]
+                        yield tile_y, array_to_image(strip[0])
+        if len(strips) > 0:
+            raise ValueError(f"cannot read {self.filename}: missing segments")
+
+    def write_tile(self, level, tile_x, tile_y, image: QImage):
+        path = self.tile_path(level, tile_x, tile_y)
+        path.parent.mkdir(exist_ok=True, parents=True)
+        # low compression: tiles are written once per image but must decode fast
+        if not image.save(str(path), "PNG", 80):
+            raise IOError(f"cannot write {path}")
+        self.written += path.stat().st_size
+
+    def merge_tiles(self, level, tile_x, tile_y) -> QImage:
+        """Scale the up to 2 x 2 tiles of level - 1 covering a tile down to it."""
+        columns, rows = self.tile_count(level - 1)
+        merged = QImage(2 * TILE_SIZE, 2 * TILE_SIZE, QImage.Format.Format_RGB32)
+        merged.fill(Qt.GlobalColor.black)
+        painter = QPainter(merged)
+        width = height = 0
+        for dy in range(2):
+            for dx in range(2):
+                child_x, child_y = 2 * tile_x + dx, 2 * tile_y + dy
+                if child_x < columns and child_y < rows:
+                    child = self.read_tile(level - 1, child_x, child_y)
+                    painter.drawImage(dx * TILE_SIZE, dy * TILE_SIZE, child)
+                    width = max(width, dx * TILE_SIZE + child.width())
+                    height = max(height, dy * TILE_SIZE + child.height())
+        painter.end()
+        return merged.copy(0, 0, width, height).scaled(
+            self.tile_rect(level, tile_x, tile_y).size(),
+            Qt.AspectRatioMode.IgnoreAspectRatio,
+            Qt.TransformationMode.SmoothTransformation,
+        )
+
+    def read_strip(self, tile_y) -> QImage:
+        """Decode one row of full-resolution tiles, for readers supporting clipped reads."""
+        strip = QRect(0, tile_y * TILE_SIZE, self.width(), min(TILE_SIZE, self.height() - tile_y * TILE_SIZE))
+        reader = QImageReader(self.filename)
+        reader.setClipRect(strip)
+        image = reader.read()
+        if image.isNull():
+            raise ValueError(f"cannot read {self.filename}: {reader.errorString()}")
+        return image
+
+    def read_tile(self, level, tile_x, tile_y) -> QImage:
+        return QImage(str(self.tile_path(level, tile_x, tile_y)))
+
+    def tile(self, level, tile_x, tile_y) -> QImage:
+        key = (level, tile_x, tile_y)
+        image = self.tiles.get(key)
+        if image is not None:
+            self.tiles.move_to_end(key)
+            return image
+        image = self.read_tile(level, tile_x, tile_y)
+        self.tiles[key] = image
+        self.tile_bytes += image.sizeInBytes()
+        while self.tile_bytes > self.max_bytes and len(self.tiles) > 1:
+            _, evicted = self.tiles.popitem(last=False)
+            self.tile_bytes -= evicted.sizeInBytes()
+        return image
+
+    def render(self, region, size: QSize, transformation=Qt.TransformationMode.SmoothTransformation) -> QImage:
+        """The [x, y, w, h] region of the image scaled to size, decoding only the tiles it covers."""
+        level = level_for(self.width(), self.height(), region, size)
+        level_size = self.level_size(level)
+        left = int(round(level_size.width() * region[0]))
+        top = int(round(level_size.height() * region[1]))
+        width = max(int(round(level_size.width() * region[2])), 1)
+        height = max(int(round(level_size.height() * region[3])), 1)
+        image = QImage(width, height, QImage.Format.Format_RGB32)
+        image.fill(Qt.GlobalColor.black)
+        painter = QPainter(image)
+        columns, rows = self.tile_count(level)
+        for tile_y in range(top // TILE_SIZE, min((top + height - 1) // TILE_SIZE + 1, rows)):
+            for tile_x in range(left // TILE_SIZE, min((left + width - 1) // TILE_SIZE + 1, columns)):
+                painter.drawImage(tile_x * TILE_SIZE - left, tile_y * TILE_SIZE - top, self.tile(level, tile_x, tile_y))
+        painter.end()
+        return image.scaled(size, Qt.AspectRatioMode.IgnoreAspectRatio, transformation)
@@ -0,0 +1,101 @@
+import json
+import os
+
+JOURNAL_NAME = ".run_provider_all.journal"
+FSYNC_INTERVAL = 32  # frames
+
+
+class JobJournal(object):
+    """Append-only record of the frames a provider run has completed.
+
+    The first line holds the run signature (provider, parameters, annotation type and color);
+    each following line marks one finished frame. A torn last line after a crash is ignored,
+    and cut off when a resumed run appends to the journal.
+    """
+
+    def __init__(self, annotation_dir) -> None:
+        self.path = annotation_dir / JOURNAL_NAME
+        self.signature = None
+        self.completed = set()
+        self.file = None
+        self.pending = 0
+        self.valid_size = 0  # bytes of complete records
+        self.load()
+
+    @staticmethod
+    def make_signature(anno_provider, annotation_type, color, region=None):
+        signature = {
+            "provider": anno_provider.name,
+            "params": anno_provider.get_result_params(),
+            "type": annotation_type,
+            "color": list(color) if color is not None else None,
+        }
+        if region is not None:
+            signature["region"] = list(region)
+        return signature
+
+    def load(self):
+        if not self.path.exists():
+            return
+        with self.path.open("rb") as f:
+            for line_number, line in enumerate(f):
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                if line_number == 0:
+                    self.signature = record.get("signature")
+                else:
+                    self.completed.add(record["frame"])
+                self.valid_size += len(line)
+
+    def completed_for(self, signature):
+        """Frames completed by an earlier run with the same signature."""
+        if self.signature != signature:
+            return set()
+        return self.completed
+
+    def start(self, signature, resume):
+        """Open the journal for a new run; a fresh run or a changed signature discards the old records."""
+        if not resume or self.signature != signature:
+            self.completed = set()
+            self.signature = signature
+            self.file = self.path.open("w", encoding="utf-8")
+            self.file.write(json.dumps({"signature": signature}, ensure_ascii=False) + "\n")
+            self.sync()
+        else:
+            # cut off a torn last line, new records would be glued onto it
+            with self.path.open("r+b") as f:
+                f.truncate(self.valid_size)
+            self.file = self.path.open("a", encoding="utf-8")
+
+    def mark(self, frame):
+        self.completed.add(frame)
+        self.file.write(json.dumps({"frame": frame}) + "\n")
+        self.pending += 1
+        if self.pending >= FSYNC_INTERVAL:
+            self.sync()
+        else:
+            self.file.flush()
+
+    def sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.pending = 0
+
+    def close(self):
+        if self.file is not None:
+            self.sync()
+            self.file.close()
+            self.file = None
+
+
+def has_annotations(anno_file):
+    if not anno_file.exists():
+        return False
+    try:
+        return len(json.loads(anno_file.read_text(encoding='utf-8'))) > 0
+    except ValueError:
+        return False
@@ -0,0 +1,206 @@
+import heapq
+import itertools
+import os
+import threading
+import traceback
+
+from PySide6.QtCore import QObject, QThread, Signal
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+PRIORITY_NAMES = {PRIORITY_HIGH: "High", PRIORITY_NORMAL: "Normal", PRIORITY_LOW: "Low"}
+
+QUEUED = "Queued"
+RUNNING = "Running"
+PAUSED = "Paused"
+FINISHED = "Finished"
+CANCELLED = "Cancelled"
+FAILED = "Failed"
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job(QObject):
+    """A background task run by JobManager.
+
+    Subclasses override run() and call report(done, total) regularly. report raises JobCancelled
+    once the job is cancelled and blocks while it is paused, so cancel and pause take effect at
+    the next report. cost is the number of CPU slots the job occupies while running; jobs with
+    cost 0 start immediately. Jobs sharing an exclusive key never run at the same time, e.g.
+    two jobs writing the same files. finished is emitted on the GUI thread.
+    """
+
+    progress_changed = Signal(int, int)
+    state_changed = Signal(str)
+    finished = Signal()
+
+    def __init__(self, name, priority=PRIORITY_NORMAL, cost=1, exclusive=None) -> None:
+        super().__init__()
+        self.name = name
+        self.priority = priority
+        self.cost = cost
+        self.exclusive = exclusive
+        self.state = QUEUED
+        self.done = 0
+        self.total = 0
+        self.result = None
+        self.error = None
+        self.cancel_requested = False
+        self.resumed = threading.Event()
+        self.resumed.set()
+
+    def run(self):
+        raise NotImplementedError
+
+    def report(self, done, total):
+        self.done = done
+        self.total = total
+        self.progress_changed.emit(done, total)
+        self.check()
+
+    def check(self):
+        """Raise JobCancelled if cancelled, wait while paused."""
+        if self.cancel_requested:
+            raise JobCancelled()
+        if not self.resumed.is_set():
+            self.resumed.wait()
+            if self.cancel_requested:
+                raise JobCancelled()
+
+    def set_state(self, state):
+        self.state = state
+        self.state_changed.emit(state)
+
+    def cancel(self):
+        self.cancel_requested = True
+        self.resumed.set()
+
+    def pause(self):
+        if self.state == RUNNING:
+            self.resumed.clear()
+            self.set_state(PAUSED)
+
+    def resume(self):
+        if self.state == PAUSED:
+            self.set_state(RUNNING)
+            self.resumed.set()
+
+    def is_active(self):
+        return self.state in [QUEUED, RUNNING, PAUSED]
+
+    def execute(self):
+        try:
+            self.check()
+            self.result = self.run()
+        except JobCancelled:
+            self.set_state(CANCELLED)
+        except Exception as e:
+            traceback.print_exc()
+            self.error = f"{type(e).__name__}: {e}"
+            self.set_state(FAILED)
+        else:
+            self.set_state(FINISHED)
+
+
+class JobThread(QThread):
+    def __init__(self, job, parent: QObject | None = ...) -> None:
+        super().__init__(parent)
+        self.job = job
+
+    def run(self):
+        self.job.execute()
+
+
+class JobManager(QObject):
+    """Queue of background jobs, started by priority and then submission order.
+
+    Running jobs together occupy at most max_slots CPU slots; by default one core is left
+    for the annotator itself. A job costing more than max_slots still runs, but alone.
+    """
+
+    job_added = Signal(object)
+
+    def __init__(self, max_slots=None, parent: QObject | None = None) -> None:
+        super().__init__(parent)
+        self.max_slots = max_slots if max_slots is not None else max(1, (os.cpu_count() or 1) - 1)
+        self.queue = []
+        self.counter = itertools.count()
+        self.threads = {}
+        self.jobs = []
+
+    def submit(self, job: Job) -> Job:
+        heapq.heappush(self.queue, (job.priority, next(self.counter), job))
+        self.jobs.append(job)
+        self.job_added.emit(job)
+        self.schedule()
+        return job
+
+    def used_slots(self):
+        return sum(job.cost for job in self.threads)
+
+    def schedule(self):
+        held = set(job.exclusive for job in self.threads if job.exclusive is not None)
+        deferred = []
+        while len(self.queue) > 0:
+            entry = heapq.heappop(self.queue)
+            job = entry[2]
+            if job.cancel_requested:
+                job.set_state(CANCELLED)
+                job.finished.emit()
+                continue
+            if job.exclusive is not None and job.exclusive in held:
+                deferred.append(entry)
+                continue
+            used = self.used_slots()
+            if job.cost > 0 and used > 0 and used + job.cost > self.max_slots:
+                # keep the order: lower priority jobs must not overtake a job waiting for slots
+                deferred.append(entry)
+                break
+            self.start(job)
+            if job.exclusive is not None:
+                held.add(job.exclusive)
+        for entry in deferred:
+            heapq.heappush(self.queue, entry)
+
+    def start(self, job):
+        thread = JobThread(job, self)
+        thread.finished.connect(lambda: self.job_thread_finished(job))
+        self.threads[job] = thread
+        job.set_state(RUNNING)
+        thread.start()
+
+    def job_thread_finished(self, job):
+        self.threads.pop(job).deleteLater()
+        job.finished.emit()
+        self.schedule()
+
+    def cancel(self, job):
+        job.cancel()
+        if job.state == QUEUED:
+            self.queue = [entry for entry in self.queue if entry[2] is not job]
+            heapq.heapify(self.queue)
+            job.set_state(CANCELLED)
+            job.finished.emit()
+            self.schedule()
+
+    def set_priority(self, job, priority):
+        job.priority = priority
+        self.queue = [(queued.priority, order, queued) for _, order, queued in self.queue]
+        heapq.heapify(self.queue)
+        self.schedule()
+
+    def clear_inactive(self):
+        self.jobs = [job for job in self.jobs if job.is_active()]
+
+    def has_active(self):
+        return any(job.is_active() for job in self.jobs)
+
+    def shutdown(self):
+        """Cancel all jobs and wait for the running ones to stop."""
+        for job in self.jobs:
+            job.cancel()
+        for thread in list(self.threads.values()):
+            thread.wait()
@@ -0,0 +1,114 @@
+from PySide6.QtWidgets import (QAbstractItemView, QComboBox, QDockWidget, QHBoxLayout, QHeaderView, QProgressBar,
+                               QPushButton, QTableWidget, QTableWidgetItem, QVBoxLayout, QWidget)
+
+from job_manager import PAUSED, PRIORITY_NAMES, QUEUED, RUNNING, JobManager
+
+
+class JobsPanel(QDockWidget):
+    """Non-modal list of the jobs of a JobManager with pause, resume and cancel."""
+
+    COLUMNS = ["Job", "Priority", "Status", "Progress"]
+
+    def __init__(self, job_manager: JobManager, parent=None):
+        super().__init__("Jobs", parent)
+        self.setObjectName("jobs_panel")
+        self.job_manager = job_manager
+        self.rows = []
+
+        self.table = QTableWidget(0, len(self.COLUMNS), self)
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        self.table.horizontalHeader().setSectionResizeMode(3, QHeaderView.ResizeMode.Stretch)
+        self.table.verticalHeader().setVisible(False)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.table.itemSelectionChanged.connect(self.update_buttons)
+
+        self.button_pause = QPushButton("Pause", self)
+        self.button_resume = QPushButton("Resume", self)
+        self.button_cancel = QPushButton("Cancel", self)
+        self.button_clear = QPushButton("Clear Finished", self)
+        self.button_pause.clicked.connect(lambda: self.selected_job().pause())
+        self.button_resume.clicked.connect(lambda: self.selected_job().resume())
+        self.button_cancel.clicked.connect(lambda: self.job_manager.cancel(self.selected_job()))
+        self.button_clear.clicked.connect(self.clear_finished)
+
+        buttons = QHBoxLayout()
+        for button in [self.button_pause, self.button_resume, self.button_cancel]:
+            buttons.addWidget(button)
+        buttons.addStretch()
+        buttons.addWidget(self.button_clear)
+
+        widget = QWidget(self)
+        layout = QVBoxLayout(widget)
+        layout.addWidget(self.table)
+        layout.addLayout(buttons)
+        self.setWidget(widget)
+
+        self.job_manager.job_added.connect(self.add_job)
+        self.update_buttons()
+
+    def add_job(self, job):
+        row = self.table.rowCount()
+        self.table.insertRow(row)
+        self.rows.append(job)
+        self.table.setItem(row, 0, QTableWidgetItem(job.name))
+        priority = QComboBox(self.table)
+        for value, name in PRIORITY_NAMES.items():
+            priority.addItem(name, value)
+        priority.setCurrentIndex(priority.findData(job.priority))
+        priority.currentIndexChanged.connect(lambda: self.job_manager.set_priority(job, priority.currentData()))
+        self.table.setCellWidget(row, 1, priority)
+        self.table.setItem(row, 2, QTableWidgetItem(job.state))
+        progress_bar = QProgressBar(self.table)
+        progress_bar.setRange(0, 0 if job.total == 0 else job.total)
+        self.table.setCellWidget(row, 3, progress_bar)
+        job.progress_changed.connect(lambda done, total: self.set_progress(job, done, total))
+        job.state_changed.connect(lambda state: self.set_state(job, state))
+        self.show()
+
+    def row_of(self, job):
+        return self.rows.index(job) if job in self.rows else None
+
+    def set_progress(self, job, done, total):
+        row = self.row_of(job)
+        if row is None:
+            return
+        progress_bar = self.table.cellWidget(row, 3)
+        progress_bar.setRange(0, total)
+        progress_bar.setValue(done)
+
+    def set_state(self, job, state):
+        row = self.row_of(job)
+        if row is None:
+            return
+        text = state if job.error is None else f"{state}: {job.error}"
+        self.table.item(row, 2).setText(text)
+        self.table.item(row, 2).setToolTip(text)
+        self.table.cellWidget(row, 1).setEnabled(state == QUEUED)
+        if not job.is_active():
+            progress_bar = self.table.cellWidget(row, 3)
+            if progress_bar.maximum() == 0:
+                progress_bar.setRange(0, 1)
+                progress_bar.setValue(1 if job.error is None else 0)
+        self.update_buttons()
+
+    def selected_job(self):
+        rows = self.table.selectionModel().selectedRows()
+        if len(rows) == 0:
+            return None
+        return self.rows[rows[0].row()]
+
+    def update_buttons(self):
+        job = self.selected_job()
+        self.button_pause.setEnabled(job is not None and job.state == RUNNING)
+        self.button_resume.setEnabled(job is not None and job.state == PAUSED)
+        self.button_cancel.setEnabled(job is not None and job.is_active())
+
+    def clear_finished(self):
+        for row in reversed(range(len(self.rows))):
+            if not self.rows[row].is_active():
+                self.table.removeRow(row)
+                del self.rows[row]
+        self.job_manager.clear_inactive()
+        self.update_buttons()
@@ -0,0 +1,25 @@
+import traceback
+
+from PySide6.QtCore import QObject, QThread
+
+
+class LoadProvider(QThread):
+    """Construct an annotation provider off the GUI thread.
+
+    factory is called without arguments and must not show dialogs, so the provider
+    settings have to be asked for beforehand. Check provider and error once finished is emitted.
+    """
+
+    def __init__(self, provider_name, factory, parent: QObject | None = ...) -> None:
+        super().__init__(parent)
+        self.provider_name = provider_name
+        self.factory = factory
+        self.provider = None
+        self.error = None
+
+    def run(self):
+        try:
+            self.provider = self.factory()
+        except Exception as e:
+            traceback.print_exc()
+            self.error = f"{type(e).__name__}: {e}"
@@ -0,0 +1,67 @@
+"""Rules for merging annotation lists, for example the outputs of several providers on one frame."""
+
+MERGE_RULES = ["concat", "nms", "max_score"]
+
+
+def box_of(annotation):
+    """Normalized (x1, y1, x2, y2) of an annotation, or None for annotations without an area."""
+    if annotation.get("type") not in ["rectangle", "text", "circle"]:
+        return None
+    x1, x2 = sorted([annotation["x"], annotation["x2"]])
+    y1, y2 = sorted([annotation["y"], annotation["y2"]])
+    return x1, y1, x2, y2
+
+
+def box_iou(a, b):
+    width = min(a[2], b[2]) - max(a[0], b[0])
+    height = min(a[3], b[3]) - max(a[1], b[1])
+    if width <= 0 or height <= 0:
+        return 0.0
+    intersection = width * height
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+def non_max_suppression(annotations, iou_threshold=0.5, class_aware=True):
+    """Drop annotations overlapping a higher scored one by more than iou_threshold.
+
+    Annotations without a "score" count as 1.0; with class_aware only annotations with the
+    same "label" (or, lacking one, the same "text") suppress each other. Annotations without
+    an area are always kept. The order of the kept annotations is preserved.
+    """
+    order = sorted(range(len(annotations)), key=lambda i: annotations[i].get("score", 1.0), reverse=True)
+    kept = []
+    keep = [True] * len(annotations)
+    for i in order:
+        box = box_of(annotations[i])
+        if box is None:
+            continue
+        for j, other_box in kept:
+            if class_aware and class_of(annotations[i]) != class_of(annotations[j]):
+                continue
+            if box_iou(box, other_box) > iou_threshold:
+                keep[i] = False
+                break
+        if keep[i]:
+            kept.append((i, box))
+    return [annotation for annotation, k in zip(annotations, keep) if k]
+
+
+def class_of(annotation):
+    return annotation.get("label", annotation.get("text"))
+
+
+def merge_annotations(outputs, rule="concat", iou_threshold=0.5):
+    """Merge several annotation lists of the same frame.
+
+    concat keeps everything, nms suppresses overlapping annotations of the same class and
+    max_score keeps only the highest scored of overlapping annotations regardless of class.
+    """
+    annotations = [annotation for output in outputs for annotation in output]
+    if rule == "concat":
+        return annotations
+    if rule == "nms":
+        return non_max_suppression(annotations, iou_threshold, class_aware=True)
+    if rule == "max_score":
+        return non_max_suppression(annotations, iou_threshold, class_aware=False)
+    raise ValueError(f"unknown merge rule {rule}, expected one of {', '.join(MERGE_RULES)}")
@@ -0,0 +1,87 @@
+from PySide6.QtWidgets import (QCheckBox, QComboBox, QDialog, QDialogButtonBox, QDoubleSpinBox,
+                               QFormLayout, QLineEdit, QMessageBox, QSpinBox)
+
+
+class ParameterDialog(QDialog):
+    """Form for the declared parameters of a provider."""
+
+    def __init__(self, title, parameters, values=None, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle(title)
+        self.setMinimumWidth(400)
+        self.parameters = parameters
+        self.widgets = {}
+        values = values or {}
+
+        layout = QFormLayout(self)
+        for parameter in parameters:
+            value = values.get(parameter.name, parameter.default)
+            if parameter.kind == "int":
+                widget = QSpinBox(self)
+                widget.setRange(
+                    parameter.minimum if parameter.minimum is not None else -2**31,
+                    parameter.maximum if parameter.maximum is not None else 2**31 - 1,
+                )
+                widget.setValue(value)
+            elif parameter.kind == "float":
+                widget = QDoubleSpinBox(self)
+                widget.setDecimals(4)
+                widget.setSingleStep(0.05)
+                widget.setRange(
+                    parameter.minimum if parameter.minimum is not None else -1e9,
+                    parameter.maximum if parameter.maximum is not None else 1e9,
+                )
+                widget.setValue(value)
+            elif parameter.kind == "bool":
+                widget = QCheckBox(self)
+                widget.setChecked(value)
+            elif parameter.kind == "choice":
+                widget = QComboBox(self)
+                for choice in parameter.choices:
+                    widget.addItem(str(choice), choice)
+                widget.setCurrentIndex(parameter.choices.index(value))
+            else:
+                widget = QLineEdit(self)
+                widget.setText(parameter.format(value))
+            if parameter.description:
+                widget.setToolTip(parameter.description)
+                if isinstance(widget, QLineEdit):
+                    widget.setPlaceholderText(parameter.description)
+            layout.addRow(parameter.label, widget)
+            self.widgets[parameter.name] = widget
+
+        buttons = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Cancel, self)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+        layout.addRow(buttons)
+
+    def values(self):
+        values = {}
+        for parameter in self.parameters:
+            widget = self.widgets[parameter.name]
+            if parameter.kind in ["int", "float"]:
+                value = parameter.validate(widget.value())
+            elif parameter.kind == "bool":
+                value = widget.isChecked()
+            elif parameter.kind == "choice":
+                value = widget.currentData()
+            else:
+                value = parameter.parse(widget.text())
+            values[parameter.name] = value
+        return values
+
+    def accept(self):
+        try:
+            self.values()
+        except ValueError as e:
+            QMessageBox.critical(self, "Error", str(e))
+            return
+        super().accept()
+
+    @staticmethod
+    def get_values(parent, title, parameters, values=None):
+        """Show the dialog; returns (values, ok) like the QInputDialog helpers."""
+        dialog = ParameterDialog(title, parameters, values, parent)
+        if dialog.exec() != QDialog.DialogCode.Accepted:
+            return None, False
+        return dialog.values(), True
@@ -0,0 +1,104 @@
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+from PySide6.QtGui import QImage
+
+DEFAULT_CACHE_DIR = Path.home() / ".cache" / "video_annotation" / "provider_results"
+DEFAULT_MAX_SIZE = 512 * 1024 * 1024  # bytes
+
+
+def hash_image(image: QImage) -> str:
+    """Hash the pixel content of an image, ignoring scanline padding."""
+    digest = hashlib.sha256()
+    digest.update(f"{image.width()}x{image.height()}:{image.format().name}".encode())
+    if image.width() > 0 and image.height() > 0:
+        row_bytes = image.width() * image.depth() // 8
+        pixels = np.frombuffer(image.constBits(), dtype=np.uint8, count=image.sizeInBytes())
+        pixels = pixels.reshape(image.height(), image.bytesPerLine())[:, :row_bytes]
+        digest.update(np.ascontiguousarray(pixels).data)
+    return digest.hexdigest()
+
+
+class ProviderCache(object):
+    """On-disk cache of provider results keyed by frame content and provider settings.
+
+    Entries are JSON files under cache_dir; once the total size exceeds max_size the
+    least recently used entries are removed.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_size=DEFAULT_MAX_SIZE) -> None:
+        self.cache_dir = Path(cache_dir)
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.cache_dir.mkdir(exist_ok=True, parents=True)
+        self.total_size = sum(path.stat().st_size for path in self.cache_dir.glob("*/*.json"))
+
+    @staticmethod
+    def make_key(image: QImage, provider_name, settings, annotation_type, color) -> str:
+        key = {
+            "frame": hash_image(image),
+            "provider": provider_name,
+            "settings": settings,
+            "type": annotation_type,
+            "color": list(color) if color is not None else None,
+        }
+        return hashlib.sha256(json.dumps(key, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    def path(self, key):
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            annotations = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return annotations
+
+    def put(self, key, annotations):
+        path = self.path(key)
+        path.parent.mkdir(exist_ok=True, parents=True)
+        data = json.dumps(annotations, ensure_ascii=False)
+        tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+        tmp_path.write_text(data, encoding="utf-8")
+        with self.lock:
+            old_size = path.stat().st_size if path.exists() else 0
+            tmp_path.replace(path)
+            self.total_size += path.stat().st_size - old_size
+            if self.total_size > self.max_size:
+                self.evict()
+
+    def evict(self):
+        entries = []
+        for path in self.cache_dir.glob("*/*.json"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        self.total_size = sum(entry[1] for entry in entries)
+        target = self.max_size * 0.9
+        for _, size, path in entries:
+            if self.total_size <= target:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            self.total_size -= size
+
+    def clear(self):
+        with self.lock:
+            for path in self.cache_dir.glob("*/*.json"):
+                path.unlink(missing_ok=True)
+            self.total_size = 0
+
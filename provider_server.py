@@ -0,0 +1,225 @@
+"""Long-lived local host for annotation providers.
+
+The server keeps loaded providers warm across annotator restarts and shares them
+between several annotator windows. Clients connect over a local socket and pass
+frames through shared memory, so only a small request header is serialized.
+
+Start it with ``python provider_server.py``; the annotator uses it automatically
+while it is running. Requests are pickled, so connections are authenticated with a secret
+only the user can read: VIDEO_ANNOTATION_PROVIDER_KEY, or a random key generated once in
+KEY_FILE.
+"""
+import argparse
+import json
+import os
+import secrets
+import threading
+from collections import OrderedDict
+from multiprocessing import AuthenticationError, resource_tracker, shared_memory
+from multiprocessing.connection import Client, Listener
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from anno_provider.base import Provider, create_provider, get_parameters
+
+DEFAULT_ADDRESS = ("127.0.0.1", 6389)
+MAX_PROVIDERS = 4  # loaded models, least recently used out
+KEY_FILE = Path.home() / ".config" / "video_annotation" / "provider_server.key"
+
+
+def get_address():
+    address = os.environ.get("VIDEO_ANNOTATION_PROVIDER_SERVER")
+    if not address:
+        return DEFAULT_ADDRESS
+    host, port = address.rsplit(":", 1)
+    return host, int(port)
+
+
+def get_authkey(key_file=KEY_FILE) -> bytes:
+    """The secret shared by the server and its clients, created readable by the user only on first use."""
+    key = os.environ.get("VIDEO_ANNOTATION_PROVIDER_KEY")
+    if key:
+        return key.encode()
+    key_file.parent.mkdir(exist_ok=True, parents=True)
+    try:
+        fd = os.open(key_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        return key_file.read_text(encoding="utf-8").strip().encode()
+    key = secrets.token_hex(32)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(key)
+    return key.encode()
+
+
+def attach_shared_memory(name):
+    shm = shared_memory.SharedMemory(name=name)
+    if os.name == "posix":
+        # the client owns the block; keep our resource tracker from unlinking it on exit
+        resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+
+class ProviderServer(object):
+    def __init__(self, address=None) -> None:
+        self.address = address or get_address()
+        self.providers = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get_provider(self, provider_name, params):
+        """A loaded provider and the lock to hold while using it.
+
+        Providers are shared by all requests with the same model parameters; the other
+        parameters are set per request.
+        """
+        parameters = get_parameters(provider_name)
+        if parameters is not None:
+            model_names = {parameter.name for parameter in parameters if parameter.model}
+            model_params = {name: value for name, value in params.items() if name in model_names}
+        else:
+            model_params = params
+        key = (provider_name, json.dumps(model_params, sort_keys=True, ensure_ascii=False))
+        with self.lock:
+            if key not in self.providers:
+                self.providers[key] = (threading.Lock(), threading.Event(), [None])
+                while len(self.providers) > MAX_PROVIDERS:
+                    # requests running on an evicted provider keep it until they finish
+                    evicted, _ = self.providers.popitem(last=False)
+                    print(f"unload provider {evicted[0]} with {evicted[1]}.")
+            self.providers.move_to_end(key)
+            provider_lock, loaded, holder = self.providers[key]
+        with provider_lock:
+            if not loaded.is_set():
+                print(f"load provider {provider_name} with {params}.")
+                holder[0] = create_provider(provider_name, **params)
+                loaded.set()
+        return provider_lock, holder[0]
+
+    def handle(self, conn):
+        attached = {}
+        try:
+            while True:
+                try:
+                    request = conn.recv()
+                except (EOFError, OSError):
+                    break
+                try:
+                    response = self.handle_request(request, attached)
+                except Exception as e:
+                    response = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+                conn.send(response)
+        finally:
+            for shm in attached.values():
+                shm.close()
+            conn.close()
+
+    def handle_request(self, request, attached):
+        cmd = request["cmd"]
+        if cmd == "ping":
+            return {"ok": True}
+        provider_lock, provider = self.get_provider(request["provider"], request["params"])
+        if cmd == "load":
+            with provider_lock:
+                provider.set_params(**request["params"])
+                return {"ok": True, "result_params": provider.get_result_params(), "cacheable": provider.cacheable}
+        elif cmd == "run":
+            name = request["shm"]
+            if name not in attached:
+                for shm in attached.values():
+                    shm.close()
+                attached.clear()
+                attached[name] = attach_shared_memory(name)
+            shape = request["shape"]
+            frame = np.ndarray(shape, dtype=np.uint8, buffer=attached[name].buf)
+            image = Image.fromarray(frame.copy(), "RGB")
+            with provider_lock:
+                provider.set_params(**request["params"])
+                annotations = provider.run(image, request["annotation_type"], request["color"])
+            return {"ok": True, "annotations": annotations}
+        raise ValueError(f"unknown command {cmd}")
+
+    def serve_forever(self):
+        with Listener(self.address, authkey=get_authkey()) as listener:
+            print(f"provider server listening on {self.address[0]}:{self.address[1]}.")
+            while True:
+                try:
+                    conn = listener.accept()
+                except (OSError, AuthenticationError) as e:
+                    print(f"reject connection: {e}")
+                    continue
+                threading.Thread(target=self.handle, args=(conn,), daemon=True).start()
+
+
+def connect(address=None):
+    """Connect to a running provider server, or return None if there is none."""
+    try:
+        return Client(address or get_address(), authkey=get_authkey())
+    except (OSError, AuthenticationError):
+        return None
+
+
+class RemoteProvider(Provider):
+    """Provider proxy that runs a provider hosted by the provider server.
+
+    It has the name, parameters and result parameters of the hosted provider, so its results
+    get the same cache keys and resume signatures as those of a provider created in process.
+    """
+
+    def __init__(self, conn, provider_name, params) -> None:
+        self.parameters = get_parameters(provider_name)
+        super().__init__(**params)
+        self.conn = conn
+        # as create_provider names providers
+        self.name = provider_name
+        self.shm = None
+        self.lock = threading.RLock()
+        response = self.request({"cmd": "load"})
+        self.result_params = response["result_params"]
+        self.cacheable = response["cacheable"]
+
+    def get_result_params(self) -> dict:
+        return dict(self.result_params)
+
+    def request(self, request):
+        request.update(provider=self.name, params=self.params)
+        with self.lock:
+            self.conn.send(request)
+            response = self.conn.recv()
+        if not response["ok"]:
+            raise RuntimeError(f"provider server: {response['error']}")
+        return response
+
+    def run(self, image: Image.Image, annotation_type, color):
+        frame = np.asarray(image.convert("RGB"))
+        with self.lock:
+            if self.shm is None or self.shm.size < frame.nbytes:
+                self.release()
+                self.shm = shared_memory.SharedMemory(create=True, size=frame.nbytes)
+            np.ndarray(frame.shape, dtype=np.uint8, buffer=self.shm.buf)[:] = frame
+            response = self.request({
+                "cmd": "run",
+                "shm": self.shm.name,
+                "shape": frame.shape,
+                "annotation_type": annotation_type,
+                "color": color,
+            })
+        return response["annotations"]
+
+    def release(self):
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+    def __del__(self):
+        self.release()
+        self.conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Host annotation providers for the annotation tool.")
+    parser.add_argument("--host", default=DEFAULT_ADDRESS[0])
+    parser.add_argument("--port", type=int, default=DEFAULT_ADDRESS[1])
+    args = parser.parse_args()
+    ProviderServer((args.host, args.port)).serve_forever()
@@ -0,0 +1,122 @@
+"""Regions of interest: crop provider input and map provider output back to the full frame.
+
+Regions use the [x, y, w, h] form of AnnoLabel.image_region, normalized to the frame size.
+"""
+from PySide6.QtCore import QRect
+from PySide6.QtGui import QImage
+
+from merge_annotations import non_max_suppression
+
+FULL_FRAME = [0, 0, 1, 1]
+
+
+def normalize_region(region):
+    """Clamp a region to the frame; returns None when it covers the whole frame or nothing."""
+    if region is None:
+        return None
+    x = min(max(region[0], 0.0), 1.0)
+    y = min(max(region[1], 0.0), 1.0)
+    w = min(region[0] + region[2], 1.0) - x
+    h = min(region[1] + region[3], 1.0) - y
+    if w <= 0 or h <= 0 or [x, y, w, h] == FULL_FRAME:
+        return None
+    return [x, y, w, h]
+
+
+def rectangle_region(annotation):
+    x, x2 = sorted([annotation["x"], annotation["x2"]])
+    y, y2 = sorted([annotation["y"], annotation["y2"]])
+    return normalize_region([x, y, x2 - x, y2 - y])
+
+
+def parse_region(text):
+    """Parse "x,y,w,h" in normalized coordinates, raising ValueError on bad input."""
+    parts = [float(part) for part in text.split(",")]
+    if len(parts) != 4 or parts[2] <= 0 or parts[3] <= 0:
+        raise ValueError(f"invalid region {text}, expected x,y,w,h")
+    return normalize_region(parts)
+
+
+def crop_region(image: QImage, region):
+    """Crop region out of image.
+
+    Returns the crop and the region actually cropped, snapped to whole pixels, which is the
+    region to map the results on the crop back with.
+    """
+    width, height = image.width(), image.height()
+    left = min(int(round(region[0] * width)), width - 1)
+    top = min(int(round(region[1] * height)), height - 1)
+    right = max(min(int(round((region[0] + region[2]) * width)), width), left + 1)
+    bottom = max(min(int(round((region[1] + region[3]) * height)), height), top + 1)
+    crop = image.copy(QRect(left, top, right - left, bottom - top))
+    return crop, [left / width, top / height, (right - left) / width, (bottom - top) / height]
+
+
+def map_to_frame(annotations, region):
+    """Map annotations normalized to region back to full-frame coordinates."""
+    mapped = []
+    for annotation in annotations:
+        annotation = dict(annotation)
+        for key in ["x", "x2"]:
+            if key in annotation:
+                annotation[key] = region[0] + annotation[key] * region[2]
+        for key in ["y", "y2"]:
+            if key in annotation:
+                annotation[key] = region[1] + annotation[key] * region[3]
+        # sizes are relative to the image height
+        for key in ["thickness", "font_size"]:
+            if key in annotation:
+                annotation[key] = annotation[key] * region[3]
+        mapped.append(annotation)
+    return mapped
+
+
+def tile_regions(width, height, tile_size, overlap):
+    """Cover a width x height frame with square tiles of tile_size pixels overlapping by the overlap fraction.
+
+    Tiles are shifted inwards at the right and bottom border, so all have the full size
+    unless the frame is smaller than a tile.
+    """
+    step = max(1, int(tile_size * (1 - overlap)))
+
+    def starts(length):
+        if length <= tile_size:
+            return [0]
+        positions = list(range(0, length - tile_size, step))
+        return positions + [length - tile_size]
+
+    tile_width, tile_height = min(tile_size, width), min(tile_size, height)
+    return [
+        [left / width, top / height, tile_width / width, tile_height / height]
+        for top in starts(height)
+        for left in starts(width)
+    ]
+
+
+def run_tiled(run_batch, images, tile_size, overlap, batch_size=1, iou_threshold=0.5):
+    """Run run_batch (a list of PIL images to a list of annotation lists) on overlapping tiles.
+
+    Every frame is given as a whole plus one crop per tile, so objects larger than a tile are
+    still found; all crops of all frames are batched together. The results are mapped back
+    to full-frame coordinates and overlapping duplicates removed with class-aware NMS.
+    """
+    crops = []
+    owners = []
+    for index, image in enumerate(images):
+        crops.append((image, FULL_FRAME))
+        owners.append(index)
+        width, height = image.size
+        if width <= tile_size and height <= tile_size:
+            continue
+        for region in tile_regions(width, height, tile_size, overlap):
+            left, top = round(region[0] * width), round(region[1] * height)
+            right, bottom = left + round(region[2] * width), top + round(region[3] * height)
+            crops.append((image.crop((left, top, right, bottom)), region))
+            owners.append(index)
+    results = [[] for _ in images]
+    for start in range(0, len(crops), batch_size):
+        chunk = crops[start:start + batch_size]
+        outputs = run_batch([crop for crop, _ in chunk])
+        for (_, region), owner, annotations in zip(chunk, owners[start:start + batch_size], outputs):
+            results[owner].extend(map_to_frame(annotations, region))
+    return [non_max_suppression(annotations, iou_threshold, class_aware=True) for annotations in results]
@@ -1,54 +1,79 @@
-import io
+from collections import deque
 
-from PIL import Image
-from PySide6.QtCore import QBuffer, QIODevice, QObject, QThread
-from PySide6.QtWidgets import QDialog, QProgressBar, QVBoxLayout
+from image_provider import qimage_to_pil
+from job_manager import PRIORITY_HIGH, Job
+from provider_cache import ProviderCache
+from roi import crop_region, map_to_frame
 
 
-class RunProviderProgressDialog(QDialog):
-    def __init__(self, parent=None):
-        super().__init__(parent)
-        self.setWindowTitle("Run Provider")
-        self.setMinimumSize(300, 100)
-        self.setMaximumSize(300, 100)
+def run_frame(image, anno_provider, annotation_type, color, cache: ProviderCache = None, region=None):
+    return next(run_frames([(None, image)], anno_provider, annotation_type, color, cache, region))[1]
 
-        self.progress_bar = QProgressBar(self)
-        self.progress_bar.setMinimum(0)
-        self.progress_bar.setMaximum(0)
-        self.progress_bar.setTextVisible(False)
 
-        layout = QVBoxLayout(self)
-        layout.addWidget(self.progress_bar)
+def run_frames(frames, anno_provider, annotation_type, color, cache: ProviderCache = None, region=None):
+    """Run a provider over (key, QImage) pairs, yielding (key, annotations) in input order.
 
-    def start_animation(self):
-        self.progress_bar.setMaximum(0)
-        self.progress_bar.setMinimum(0)
-        self.progress_bar.setFormat("Processing...")
-        self.progress_bar.setRange(0, 0)
+    Without a cache the frames are streamed through the provider; with one, frames are
+    looked up in groups of the provider batch size and only the misses are run.
+    With a region only that part of each frame is given to the provider, and the results
+    are mapped back to full-frame coordinates.
+    """
+    if region is not None:
+        # results come back in input order, so the snapped regions can be matched up first in first out
+        cropped_regions = deque()
 
-    def stop_animation(self):
-        self.close()
+        def crop_frames():
+            for key, image in frames:
+                crop, cropped_region = crop_region(image, region)
+                cropped_regions.append(cropped_region)
+                yield key, crop
 
+        for key, annotations in run_frames(crop_frames(), anno_provider, annotation_type, color, cache):
+            yield key, map_to_frame(annotations, cropped_regions.popleft())
+        return
+    if cache is None or not anno_provider.cacheable:
+        yield from anno_provider.run_stream(
+            ((key, qimage_to_pil(image)) for key, image in frames), annotation_type, color)
+        return
+    settings = anno_provider.get_result_params()
+    chunk = []
+    for frame in frames:
+        chunk.append(frame)
+        if len(chunk) >= anno_provider.batch_size:
+            yield from run_cached_chunk(chunk, anno_provider, settings, annotation_type, color, cache)
+            chunk = []
+    if len(chunk) > 0:
+        yield from run_cached_chunk(chunk, anno_provider, settings, annotation_type, color, cache)
 
-class RunProvider(QThread):
-    def __init__(self, image, provider, annotation_type, color, parent: QObject | None = ...) -> None:
-        super().__init__(parent)
+
+def run_cached_chunk(chunk, anno_provider, settings, annotation_type, color, cache: ProviderCache):
+    cache_keys = [ProviderCache.make_key(image, anno_provider.name, settings, annotation_type, color) for _, image in chunk]
+    results = [cache.get(cache_key) for cache_key in cache_keys]
+    missing = [i for i, annotations in enumerate(results) if annotations is None]
+    if len(missing) > 0:
+        outputs = anno_provider.run_locked_batch([qimage_to_pil(chunk[i][1]) for i in missing], annotation_type, color)
+        for i, annotations in zip(missing, outputs):
+            cache.put(cache_keys[i], annotations)
+            results[i] = annotations
+    for (key, _), annotations in zip(chunk, results):
+        yield key, annotations
+
+
+class RunProvider(Job):
+    """Run a provider on a single frame; the annotations are the job result."""
+
+    def __init__(self, image, provider, annotation_type, color, cache: ProviderCache = None, frame_index=None, region=None) -> None:
+        # interactive runs take no CPU slot and share the provider with batch jobs between their batches,
+        # so they are not held up behind batch jobs
+        name = f"Run {provider.name}" + (f" on frame {frame_index + 1}" if frame_index is not None else "")
+        super().__init__(name, priority=PRIORITY_HIGH, cost=0)
         self.image = image
         self.provider = provider
+        self.cache = cache
         self.annotation_type = annotation_type
         self.color = color
-        self.annotations = None
-        dialog = RunProviderProgressDialog(parent)
-        self.finished.connect(dialog.stop_animation)
-        self.start()
-        dialog.start_animation()
-        dialog.exec()
+        self.frame_index = frame_index
+        self.region = region
 
     def run(self):
-        buffer = QBuffer()
-        buffer.open(QIODevice.OpenModeFlag.ReadWrite)
-        self.image.save(buffer, "PNG")
-        pil_im = Image.open(io.BytesIO(buffer.data()))
-        annotations = self.provider.run(
-            pil_im, self.annotation_type, self.color)
-        self.annotations = annotations
+        return run_frame(self.image, self.provider, self.annotation_type, self.color, self.cache, self.region)
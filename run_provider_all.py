@@ -1,55 +1,173 @@
-import io
 import json
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
 
-from PIL import Image
-from PySide6.QtCore import QBuffer, QIODevice, QObject, QThread, Signal
-from PySide6.QtWidgets import QDialog, QProgressBar, QVBoxLayout
+from anno_provider.base import create_provider
+from image_provider import open_image_provider
+from job_journal import JobJournal, has_annotations
+from job_manager import Job
+from provider_cache import ProviderCache
+from run_provider import run_frames
 
+CHUNK_SIZE = 16
 
-class RunProviderAllProgressDialog(QDialog):
-    def __init__(self, max_num, parent=None):
-        super().__init__(parent)
-        self.setWindowTitle("Run Provider All")
-        self.setMinimumSize(300, 100)
-        self.setMaximumSize(300, 100)
 
-        self.progress_bar = QProgressBar(self)
-        self.progress_bar.setMinimum(0)
-        self.progress_bar.setMaximum(max_num)
+# state of a pool worker process, set up once by init_worker
+worker_state = {}
 
-        layout = QVBoxLayout(self)
-        layout.addWidget(self.progress_bar)
 
-    def set_progress(self, value):
-        self.progress_bar.setValue(value)
-        if value == self.progress_bar.maximum():
-            self.close()
+def init_worker(file_path, anno_provider_name, params, cache_dir, cache_size, num_threads):
+    # keep the workers from oversubscribing the cores with their own thread pools
+    for name in ["OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"]:
+        os.environ[name] = str(num_threads)
+    worker_state["image_provider"] = open_image_provider(Path(file_path))
+    worker_state["anno_provider"] = create_provider(anno_provider_name, **params)
+    worker_state["cache"] = ProviderCache(cache_dir, cache_size) if cache_dir is not None else None
 
 
-class RunProviderAll(QThread):
-    progress_updated = Signal(int)
+def iter_frames(image_provider, indices):
+    for i in indices:
+        image_provider.set_index(i)
+        yield i, image_provider.get_image()
 
-    def __init__(self, image_provider, anno_provider, annotation_dir, annotation_type, color, parent: QObject | None = ...) -> None:
-        super().__init__(parent)
+
+def run_chunk(indices, annotation_type, color, region):
+    return list(run_frames(
+        iter_frames(worker_state["image_provider"], indices),
+        worker_state["anno_provider"],
+        annotation_type,
+        color,
+        worker_state["cache"],
+        region,
+    ))
+
+
+def run_provider_all(image_provider, anno_provider, annotation_dir, annotation_type, color, start_index, end_index,
+                     cache: ProviderCache = None, workers=1, resume=False, skip_existing=False, region=None, progress=None):
+    """Run anno_provider over frames [start_index, end_index) and write one annotation file per frame.
+
+    With more than one worker the frames are sharded over worker processes, each with its own
+    provider and video handle; the provider is recreated in every worker from its name and
+    parameters. Results are written in frame order either way.
+
+    Finished frames are recorded in a JobJournal in annotation_dir. resume skips the frames an
+    interrupted run with the same provider settings already finished, and skip_existing leaves
+    frames that already have annotations untouched. progress is called as progress(done, total),
+    with skipped frames counted as done.
+
+    region restricts the provider input of every frame to a normalized [x, y, w, h] part of it.
+    """
+    journal = JobJournal(annotation_dir)
+    signature = JobJournal.make_signature(anno_provider, annotation_type, color, region)
+    completed = journal.completed_for(signature) if resume else set()
+    indices = []
+    for i in range(start_index, end_index):
+        if i in completed:
+            continue
+        if skip_existing and has_annotations(annotation_dir / f"{i:08d}.json"):
+            continue
+        indices.append(i)
+    total = end_index - start_index
+    skipped = total - len(indices)
+    if progress is not None and skipped > 0:
+        progress(skipped, total)
+    journal.start(signature, resume)
+    try:
+        if workers > 1:
+            chunks = [indices[start:start + CHUNK_SIZE] for start in range(0, len(indices), CHUNK_SIZE)]
+            initargs = (
+                str(image_provider.filename),
+                anno_provider.name,
+                anno_provider.get_params(),
+                cache.cache_dir if cache is not None else None,
+                cache.max_size if cache is not None else None,
+                max(1, (os.cpu_count() or 1) // workers),
+            )
+            executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=init_worker,
+                initargs=initargs,
+            )
+            with executor:
+                results = run_chunks(executor, chunks, annotation_type, color, region, workers * 2)
+                try:
+                    write_results(results, annotation_dir, journal, skipped, total, progress)
+                finally:
+                    # cancel the chunks in flight before the executor waits for them
+                    results.close()
+        else:
+            frames = iter_frames(image_provider, indices)
+            results = run_frames(frames, anno_provider, annotation_type, color, cache, region)
+            write_results(results, annotation_dir, journal, skipped, total, progress)
+    finally:
+        journal.close()
+
+
+def run_chunks(executor, chunks, annotation_type, color, region, window):
+    """Yield the results of chunks in order, keeping at most window chunks submitted.
+
+    Submitting lazily lets a paused or cancelled consumer stop the workers after the
+    chunks in flight instead of after the whole range.
+    """
+    futures = deque()
+    chunks = iter(chunks)
+    try:
+        for chunk in chunks:
+            futures.append(executor.submit(run_chunk, chunk, annotation_type, color, region))
+            if len(futures) >= window:
+                yield from futures.popleft().result()
+        while len(futures) > 0:
+            yield from futures.popleft().result()
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def write_results(results, annotation_dir, journal, done, total, progress=None):
+    for i, annotations in results:
+        anno_file = annotation_dir / f"{i:08d}.json"
+        anno_file.write_text(json.dumps(annotations, ensure_ascii=False, indent=4), encoding='utf-8')
+        journal.mark(i)
+        done += 1
+        if progress is not None:
+            progress(done, total)
+
+
+class RunProviderAll(Job):
+    def __init__(self, image_provider, anno_provider, annotation_dir, annotation_type, color, start_index, end_index,
+                 cache: ProviderCache = None, workers=1, resume=False, skip_existing=False, region=None) -> None:
+        # in process the provider is shared with single-frame runs, which take turns with it between batches
+        super().__init__(f"Run {anno_provider.name} on frames {start_index + 1}-{end_index}", cost=workers)
         self.image_provider = image_provider
         self.anno_provider = anno_provider
+        self.cache = cache
+        self.workers = workers
+        self.resume = resume
+        self.skip_existing = skip_existing
+        self.region = region
         self.annotation_dir = annotation_dir
         self.annotation_type = annotation_type
         self.color = color
-        dialog = RunProviderAllProgressDialog(image_provider.get_total(), parent)
-        self.progress_updated.connect(dialog.set_progress)
-        self.start()
-        dialog.exec()
+        self.start_index = start_index
+        self.end_index = end_index
 
     def run(self):
-        for i in range(self.image_provider.get_index(), self.image_provider.get_total()):
-            self.image_provider.set_index(i)
-            image = self.image_provider.get_image()
-            buffer = QBuffer()
-            buffer.open(QIODevice.OpenModeFlag.ReadWrite)
-            image.save(buffer, "PNG")
-            pil_im = Image.open(io.BytesIO(buffer.data()))
-            annotations = self.anno_provider.run(pil_im, self.annotation_type, self.color)
-            anno_file = self.annotation_dir / f"{i:08d}.json"
-            anno_file.write_text(json.dumps(annotations, ensure_ascii=False, indent=4), encoding='utf-8')
-            self.progress_updated.emit(i + 1)
+        run_provider_all(
+            self.image_provider,
+            self.anno_provider,
+            self.annotation_dir,
+            self.annotation_type,
+            self.color,
+            self.start_index,
+            self.end_index,
+            cache=self.cache,
+            workers=self.workers,
+            resume=self.resume,
+            skip_existing=self.skip_existing,
+            region=self.region,
+            progress=self.report,
+        )
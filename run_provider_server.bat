@@ -0,0 +1,7 @@
+@echo off
+%~d0
+cd "%~dp0"
+set PYTHONPATH=%PYTHONPATH%;%~dp0
+call conda activate .\venv
+python provider_server.py
+pause
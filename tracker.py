@@ -0,0 +1,126 @@
+import json
+from copy import deepcopy
+
+import cv2
+import numpy as np
+from PySide6.QtGui import QImage
+
+from anno_label import with_ids
+
+TRACKERS = ["CSRT", "KCF", "ViT", "Copy"]
+
+
+class CopyTracker(object):
+    # same interface as cv2.Tracker; subclassing it crashes when the instance is freed
+    def __init__(self):
+        super().__init__()
+        self.box = None
+
+    def init(self, image, box):
+        self.box = deepcopy(box)
+
+    def update(self, image):
+        return True, self.box
+
+
+def create_tracker(tracker_name):
+    if tracker_name == 'CSRT':
+        param = cv2.TrackerCSRT.Params()
+        param.use_hog = True
+        param.use_color_names = True
+        return cv2.TrackerCSRT.create(param)
+    elif tracker_name == 'KCF':
+        return cv2.TrackerKCF.create()
+    elif tracker_name == 'ViT':
+        param = cv2.TrackerVit.Params()
+        return cv2.TrackerVit.create(param)
+    elif tracker_name == 'Copy':
+        return CopyTracker()
+    raise ValueError(f"unknown tracker {tracker_name}")
+
+
+def qimage_to_cv(img: QImage):
+    buffer_ = img.bits()
+    buffer_.cast('B').release()
+    channel = len(buffer_) // img.height() // img.width()
+    cv2_img = np.asarray(buffer_).reshape(img.height(), img.width(), channel)
+    if channel == 4:
+        return cv2.cvtColor(cv2_img, cv2.COLOR_RGBA2BGR)
+    elif channel == 3:
+        return cv2.cvtColor(cv2_img, cv2.COLOR_RGB2BGR)
+
+
+def ensure_ids(anno_file, annotations):
+    """Give annotations read from anno_file ids, saving them, so tracked copies keep the id of their source."""
+    annotations, added = with_ids(annotations)
+    if added:
+        anno_file.write_text(json.dumps(annotations, indent=4, ensure_ascii=False), encoding='utf-8')
+    return annotations
+
+
+def track_annotations(previous_image: QImage, current_image: QImage, previous_annotations, tracker_name):
+    """Predict the annotations of current_image by tracking previous_annotations from previous_image."""
+    cv_previous_image = qimage_to_cv(previous_image)
+    cv_current_image = qimage_to_cv(current_image)
+    current_annotations = []
+    for annotation in previous_annotations:
+        box = None
+        if annotation['type'] in ['rectangle']:
+            x1 = annotation['x'] * previous_image.width()
+            y1 = annotation['y'] * previous_image.height()
+            x2 = annotation['x2'] * previous_image.width()
+            y2 = annotation["y2"] * previous_image.height()
+            box = x1, y1, x2 - x1, y2 - y1
+        elif annotation['type'] in ['point']:
+            w = 30
+            h = 30
+            x = int(annotation['x2'] * previous_image.width()) - w // 2
+            y = int(annotation['y2'] * previous_image.height()) - h // 2
+            box = x, y, w, h
+        elif annotation['type'] in ['circle']:
+            x1 = annotation["x"] * previous_image.width()
+            y1 = annotation["y"] * previous_image.height()
+            x2 = annotation["x2"] * previous_image.width()
+            y2 = annotation["y2"] * previous_image.height()
+            box = x1, y1, x2 - x1, y2 - y1
+        if box is not None:
+            tracker = create_tracker(tracker_name)
+            tracker.init(cv_previous_image, box)
+            success, predit_box = tracker.update(cv_current_image)
+            x, y, w, h = predit_box
+            if success:
+                annotation = dict(annotation)
+                annotation['x'] = x / current_image.width()
+                annotation['y'] = y / current_image.height()
+                annotation['x2'] = (x + w) / current_image.width()
+                annotation['y2'] = (y + h) / current_image.height()
+                current_annotations.append(annotation)
+    return current_annotations
+
+
+def track_frames(image_provider, annotation_dir, tracker_name, start_index, end_index, progress=None):
+    """Fill frames without annotations by tracking from the previous frame, like the annotator does on navigation.
+
+    progress is called as progress(done, total) after each frame.
+    """
+    previous_image = None
+    previous_annotations = []
+    if start_index > 0:
+        anno_file = annotation_dir / f"{start_index - 1:08d}.json"
+        if anno_file.exists():
+            previous_annotations = json.loads(anno_file.read_text(encoding='utf-8'))
+        image_provider.set_index(start_index - 1)
+        previous_image = image_provider.get_image()
+    for i in range(start_index, end_index):
+        image_provider.set_index(i)
+        image = image_provider.get_image()
+        anno_file = annotation_dir / f"{i:08d}.json"
+        annotations = json.loads(anno_file.read_text(encoding='utf-8')) if anno_file.exists() else []
+        if len(annotations) == 0 and previous_image is not None and len(previous_annotations) > 0:
+            previous_annotations = ensure_ids(annotation_dir / f"{i - 1:08d}.json", previous_annotations)
+            annotations = track_annotations(previous_image, image, previous_annotations, tracker_name)
+            anno_file.write_text(json.dumps(annotations, indent=4, ensure_ascii=False), encoding='utf-8')
+        previous_image = image
+        previous_annotations = annotations
+        if progress is not None:
+            progress(i - start_index + 1, end_index - start_index)
@@ -1,154 +1,38 @@
-import io
 import json
+import os
 import sys
-from copy import deepcopy
 from pathlib import Path
 
-import cv2
-import numpy as np
-from PIL import Image
-from PySide6.QtCore import QBuffer, QIODevice, Qt
-from PySide6.QtGui import QImage, QKeyEvent, QColor
+from PySide6.QtCore import Qt
+from PySide6.QtGui import QCloseEvent, QKeyEvent, QColor
 from PySide6.QtWidgets import (QApplication, QColorDialog, QFileDialog, QInputDialog,
                                QMainWindow, QMessageBox)
 
+from anno_label import with_ids
+from annotation_store import AnnotationStore
+from anno_provider.base import LegacyProviderAdapter, Parameter, create_provider, get_parameters
+from build_tiles import BuildTiles
 from export import Export
+from image_provider import (ImageProvider, annotation_dir_for, image_suffix, open_image_provider, open_image_writer,
+                            parse_frame_range, video_suffix)
+from job_journal import JobJournal
+from job_manager import CANCELLED, FAILED, JobManager
+from jobs_panel import JobsPanel
+from load_provider import LoadProvider
+from parameter_dialog import ParameterDialog
+import provider_server
+from provider_cache import ProviderCache
+from provider_server import RemoteProvider
+from roi import normalize_region, rectangle_region
 from run_provider import RunProvider
 from run_provider_all import RunProviderAll
+from tracker import TRACKERS, track_annotations
 from video_annotation_ui import Ui_MainWindow
 from write_annotation_all import WriteAnnotationAll
 
-image_suffix = ['png', 'jpg', 'jpeg', 'bmp', 'tiff', 'tif', 'webp', 'ico', 'jpe', 'jp2', 'j2k', 'jpf', 'jpx', 'jpm', 'mj2', 'svg', 'svgz', 'eps', 'psd', 'ai', 'cdr', 'dxf', 'wmf', 'emf', 'tga', 'icns']
-video_suffix = ['mp4', 'avi', 'mkv', 'flv', 'gif', 'mov', 'wmv', 'rmvb', 'rm', 'asf', 'ts', 'mpeg', 'mpg', 'vob', 'webm', 'm4v', '3gp', '3g2', 'f4v', 'f4p', 'f4a', 'f4b', 'swf', 'm2ts', 'mts', 'm2v', 'm4v', 'm2p', 'm2t', 'm1v', 'm1a', 'm1v', 'm1']
-
-
-class ImageProvider(object):
-    def __init__(self, filename):
-        self.filename = filename
-        self.image = QImage(filename)
-
-    def set_index(self, index):
-        pass
-
-    def get_image(self):
-        return self.image
-
-    def get_index(self):
-        return 0
-
-    def get_total(self):
-        return 1
-
-
-class ImageWriter(object):
-    def __init__(self, filename):
-        self.filename = filename
-
-    def write(self, image: QImage):
-        image.save(self.filename)
-
-    def release(self):
-        pass
-
-
-class VideoProvider(object):
-    def __init__(self, filename):
-        self.filename = filename
-        self.video = cv2.VideoCapture(filename)
-        self.frame_count = int(round(self.video.get(cv2.CAP_PROP_FRAME_COUNT)))
-        self.frame_index = 0
-
-    def set_index(self, index):
-        self.frame_index = index
-        if self.frame_index < 0:
-            self.frame_index = 0
-        if self.frame_index >= self.frame_count:
-            self.frame_index = self.frame_count - 1
-
-    def get_image(self):
-        self.video.set(cv2.CAP_PROP_POS_FRAMES, self.frame_index)
-        ret, frame = self.video.read()
-        if not ret:
-            return None
-        self.video.set(cv2.CAP_PROP_POS_FRAMES, self.frame_index)
-        image = QImage(
-            frame.data, frame.shape[1], frame.shape[0], QImage.Format.Format_BGR888)
-        return image
-
-    def get_index(self):
-        return self.frame_index
-
-    def get_total(self):
-        return self.frame_count
-
-
-class VideoWriter(object):
-    def __init__(self, filename, src_filename) -> None:
-        self.filename = filename
-        src_video = cv2.VideoCapture(src_filename)
-        self.video = cv2.VideoWriter(filename, cv2.VideoWriter_fourcc(*'mp4v'), src_video.get(cv2.CAP_PROP_FPS), (int(
-            src_video.get(cv2.CAP_PROP_FRAME_WIDTH)), int(round(src_video.get(cv2.CAP_PROP_FRAME_HEIGHT)))))
-        src_video.release()
-
-    def write(self, image: QImage):
-        buffer = QBuffer()
-        buffer.open(QIODevice.OpenModeFlag.ReadWrite)
-        image.save(buffer, "PNG")
-        pil_im = Image.open(io.BytesIO(buffer.data()))
-        self.video.write(cv2.cvtColor(np.asarray(pil_im), cv2.COLOR_RGB2BGR))
-
-    def release(self):
-        self.video.release()
-
-
-class ImageFolderProvider(object):
-    def __init__(self, folder):
-        self.filename = folder
-        self.images = list(folder.glob('*'))
-        self.index = 0
-
-    def set_index(self, index):
-        self.index = index
-        if self.index < 0:
-            self.index = 0
-        if self.index >= len(self.images):
-            self.index = len(self.images) - 1
-
-    def get_image(self):
-        return QImage(str(self.images[self.index]))
-
-    def get_index(self):
-        return self.index
-
-    def get_total(self):
-        return len(self.images)
-
-
-class ImageFolderWriter(object):
-    def __init__(self, folder):
-        self.filename = folder
-        self.index = 0
-
-    def write(self, image: QImage):
-        dest_path = self.filename / f"{self.index:08d}.png"
-        dest_path.parent.mkdir(exist_ok=True, parents=True)
-        image.save(str(dest_path))
-        self.index += 1
-
-    def release(self):
-        pass
-
-
-class CopyTracker(cv2.Tracker):
-    def __init__(self):
-        super().__init__()
-        self.box = None
-
-    def init(self, image, box):
-        self.box = deepcopy(box)
-
-    def update(self, image):
-        return True, self.box
+# indices of combo_roi
+ROI_VISIBLE_REGION = 1
+ROI_LAST_RECTANGLE = 2
 
 
 class VideoAnnotationTool(QMainWindow):
@@ -161,9 +45,20 @@ class VideoAnnotationTool(QMainWindow):
 
         self.file_path = None
         self.annotation_dir = None
+        self.annotation_store = None
         self.image_provider = None
         self.anno_provider_name = None
         self.anno_provider = None
+        self.provider_cache = ProviderCache()
+        self.provider_loader = None
+        self.provider_loaders = set()
+        self.pending_provider_actions = []
+        self.provider_params = {}
+        self.job_manager = JobManager(parent=self)
+        self.jobs_panel = JobsPanel(self.job_manager, self)
+        self.addDockWidget(Qt.DockWidgetArea.BottomDockWidgetArea, self.jobs_panel)
+        self.jobs_panel.hide()
+        self.ui.menubar.addMenu('View').addAction(self.jobs_panel.toggleViewAction())
 
         self.ui.text_thickness.setText(f'{self.ui.label_anno.thickness * 100:.2f}')
         self.ui.text_label_font.setText(self.ui.label_anno.font_name)
@@ -188,10 +83,8 @@ class VideoAnnotationTool(QMainWindow):
 
         self.ui.combo_tracker_provider.clear()
         self.ui.combo_tracker_provider.addItem("")
-        self.ui.combo_tracker_provider.addItem("CSRT")
-        self.ui.combo_tracker_provider.addItem("KCF")
-        self.ui.combo_tracker_provider.addItem("ViT")
-        self.ui.combo_tracker_provider.addItem("Copy")
+        for tracker_name in TRACKERS:
+            self.ui.combo_tracker_provider.addItem(tracker_name)
         self.ui.combo_tracker_provider.setCurrentIndex(0)
 
         self.load_provider_list()
@@ -203,6 +96,7 @@ class VideoAnnotationTool(QMainWindow):
         self.ui.button_undo.clicked.connect(self.undo)
         self.ui.button_redo.clicked.connect(self.redo)
         self.ui.button_reload_provider.clicked.connect(self.load_provider_list)
+        self.ui.combo_anno_provider.currentIndexChanged.connect(self.select_provider)
         self.ui.button_run_provider.clicked.connect(self.run_provider)
         self.ui.button_run_provider_all.clicked.connect(self.run_provider_all)
         self.ui.button_export.clicked.connect(self.export)
@@ -217,7 +111,7 @@ class VideoAnnotationTool(QMainWindow):
         self.ui.text_current.returnPressed.connect(self.load_image)
         self.ui.text_current.editingFinished.connect(self.load_image)
         self.ui.combo_type.currentIndexChanged.connect(self.type_changed)
-        self.ui.label_anno.on_annotation_updated = self.save_annotation
+        self.ui.label_anno.on_annotation_changed = self.record_annotation_change
         self.ui.combo_label.currentIndexChanged.connect(self.change_label)
         self.ui.button_label_color.clicked.connect(self.change_label_color)
         self.ui.button_label_fill_color.clicked.connect(self.change_label_fill_color)
@@ -234,7 +128,7 @@ class VideoAnnotationTool(QMainWindow):
         self.anno_provider_name = None
         self.anno_provider = None
         for provider_path in (Path(".") / "anno_provider").iterdir():
-            if provider_path.is_file() and provider_path.suffix == '.py' and provider_path.stem != '__init__':
+            if provider_path.is_file() and provider_path.suffix == '.py' and provider_path.stem not in ['__init__', 'base']:
                 self.ui.combo_anno_provider.addItem(provider_path.stem)
             elif provider_path.is_dir() and (provider_path / '__init__.py').exists() and provider_path.name != '__pycache__':
                 self.ui.combo_anno_provider.addItem(provider_path.name)
@@ -244,34 +138,56 @@ class VideoAnnotationTool(QMainWindow):
         if self.file_path is None:
             QMessageBox.critical(self, 'Error', 'Please select a file')
             return
-        elif self.file_path.is_dir():
-            image_provider = ImageFolderProvider(self.file_path)
-            image_writer = ImageFolderWriter(
-                self.file_path.parent / f"{self.file_path.stem}_render")
-        elif self.file_path.suffix.split(".")[-1] in image_suffix:
-            image_provider = ImageProvider(str(self.file_path))
-            image_writer = ImageWriter(str(
-                self.file_path.parent / f"{self.file_path.stem}_render{self.file_path.suffix}"))
-        elif self.file_path.suffix.split('.')[-1] in video_suffix:
-            image_provider = VideoProvider(str(self.file_path))
-            image_writer = VideoWriter(str(
-                self.file_path.parent / f"{self.file_path.stem}_render{self.file_path.suffix}"), str(self.file_path))
-        else:
+        image_provider = open_image_provider(self.file_path)
+        image_writer = open_image_writer(self.file_path)
+        if image_provider is None or image_writer is None:
             QMessageBox.critical(self, 'Error', 'Unsupported file format')
             return
-        Export(
+        while True:
+            text, ok = QInputDialog.getText(self, "Export", f"Input export frame range start:end (e.g. 1:1000):", text=f"1:{image_provider.get_total()}")
+            if not ok:
+                image_writer.release()
+                return
+            try:
+                start_index, end_index = parse_frame_range(text, image_provider.get_total())
+            except ValueError:
+                QMessageBox.critical(self, "Error", "Invalid input")
+                continue
+            break
+        job = Export(
             image_provider,
             image_writer,
             self.annotation_dir,
+            start_index,
+            end_index,
             self.ui.label_anno.color,
             self.ui.label_anno.text_color,
             self.ui.label_anno.font_name,
             self.ui.label_anno.font_size,
             self.ui.label_anno.thickness,
-            parent=self,
         )
-        QMessageBox.information(self, 'Information',
-                                f'Export to {image_writer.filename} finished.')
+        self.submit_job(job, lambda: self.ui.statusbar.showMessage(f'Export to {image_writer.filename} finished', 5000))
+
+    def submit_job(self, job, on_finished=None):
+        """Queue a job on the job manager; on_finished runs on this thread if the job succeeds."""
+        if self.annotation_store is not None:
+            # jobs read and write the annotation files directly
+            self.annotation_store.compact()
+        def finished():
+            if job.state == FAILED:
+                QMessageBox.critical(self, 'Error', f'{job.name} failed\n{job.error}')
+            elif job.state == CANCELLED:
+                self.ui.statusbar.showMessage(f'{job.name} cancelled', 5000)
+            elif on_finished is not None:
+                on_finished()
+        job.finished.connect(finished)
+        self.job_manager.submit(job)
+        self.ui.statusbar.showMessage(f'{job.name} queued', 3000)
+
+    def reload_if_showing(self, annotation_dir):
+        """Reload the current frame after a job changed the annotations in annotation_dir."""
+        if self.image_provider is not None and self.annotation_dir == annotation_dir:
+            self.load_image()
 
     def change_color(self):
         color = QColorDialog.getColor(
@@ -358,49 +274,165 @@ class VideoAnnotationTool(QMainWindow):
         if len(self.ui.label_anno.annotation_list) == 0:
             return
         annotation = self.ui.label_anno.annotation_list.annotations[-1]
-        WriteAnnotationAll(self.image_provider, self.annotation_dir, annotation, self)
-        self.load_image()
-        QMessageBox.information(
-            self, 'Information', f'Write anotation to all frames finished')
+        annotation_dir = self.annotation_dir
+        job = WriteAnnotationAll(annotation_dir, annotation, self.image_provider.get_index() + 1, self.image_provider.get_total())
+        self.submit_job(job, lambda: self.reload_if_showing(annotation_dir))
 
-    def load_provider(self):
+    def select_provider(self):
+        """Start loading the selected provider in the background."""
+        provider_name = self.ui.combo_anno_provider.currentText()
+        self.anno_provider_name = None
+        self.anno_provider = None
+        self.provider_loader = None
+        self.pending_provider_actions = []
+        if provider_name == "":
+            self.ui.statusbar.clearMessage()
+            return
+        if get_parameters(provider_name) is None:
+            # legacy providers ask for their settings while loading, so they can only be loaded on this thread
+            return
+        self.start_provider_loading(provider_name)
+
+    def start_provider_loading(self, provider_name):
+        """Ask for the provider parameters and construct the provider on a LoadProvider thread."""
+        params, ok = ParameterDialog.get_values(
+            self, provider_name, get_parameters(provider_name), self.provider_params.get(provider_name))
+        if not ok:
+            return False
+        self.provider_params[provider_name] = params
+        conn = provider_server.connect()
+        if conn is not None:
+            # a provider server is running, reuse its warm model instead of loading one here
+            def factory():
+                return RemoteProvider(conn, provider_name, params)
+        else:
+            def factory():
+                return create_provider(provider_name, **params)
+        loader = LoadProvider(provider_name, factory, self)
+        loader.finished.connect(lambda: self.provider_loaded(loader))
+        self.provider_loader = loader
+        self.provider_loaders.add(loader)
+        self.ui.statusbar.showMessage(f'Loading provider {provider_name}...')
+        loader.start()
+        return True
+
+    def provider_loaded(self, loader):
+        self.provider_loaders.discard(loader)
+        if loader is not self.provider_loader:
+            return
+        self.provider_loader = None
+        actions = self.pending_provider_actions
+        self.pending_provider_actions = []
+        if loader.error is not None:
+            self.ui.statusbar.showMessage(f'Cannot load anno provider: {loader.provider_name}')
+            QMessageBox.critical(
+                self, 'Error', f'Cannot load anno provider: {loader.provider_name}\n{loader.error}')
+            return
+        self.anno_provider = loader.provider
+        self.anno_provider_name = loader.provider_name
+        self.ui.statusbar.showMessage(f'Provider {loader.provider_name} loaded', 5000)
+        for action in actions:
+            action()
+
+    def load_provider(self, action):
+        """Call action with the selected provider loaded, queuing it while the provider is still loading."""
         provider_name = self.ui.combo_anno_provider.currentText()
         if provider_name == "":
             QMessageBox.critical(
                 self, 'Error', 'Please select a anno provider')
-            return False
+            return
+        if self.provider_loader is not None:
+            self.pending_provider_actions.append(action)
+            self.ui.statusbar.showMessage(
+                f'Loading provider {provider_name}, {len(self.pending_provider_actions)} run(s) queued...')
+            return
         if self.anno_provider_name != provider_name or self.anno_provider is None:
-            get_provider = __import__(f"anno_provider.{provider_name}", fromlist=[
-                                      'get_provider']).get_provider
-            self.anno_provider = get_provider(self)
-        if self.anno_provider is None:
-            QMessageBox.critical(
-                self, 'Error', f'Cannot load anno provider: {self.anno_provider_name}')
-            return False
+            if get_parameters(provider_name) is not None:
+                if self.start_provider_loading(provider_name):
+                    self.pending_provider_actions.append(action)
+                return
+            self.anno_provider = create_provider(provider_name, self)
         self.anno_provider_name = provider_name
-        return True
+        action()
 
     def run_track(self):
         self.ui.label_anno.batch_add_annotation(self.predict_by_track())
 
     def run_provider(self):
-        if not self.load_provider():
+        self.load_provider(self.run_loaded_provider)
+
+    def provider_region(self):
+        """Region of the frame given to the provider as (ok, region); region is None for the full frame."""
+        if self.ui.combo_roi.currentIndex() == ROI_VISIBLE_REGION:
+            return True, normalize_region(self.ui.label_anno.image_region)
+        if self.ui.combo_roi.currentIndex() == ROI_LAST_RECTANGLE:
+            rectangles = [annotation for annotation in self.ui.label_anno.annotation_list.annotations
+                          if annotation["type"] == "rectangle"]
+            if len(rectangles) == 0:
+                QMessageBox.critical(self, 'Error', 'Please draw a rectangle to use as region')
+                return False, None
+            return True, rectangle_region(rectangles[-1])
+        return True, None
+
+    def run_loaded_provider(self):
+        ok, region = self.provider_region()
+        if not ok:
             return
-        provider = RunProvider(self.image_provider.get_image(
-        ), self.anno_provider, self.ui.combo_type.currentText(), self.ui.label_anno.color.getRgb()[:3], self)
-        if provider.annotations is not None:
-            self.ui.label_anno.batch_add_annotation(provider.annotations)
+        annotation_dir = self.annotation_dir
+        frame_index = self.image_provider.get_index()
+        job = RunProvider(self.image_provider.get_image(), self.anno_provider, self.ui.combo_type.currentText(),
+                          QColor(self.ui.label_anno.color).getRgb()[:3], self.provider_cache, frame_index, region)
+        self.submit_job(job, lambda: self.add_provider_result(annotation_dir, frame_index, job.result))
+
+    def add_provider_result(self, annotation_dir, frame_index, annotations):
+        if annotations is None:
+            return
+        if self.annotation_dir == annotation_dir and self.image_provider.get_index() == frame_index:
+            self.ui.label_anno.batch_add_annotation(annotations)
             self.ui.label_anno.update()
+            return
+        # the annotator moved on while the provider ran, add the results to the frame they belong to
+        if self.annotation_dir == annotation_dir:
+            self.annotation_store.extend(frame_index, annotations)
+            return
+        anno_file = annotation_dir / f"{frame_index:08d}.json"
+        if anno_file.exists():
+            annotations = json.loads(anno_file.read_text(encoding='utf-8')) + annotations
+        anno_file.write_text(json.dumps(annotations, indent=4, ensure_ascii=False), encoding='utf-8')
 
     def run_provider_all(self):
-        if not self.load_provider():
+        self.load_provider(self.run_loaded_provider_all)
+
+    def run_loaded_provider_all(self):
+        ok, region = self.provider_region()
+        if not ok:
             return
-        RunProviderAll(self.image_provider, self.anno_provider, self.annotation_dir,
-                       self.ui.combo_type.currentText(),
-                       self.ui.label_anno.color.getRgb()[:3], self)
-        self.load_image()
-        QMessageBox.information(
-            self, 'Information', f'Run provider {self.anno_provider_name} finished')
+        annotation_type = self.ui.combo_type.currentText()
+        color = QColor(self.ui.label_anno.color).getRgb()[:3]
+        signature = JobJournal.make_signature(self.anno_provider, annotation_type, color, region)
+        completed = JobJournal(self.annotation_dir).completed_for(signature)
+        remaining = set(range(self.image_provider.get_index(), self.image_provider.get_total())) - completed
+        parameters = [
+            Parameter("resume", "bool", len(completed) > 0 and len(remaining) > 0,
+                      label=f"Resume ({len(completed)} frames done earlier)",
+                      description="Skip frames an interrupted run with the same settings already processed."),
+            Parameter("skip_existing", "bool", False, label="Keep existing annotations",
+                      description="Leave frames that already have annotations untouched."),
+        ]
+        if not isinstance(self.anno_provider, LegacyProviderAdapter):
+            # worker processes recreate the provider from its parameters, which legacy providers do not declare
+            parameters.append(Parameter("workers", "int", 1, label="Worker processes",
+                                        description="1 runs inside the annotator.", minimum=1, maximum=os.cpu_count() or 1))
+        options, ok = ParameterDialog.get_values(self, 'Run Provider All', parameters)
+        if not ok:
+            return
+        annotation_dir = self.annotation_dir
+        # the job reads frames through its own provider, the annotator keeps seeking on this one
+        job = RunProviderAll(open_image_provider(self.file_path), self.anno_provider, annotation_dir,
+                             annotation_type, color, self.image_provider.get_index(), self.image_provider.get_total(),
+                             self.provider_cache, options.get("workers", 1), options["resume"], options["skip_existing"],
+                             region)
+        self.submit_job(job, lambda: self.reload_if_showing(annotation_dir))
 
     def type_changed(self):
         self.ui.label_anno.annotation_type = self.ui.combo_type.currentText()
@@ -451,133 +483,63 @@ class VideoAnnotationTool(QMainWindow):
         if not self.file_path.exists():
             QMessageBox.critical(self, 'Error', 'File not exists')
             return
-        if self.file_path.is_dir():
-            self.image_provider = ImageFolderProvider(self.file_path)
-        elif self.file_path.suffix.split(".")[-1] in image_suffix:
-            self.image_provider = ImageProvider(str(self.file_path))
-        elif self.file_path.suffix.split('.')[-1] in video_suffix:
-            self.image_provider = VideoProvider(str(self.file_path))
-        else:
+        image_provider = open_image_provider(self.file_path)
+        if image_provider is None:
             QMessageBox.critical(self, 'Error', 'Unsupported file format')
             return
-        self.annotation_dir = self.file_path.parent / \
-            f"{self.file_path.stem}_annotations"
+        self.image_provider = image_provider
+        self.annotation_dir = annotation_dir_for(self.file_path)
         self.annotation_dir.mkdir(exist_ok=True, parents=True)
+        if self.annotation_store is not None:
+            self.annotation_store.close()
+        self.annotation_store = AnnotationStore(self.annotation_dir)
         self.ui.text_file.setText(str(self.file_path.absolute()))
         self.ui.label_total.setText(f"/{self.image_provider.get_total()}")
         self.ui.text_current.setText(str(self.image_provider.get_index() + 1))
         self.ui.label_anno.setEnabled(True)
         self.load_image()
+        if (isinstance(self.image_provider, ImageProvider) and self.image_provider.tiled_image is not None
+                and not self.image_provider.tiled_image.is_built()):
+            annotation_dir = self.annotation_dir
+            self.submit_job(BuildTiles(self.image_provider.tiled_image), lambda: self.reload_if_showing(annotation_dir))
 
     def load_image(self):
         self.image_provider.set_index(int(self.ui.text_current.text()) - 1)
         self.ui.text_current.setText(str(self.image_provider.get_index() + 1))
-        self.ui.label_anno.set_image(self.image_provider.get_image())
+        self.ui.label_anno.set_image(self.image_provider.get_view_image())
         anno_file = self.annotation_dir / \
             f"{self.image_provider.get_index():08d}.json"
-        if anno_file.exists():
-            annotations = json.loads(anno_file.read_text(encoding='utf-8'))
-        else:
-            annotations = []
+        annotations = self.annotation_store.load(self.image_provider.get_index())
         if len(annotations) == 0:
             if self.ui.combo_tracker_provider.currentText() != 'None' and len(self.ui.combo_tracker_provider.currentText()) > 0:
-                annotations.extend(self.predict_by_track())
-        self.ui.label_anno.init_annotations(annotations)
+                annotations, _ = with_ids(self.predict_by_track())
+                self.annotation_store.extend(self.image_provider.get_index(), annotations)
+        self.ui.label_anno.init_annotations(annotations, key=anno_file)
 
     def clear_annotation(self):
         self.ui.label_anno.clear_annotations()
 
     def predict_by_track(self):
+        """The annotations of the previous frame tracked to the current one, not saved."""
         current_index = self.image_provider.get_index()
         if current_index == 0:
             return []
         previous_index = current_index - 1
-        anno_file = self.annotation_dir / f"{previous_index:08d}.json"
-        if not anno_file.exists():
-            return []
-        previous_annotations = json.loads(anno_file.read_text(encoding='utf-8'))
+        previous_annotations, added = with_ids(self.annotation_store.load(previous_index))
         if len(previous_annotations) == 0:
             return []
+        if added:
+            # tracked copies keep the id of their source
+            self.annotation_store.save(previous_index, previous_annotations)
         self.image_provider.set_index(previous_index)
         previous_image = self.image_provider.get_image()
         self.image_provider.set_index(current_index)
-        img = previous_image
-        buffer_ = img.bits()
-        buffer_.cast('B').release()
-        channel = len(buffer_) // img.height() // img.width()
-        cv2_img = np.asarray(buffer_).reshape(img.height(), img.width(), channel)
-        if channel == 4:
-            cv_previous_image = cv2.cvtColor(cv2_img, cv2.COLOR_RGBA2BGR)
-        elif channel == 3:
-            cv_previous_image = cv2.cvtColor(cv2_img, cv2.COLOR_RGB2BGR)
-        current_image: QImage = self.image_provider.get_image()
-        img = current_image
-        buffer_ = img.bits()
-        buffer_.cast("B").release()
-        channel = len(buffer_) // img.height() // img.width()
-        cv2_img = np.asarray(buffer_).reshape(img.height(), img.width(), channel)
-        if channel == 4:
-            cv_current_image = cv2.cvtColor(cv2_img, cv2.COLOR_RGBA2BGR)
-        elif channel == 3:
-            cv_current_image = cv2.cvtColor(cv2_img, cv2.COLOR_RGB2BGR)
-        current_annotations = []
-        for annotation in previous_annotations:
-            box = None
-            if annotation['type'] in ['rectangle']:
-                x1 = annotation['x'] * previous_image.width()
-                y1 = annotation['y'] * previous_image.height()
-                x2 = annotation['x2'] * previous_image.width()
-                y2 = annotation["y2"] * previous_image.height()
-                box = x1, y1, x2 - x1, y2 - y1
-            elif annotation['type'] in ['point']:
-                w = 30
-                h = 30
-                x = int(annotation['x2'] * previous_image.width()) - w // 2
-                y = int(annotation['y2'] * previous_image.height()) - h // 2
-                box = x, y, w, h
-            elif annotation['type'] in ['circle']:
-                x1 = annotation["x"] * previous_image.width()
-                y1 = annotation["y"] * previous_image.height()
-                x2 = annotation["x2"] * previous_image.width()
-                y2 = annotation["y2"] * previous_image.height()
-                box = x1, y1, x2 - x1, y2 - y1
-            if box is not None:
-                if self.ui.combo_tracker_provider.currentText() == 'CSRT':
-                    param = cv2.TrackerCSRT.Params()
-                    param.use_hog = True
-                    param.use_color_names = True
-                    tracker = cv2.TrackerCSRT.create(param)
-                    tracker.init(cv_previous_image, box)
-                    success, predit_box = tracker.update(cv_current_image)
-                elif self.ui.combo_tracker_provider.currentText() == 'KCF':
-                    tracker = cv2.TrackerKCF.create()
-                    tracker.init(cv_previous_image, box)
-                    success, predit_box = tracker.update(cv_current_image)
-                elif self.ui.combo_tracker_provider.currentText() == 'ViT':
-                    param = cv2.TrackerVit.Params()
-                    tracker = cv2.TrackerVit.create(param)
-                    tracker.init(cv_previous_image, box)
-                    success, predit_box = tracker.update(cv_current_image)
-                elif self.ui.combo_tracker_provider.currentText() == 'Copy':
-                    tracker = CopyTracker()
-                    tracker.init(cv_previous_image, box)
-                    success, predit_box = tracker.update(cv_current_image)
-                x, y, w, h = predit_box
-                if success:
-                    annotation = deepcopy(annotation)
-                    annotation['x'] = x / current_image.width()
-                    annotation['y'] = y / current_image.height()
-                    annotation['x2'] = (x + w) / current_image.width()
-                    annotation['y2'] = (y + h) / current_image.height()
-                    current_annotations.append(annotation)
-        self.save_annotation(current_annotations)
-        return current_annotations
-
-    def save_annotation(self, annotations):
-        anno_file = self.annotation_dir / \
-            f"{self.image_provider.get_index():08d}.json"
-        anno_file.write_text(json.dumps(
-            annotations, indent=4, ensure_ascii=False), encoding='utf-8')
+        current_image = self.image_provider.get_image()
+        return track_annotations(
+            previous_image, current_image, previous_annotations, self.ui.combo_tracker_provider.currentText())
+
+    def record_annotation_change(self, operation):
+        self.annotation_store.apply(self.image_provider.get_index(), operation)
 
     def keyReleaseEvent(self, event: QKeyEvent) -> None:
         if self.image_provider is not None:
@@ -591,6 +553,17 @@ class VideoAnnotationTool(QMainWindow):
                 self.redo()
         return super().keyReleaseEvent(event)
 
+    def closeEvent(self, event: QCloseEvent) -> None:
+        if self.job_manager.has_active():
+            answer = QMessageBox.question(self, 'Jobs running', 'Cancel the running jobs and quit?')
+            if answer != QMessageBox.StandardButton.Yes:
+                event.ignore()
+                return
+            self.job_manager.shutdown()
+        if self.annotation_store is not None:
+            self.annotation_store.close()
+        return super().closeEvent(event)
+
 
 if __name__ == '__main__':
     app = QApplication(sys.argv)
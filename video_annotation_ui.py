@@ -206,6 +206,14 @@ class Ui_MainWindow(object):
 
         self.horizontalLayout_5.addWidget(self.combo_anno_provider)
 
+        self.combo_roi = QComboBox(self.centralwidget)
+        self.combo_roi.addItem("")
+        self.combo_roi.addItem("")
+        self.combo_roi.addItem("")
+        self.combo_roi.setObjectName(u"combo_roi")
+
+        self.horizontalLayout_5.addWidget(self.combo_roi)
+
         self.button_run_provider = QPushButton(self.centralwidget)
         self.button_run_provider.setObjectName(u"button_run_provider")
 
@@ -382,6 +390,10 @@ class Ui_MainWindow(object):
         self.label_8.setText(QCoreApplication.translate("MainWindow", u"label font", None))
         self.label_7.setText(QCoreApplication.translate("MainWindow", u"label size", None))
         self.label_3.setText(QCoreApplication.translate("MainWindow", u"annotation provider", None))
+        self.combo_roi.setItemText(0, QCoreApplication.translate("MainWindow", u"full frame", None))
+        self.combo_roi.setItemText(1, QCoreApplication.translate("MainWindow", u"visible region", None))
+        self.combo_roi.setItemText(2, QCoreApplication.translate("MainWindow", u"last rectangle", None))
+
         self.button_run_provider.setText(QCoreApplication.translate("MainWindow", u"run provider", None))
         self.button_run_provider_all.setText(QCoreApplication.translate("MainWindow", u"run provider for all frames", None))
         self.button_reload_provider.setText(QCoreApplication.translate("MainWindow", u"reload provider list", None))